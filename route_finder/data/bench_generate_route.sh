@@ -0,0 +1,40 @@
+#!/bin/bash
+
+# Measures the throughput of concurrent generate_route() calls with pgbench.
+# The number of clients mirrors the gunicorn thread count: since generate_route() runs no DDL,
+# the transactions per second should grow with it until the database runs out of cores.
+# Usage: ./bench_generate_route.sh [duration in seconds] [client counts...]
+
+DB_NAME="tokyo_routing"
+DB_USER="postgres"
+DURATION="${1:-30}"
+shift $(( $# > 0 ? 1 : 0 ))
+CLIENTS="${@:-1 2 4 8}"
+
+SCRIPT_FILE=$(mktemp)
+trap 'rm -f "$SCRIPT_FILE"' EXIT
+
+# Random start and end points around the examples of README.md, so that the calls do not repeat.
+cat > "$SCRIPT_FILE" << EOF
+\set start_lat random(35770000, 35820000)
+\set start_lon random(139650000, 139730000)
+\set end_lat random(35770000, 35820000)
+\set end_lon random(139650000, 139730000)
+SELECT * FROM generate_route(
+  0.3, 0.2, 0.1, 0.1, 0.1, 0.1, 0.05, 0.05,
+  ARRAY['cafe', 'convenience'],
+  :start_lat / 1e6, :start_lon / 1e6, :end_lat / 1e6, :end_lon / 1e6
+);
+EOF
+
+for clients in $CLIENTS; do
+  output=$(pgbench -U "$DB_USER" -n -c "$clients" -j "$clients" -T "$DURATION" -f "$SCRIPT_FILE" "$DB_NAME" 2>&1)
+  tps=$(echo "$output" | grep -E "^tps" | head -n 1 | awk '{print $3}')
+  failed=$(echo "$output" | grep -E "^number of failed transactions" | awk '{print $5}')
+  if [ -z "$tps" ] || [ "${failed:-0}" != "0" ]; then
+    echo "pgbench failed with $clients clients"
+    echo "$output"
+    exit 1
+  fi
+  echo "clients=$clients tps=$tps"
+done
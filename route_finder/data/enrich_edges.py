@@ -0,0 +1,490 @@
+"""Adds the raster indices of all the setup_add_*.sh scripts to `ways` in one pass.
+
+Instead of importing each raster into PostGIS and clipping it per way, the way geometries are
+sampled against the GeoTIFFs directly: the index of a way is the mean of the distinct valid
+pixels it passes through, like `ST_SummaryStats(ST_Clip(...))`. Rasters are read window by window, one tile of pixels per task,
+in a process pool. The results are written with COPY and a single UPDATE of `ways`.
+
+Every run records the SHA-256 of each raster and the MD5 of each way geometry in a manifest. With
+--incremental, only the layers whose raster changed are recomputed for all ways, and only the ways
+whose geometry changed are recomputed for the other layers. The results are upserted in batches
+into a staging table, applied to the changed rows of `ways` in one transaction, and edge_features
+is rebuilt and swapped in by setup_edge_features.sh, so route queries are never blocked.
+
+Usage: python enrich_edges.py [--layers green_index water_index ...] [--workers N] [--incremental]
+Requires numpy, rasterio and psycopg2.
+"""
+import argparse
+import dataclasses
+import hashlib
+import io
+import json
+import math
+import os
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable
+
+import numpy as np
+import psycopg2
+import rasterio
+import rasterio.warp
+from affine import Affine
+from rasterio.enums import Resampling
+from rasterio.windows import Window
+
+DB_NAME = "tokyo_routing"
+DB_USER = "postgres"
+DATA_DIR = os.path.dirname(os.path.abspath(__file__))
+SATELLITE_DIR = os.path.join(DATA_DIR, "satellite")
+MANIFEST_PATH = os.path.join(DATA_DIR, "enrich_manifest.json")
+# Size [pixels] of the square tiles read by one task.
+TILE_SIZE = 1024
+STAGING_TABLE = "edge_index_values"
+# Persistent (unlogged) table the incremental mode upserts into, before applying it to `ways`.
+INDEX_STAGING_TABLE = "edge_indices_staging"
+# Rows per upsert transaction of the incremental mode.
+UPSERT_BATCH_SIZE = 10000
+
+
+@dataclasses.dataclass
+class Layer:
+    """An index column of `ways` computed from bands of a GeoTIFF, as in one setup_add_*.sh script."""
+
+    column: str
+    path: str
+    bands: tuple[int, ...]
+    # Maps the masked band arrays of a window and the global stats of the raster to index values.
+    compute: Callable[[list[np.ma.MaskedArray], dict[str, float]], np.ma.MaskedArray]
+    # Global statistics needed by compute(), from a windowed pass over the whole raster.
+    stats: Callable[[rasterio.io.DatasetReader], dict[str, float]] | None = None
+    # The raster is averaged over blocks of this many pixels per side first (gdal_translate -outsize 25%).
+    downsample: int = 1
+
+
+def _band_min_max(dataset: rasterio.io.DatasetReader, band: int) -> tuple[float, float]:
+    low: float = math.inf
+    high: float = -math.inf
+    for _, window in dataset.block_windows(band):
+        values: np.ma.MaskedArray = dataset.read(band, window=window, masked=True)
+        if values.count():
+            low = min(low, float(values.min()))
+            high = max(high, float(values.max()))
+    return low, high
+
+
+def _ndwi_stats(dataset: rasterio.io.DatasetReader) -> dict[str, float]:
+    low, high = _band_min_max(dataset, 1)
+    return {"min": low, "max": high}
+
+
+def _shade_stats(dataset: rasterio.io.DatasetReader) -> dict[str, float]:
+    return {"max_a": _band_min_max(dataset, 1)[1], "max_b": _band_min_max(dataset, 2)[1]}
+
+
+def _first_band(bands: list[np.ma.MaskedArray], stats: dict[str, float]) -> np.ma.MaskedArray:
+    return bands[0]
+
+
+def _ndwi(bands: list[np.ma.MaskedArray], stats: dict[str, float]) -> np.ma.MaskedArray:
+    # Scaled to [0, 1] like setup_add_ndwi.sh.
+    return (bands[0] - stats["min"]) / (stats["max"] - stats["min"])
+
+
+def _slope(bands: list[np.ma.MaskedArray], stats: dict[str, float]) -> np.ma.MaskedArray:
+    return np.ma.abs(bands[0])
+
+
+def _shade(bands: list[np.ma.MaskedArray], stats: dict[str, float]) -> np.ma.MaskedArray:
+    shade: np.ma.MaskedArray = 1 - (bands[0] + bands[1]) / (stats["max_a"] + stats["max_b"])
+    # setup_add_shadow.sh writes 0 as no data.
+    return np.ma.masked_equal(shade, 0)
+
+
+LAYERS: tuple[Layer, ...] = (
+    Layer(
+        column="green_index",
+        path=os.path.join(SATELLITE_DIR, "2018-12-14_54SUE_NDVI_3320.tif"),
+        bands=(1,),
+        compute=_first_band,
+    ),
+    Layer(
+        column="water_index",
+        path=os.path.join(SATELLITE_DIR, "2018-12-14_54SUE_NDWI_3320.tif"),
+        bands=(1,),
+        compute=_ndwi,
+        stats=_ndwi_stats,
+    ),
+    Layer(
+        column="shade_index",
+        path=os.path.join(SATELLITE_DIR, "2018-04-10_SAR_3320_RGB.tif"),
+        bands=(1, 2),
+        compute=_shade,
+        stats=_shade_stats,
+    ),
+    Layer(
+        column="slope_index",
+        path=os.path.join(SATELLITE_DIR, "slope.tif"),
+        bands=(1,),
+        compute=_slope,
+    ),
+    Layer(
+        column="isolation_index",
+        path=os.path.join(SATELLITE_DIR, "WSF2019_v1_138_34_clipped.tif"),
+        bands=(1,),
+        compute=_first_band,
+        downsample=4,
+    ),
+)
+
+
+def file_hash(path: str) -> str:
+    """SHA-256 of the content of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_geometry_hashes(connection) -> dict[int, str]:
+    """MD5 of the geometry of each way, computed by the database."""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT gid, md5(ST_AsBinary(the_geom)) FROM ways")
+        return dict(cursor.fetchall())
+
+
+def read_manifest(path: str) -> dict:
+    """The manifest of the last run, empty if there was none."""
+    if not os.path.exists(path):
+        return {"rasters": {}, "ways": {}}
+    with open(path) as file:
+        return json.load(file)
+
+
+def write_manifest(path: str, manifest: dict) -> None:
+    """Replace the manifest atomically, so an interrupted run leaves the previous one."""
+    with open(path + ".tmp", "w") as file:
+        json.dump(manifest, file)
+    os.replace(path + ".tmp", path)
+
+
+def load_ways(connection, gids: list[int] | None = None) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Return the gid of each way, the offsets of its points and the (lon, lat) points.
+
+    Only the ways in `gids` are loaded if it is given.
+    """
+    with connection.cursor() as cursor:
+        if gids is None:
+            cursor.execute("SELECT gid, ST_AsGeoJSON(the_geom) FROM ways ORDER BY gid")
+        else:
+            cursor.execute("SELECT gid, ST_AsGeoJSON(the_geom) FROM ways WHERE gid = ANY(%s) ORDER BY gid", (gids,))
+        rows: list[tuple[int, str]] = cursor.fetchall()
+
+    geometries: list[list[list[float]]] = [json.loads(row[1])["coordinates"] for row in rows]
+    gids: np.ndarray = np.array([row[0] for row in rows], dtype=np.int64)
+    offsets: np.ndarray = np.concatenate([[0], np.cumsum([len(coords) for coords in geometries])]).astype(np.int64)
+    points: np.ndarray = np.array(
+        [point[:2] for coords in geometries for point in coords], dtype=np.float64
+    ).reshape(-1, 2)
+    return gids, offsets, points
+
+
+def select_ways(offsets: np.ndarray, points: np.ndarray, indices: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """The offsets and points of the ways at `indices` only."""
+    lengths: np.ndarray = np.diff(offsets)[indices]
+    starts: np.ndarray = np.repeat(offsets[indices], lengths)
+    steps: np.ndarray = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64), points[starts + steps]
+
+
+def sample_pixels(
+    offsets: np.ndarray, points: np.ndarray, transform: Affine, width: int, height: int
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Distinct (way index, row, col) pixels under each way, points given in the CRS of the raster."""
+    # Pixel coordinates of the points, then segments between consecutive points of the same way.
+    cols, rows = ~transform * (points[:, 0], points[:, 1])
+    pixel_points: np.ndarray = np.column_stack([cols, rows])
+    way_of_point: np.ndarray = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    # Every point but the last one of its way starts a segment.
+    is_start: np.ndarray = np.ones(len(points), dtype=bool)
+    is_start[offsets[1:][np.diff(offsets) > 0] - 1] = False
+    starts: np.ndarray = np.flatnonzero(is_start)
+    begin: np.ndarray = pixel_points[starts]
+    end: np.ndarray = pixel_points[starts + 1]
+
+    # Split each segment where it crosses a pixel border. The midpoints of the pieces are then in
+    # each pixel the segment passes through.
+    crossings: list[tuple[np.ndarray, np.ndarray]] = [(np.arange(len(starts)), np.zeros(len(starts))),
+                                                      (np.arange(len(starts)), np.ones(len(starts)))]
+    for axis in (0, 1):
+        first_cell: np.ndarray = np.floor(begin[:, axis])
+        last_cell: np.ndarray = np.floor(end[:, axis])
+        counts: np.ndarray = np.abs(last_cell - first_cell).astype(np.int64)
+        segment: np.ndarray = np.repeat(np.arange(len(starts)), counts)
+        step: np.ndarray = np.arange(len(segment)) - np.repeat(np.cumsum(counts) - counts, counts)
+        ascending: np.ndarray = end[segment, axis] > begin[segment, axis]
+        border: np.ndarray = np.where(ascending, first_cell[segment] + step + 1, first_cell[segment] - step)
+        crossings.append((segment, (border - begin[segment, axis]) / (end[segment, axis] - begin[segment, axis])))
+    segment = np.concatenate([crossing[0] for crossing in crossings])
+    ratio: np.ndarray = np.concatenate([crossing[1] for crossing in crossings])
+    order: np.ndarray = np.lexsort((ratio, segment))
+    segment, ratio = segment[order], ratio[order]
+    piece: np.ndarray = np.flatnonzero(segment[1:] == segment[:-1])
+    segment = segment[piece]
+    middle: np.ndarray = (ratio[piece] + ratio[piece + 1]) / 2
+    samples: np.ndarray = begin[segment] + middle[:, None] * (end[segment] - begin[segment])
+
+    sample_cols: np.ndarray = np.floor(samples[:, 0]).astype(np.int64)
+    sample_rows: np.ndarray = np.floor(samples[:, 1]).astype(np.int64)
+    inside: np.ndarray = (sample_cols >= 0) & (sample_cols < width) & (sample_rows >= 0) & (sample_rows < height)
+    ways: np.ndarray = way_of_point[starts][segment][inside]
+    keys: np.ndarray = np.unique((ways * height + sample_rows[inside]) * width + sample_cols[inside])
+    return keys // (height * width), keys // width % height, keys % width
+
+
+def _read_tile(
+    layer: Layer, stats: dict[str, float], ways: np.ndarray, rows: np.ndarray, cols: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """Read the window covering the pixels and return the ways and values of the valid ones."""
+    row_offset, col_offset = int(rows.min()), int(cols.min())
+    height, width = int(rows.max()) - row_offset + 1, int(cols.max()) - col_offset + 1
+    scale: int = layer.downsample
+    window: Window = Window(col_offset * scale, row_offset * scale, width * scale, height * scale)
+    with rasterio.open(layer.path) as dataset:
+        bands: list[np.ma.MaskedArray] = [
+            dataset.read(
+                band,
+                window=window,
+                out_shape=(height, width),
+                resampling=Resampling.average,
+                masked=True,
+                boundless=True,
+            ).astype(np.float64)
+            for band in layer.bands
+        ]
+
+    values: np.ma.MaskedArray = np.ma.masked_invalid(layer.compute(bands, stats))[
+        rows - row_offset, cols - col_offset
+    ]
+    valid: np.ndarray = ~np.ma.getmaskarray(values)
+    return ways[valid], np.ma.getdata(values)[valid]
+
+
+def compute_layer(
+    layer: Layer, offsets: np.ndarray, points: np.ndarray, executor: ProcessPoolExecutor
+) -> np.ndarray:
+    """Mean index of each way, NaN for ways without any valid pixel."""
+    with rasterio.open(layer.path) as dataset:
+        stats: dict[str, float] = layer.stats(dataset) if layer.stats else {}
+        xs, ys = rasterio.warp.transform("EPSG:4326", dataset.crs, points[:, 0], points[:, 1])
+        transform: Affine = dataset.transform * Affine.scale(layer.downsample)
+        width: int = math.ceil(dataset.width / layer.downsample)
+        height: int = math.ceil(dataset.height / layer.downsample)
+
+    ways, rows, cols = sample_pixels(offsets, np.column_stack([xs, ys]), transform, width, height)
+    tiles: np.ndarray = (rows // TILE_SIZE) * math.ceil(width / TILE_SIZE) + cols // TILE_SIZE
+    order: np.ndarray = np.argsort(tiles, kind="stable")
+    bounds: np.ndarray = np.flatnonzero(np.diff(tiles[order])) + 1
+    futures = [
+        executor.submit(_read_tile, layer, stats, ways[part], rows[part], cols[part])
+        for part in np.split(order, bounds)
+        if len(part)
+    ]
+
+    num_ways: int = len(offsets) - 1
+    sums: np.ndarray = np.zeros(num_ways)
+    counts: np.ndarray = np.zeros(num_ways)
+    for future in futures:
+        tile_ways, values = future.result()
+        sums += np.bincount(tile_ways, weights=values, minlength=num_ways)
+        counts += np.bincount(tile_ways, minlength=num_ways)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(counts > 0, sums / counts, np.nan)
+
+
+def _copy_values(cursor, gids: np.ndarray, columns: list[str], values: np.ndarray) -> None:
+    """COPY the indices into a new temporary table, NaN as NULL."""
+    buffer: io.StringIO = io.StringIO()
+    for gid, row in zip(gids.tolist(), values.tolist()):
+        buffer.write("\t".join([str(gid)] + ["\\N" if math.isnan(v) else repr(v) for v in row]) + "\n")
+    buffer.seek(0)
+
+    cursor.execute(
+        f"CREATE TEMP TABLE {STAGING_TABLE} (gid INTEGER PRIMARY KEY, "
+        + ", ".join(f"{column} DOUBLE PRECISION" for column in columns)
+        + ") ON COMMIT DROP"
+    )
+    cursor.copy_expert(f"COPY {STAGING_TABLE} FROM STDIN", buffer)
+
+
+def _add_missing_columns(cursor, columns: list[str]) -> None:
+    # ALTER TABLE locks `ways` exclusively even with IF NOT EXISTS, so it only runs when needed.
+    cursor.execute(
+        "SELECT column_name FROM information_schema.columns WHERE table_name = 'ways' AND column_name = ANY(%s)",
+        (columns,),
+    )
+    existing: set[str] = {row[0] for row in cursor.fetchall()}
+    for column in columns:
+        if column not in existing:
+            cursor.execute(f"ALTER TABLE ways ADD COLUMN {column} DOUBLE PRECISION")
+
+
+def write_indices(connection, gids: np.ndarray, columns: list[str], values: np.ndarray) -> None:
+    """COPY the indices into a temporary table and update `ways` from it at once.
+
+    Ways without any valid pixel keep their current value, like the UPDATEs of the shell scripts.
+    """
+    with connection.cursor() as cursor:
+        _add_missing_columns(cursor, columns)
+        _copy_values(cursor, gids, columns, values)
+        cursor.execute(
+            "UPDATE ways w SET "
+            + ", ".join(f"{column} = COALESCE(v.{column}, w.{column})" for column in columns)
+            + f" FROM {STAGING_TABLE} v WHERE w.gid = v.gid"
+        )
+    connection.commit()
+
+
+def stage_indices(connection, gids: np.ndarray, columns: list[str], values: np.ndarray) -> None:
+    """Upsert the indices into the staging table in batches of UPSERT_BATCH_SIZE rows.
+
+    The staging table starts as a copy of the current indices of `ways`, so NaN (no valid pixel,
+    or not recomputed) keeps the current value. Nothing but the staging table is written.
+    """
+    with connection.cursor() as cursor:
+        _add_missing_columns(cursor, columns)
+        cursor.execute(f"DROP TABLE IF EXISTS {INDEX_STAGING_TABLE}")
+        cursor.execute(
+            f"CREATE UNLOGGED TABLE {INDEX_STAGING_TABLE} AS SELECT gid, {', '.join(columns)} FROM ways"
+        )
+        cursor.execute(f"ALTER TABLE {INDEX_STAGING_TABLE} ADD PRIMARY KEY (gid)")
+    connection.commit()
+
+    for start in range(0, len(gids), UPSERT_BATCH_SIZE):
+        batch: slice = slice(start, start + UPSERT_BATCH_SIZE)
+        with connection.cursor() as cursor:
+            _copy_values(cursor, gids[batch], columns, values[batch])
+            cursor.execute(
+                f"INSERT INTO {INDEX_STAGING_TABLE} AS s SELECT * FROM {STAGING_TABLE} "
+                "ON CONFLICT (gid) DO UPDATE SET "
+                + ", ".join(f"{column} = COALESCE(EXCLUDED.{column}, s.{column})" for column in columns)
+            )
+        connection.commit()
+
+
+def apply_staged_indices(connection, columns: list[str]) -> int:
+    """Copy the staged indices to the rows of `ways` where they differ, in one transaction.
+
+    Only row locks are taken, which do not block readers. Returns the number of updated ways.
+    """
+    current: str = ", ".join(f"w.{column}" for column in columns)
+    staged: str = ", ".join(f"s.{column}" for column in columns)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "UPDATE ways w SET "
+            + ", ".join(f"{column} = s.{column}" for column in columns)
+            + f" FROM {INDEX_STAGING_TABLE} s WHERE w.gid = s.gid AND ({current}) IS DISTINCT FROM ({staged})"
+        )
+        updated: int = cursor.rowcount
+        cursor.execute(f"DROP TABLE {INDEX_STAGING_TABLE}")
+    connection.commit()
+    return updated
+
+
+def _compute_all(
+    layers: list[Layer], offsets: np.ndarray, points: np.ndarray, workers: int
+) -> np.ndarray:
+    values: list[np.ndarray] = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for layer in layers:
+            print(f"Computing '{layer.column}' from {os.path.basename(layer.path)}...")
+            values.append(compute_layer(layer, offsets, points, executor))
+    return np.column_stack(values)
+
+
+def _compute_changed(
+    layers: list[Layer],
+    changed_layers: set[str],
+    gids: np.ndarray,
+    offsets: np.ndarray,
+    points: np.ndarray,
+    changed_gids: list[int],
+    workers: int,
+) -> np.ndarray:
+    """Indices of the changed layers for all the given ways and of the others for the changed ways.
+
+    Values that were not recomputed are NaN.
+    """
+    changed: np.ndarray = np.flatnonzero(np.isin(gids, changed_gids))
+    changed_offsets, changed_points = select_ways(offsets, points, changed)
+    values: np.ndarray = np.full((len(gids), len(layers)), np.nan)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for i, layer in enumerate(layers):
+            if layer.column in changed_layers:
+                print(f"Computing '{layer.column}' from {os.path.basename(layer.path)}...")
+                values[:, i] = compute_layer(layer, offsets, points, executor)
+            elif len(changed):
+                print(f"Computing '{layer.column}' of {len(changed)} changed ways...")
+                values[changed, i] = compute_layer(layer, changed_offsets, changed_points, executor)
+    return values
+
+
+def main() -> None:
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--layers", nargs="+", choices=[layer.column for layer in LAYERS],
+                        default=[layer.column for layer in LAYERS])
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--incremental", action="store_true",
+                        help="recompute only what changed since the manifest, then rebuild edge_features")
+    parser.add_argument("--manifest", default=MANIFEST_PATH)
+    args: argparse.Namespace = parser.parse_args()
+    layers: list[Layer] = [layer for layer in LAYERS if layer.column in args.layers]
+    columns: list[str] = [layer.column for layer in layers]
+
+    manifest: dict = read_manifest(args.manifest)
+    print("Hashing the rasters and the way geometries...")
+    raster_hashes: dict[str, str] = {layer.column: file_hash(layer.path) for layer in layers}
+
+    connection = psycopg2.connect(dbname=DB_NAME, user=DB_USER)
+    try:
+        geometry_hashes: dict[int, str] = load_geometry_hashes(connection)
+        if not args.incremental:
+            print("Loading the ways...")
+            gids, offsets, points = load_ways(connection)
+            values: np.ndarray = _compute_all(layers, offsets, points, args.workers)
+            print(f"Writing {len(layers)} indices of {len(gids)} ways...")
+            write_indices(connection, gids, columns, values)
+        else:
+            changed_layers: set[str] = {
+                column for column, digest in raster_hashes.items() if manifest["rasters"].get(column) != digest
+            }
+            changed_gids: list[int] = [
+                gid for gid, digest in geometry_hashes.items() if manifest["ways"].get(str(gid)) != digest
+            ]
+            if not changed_layers and not changed_gids:
+                print("Edge indices are up to date.")
+                return
+            print(f"Changed layers: {sorted(changed_layers) or 'none'}, changed ways: {len(changed_gids)}")
+
+            print("Loading the ways...")
+            gids, offsets, points = load_ways(connection, None if changed_layers else changed_gids)
+            values = _compute_changed(layers, changed_layers, gids, offsets, points, changed_gids, args.workers)
+            print(f"Staging {len(layers)} indices of {len(gids)} ways...")
+            stage_indices(connection, gids, columns, values)
+            print(f"Updated {apply_staged_indices(connection, columns)} ways.")
+            subprocess.run(["bash", os.path.join(DATA_DIR, "setup_edge_features.sh")], check=True)
+    finally:
+        connection.close()
+
+    manifest["rasters"].update(raster_hashes)
+    # The geometry hashes hold for all layers only if all of them were computed.
+    if len(layers) == len(LAYERS):
+        manifest["ways"] = {str(gid): digest for gid, digest in geometry_hashes.items()}
+    write_manifest(args.manifest, manifest)
+
+    print("Edge indices have been successfully added to the database.")
+
+
+if __name__ == "__main__":
+    main()
@@ -48,34 +48,9 @@ SELECT
     ST_Transform(way, 4326)
 FROM planet_osm_point
 WHERE tourism IS NOT NULL OR amenity IS NOT NULL OR historic IS NOT NULL OR shop IS NOT NULL;
-
--- Add the safety_index column to the ways table
-ALTER TABLE ways ADD COLUMN IF NOT EXISTS safety_index DOUBLE PRECISION;
-
--- Calculate safety_index based on tag_id and number of crossings
-WITH crossings AS (
-    SELECT
-        a.gid AS way_gid,
-        COUNT(b.gid) AS crossing_count
-    FROM ways a
-    JOIN ways b
-    ON ST_Intersects(a.the_geom, b.the_geom) -- Find intersections
-    AND NOT ST_Touches(a.the_geom, b.the_geom) -- Avoid shared boundaries
-    WHERE a.gid <> b.gid -- Exclude self-intersections
-    GROUP BY a.gid
-)
-UPDATE ways
-SET safety_index = (
-    COALESCE(tag_id, 0) * 10 -- Scale tag_id to prioritize higher values
-    / NULLIF(crossings.crossing_count, 1) -- Penalize based on crossings, avoid division by zero
-)
-FROM crossings
-WHERE ways.gid = crossings.way_gid;
-
--- Assign a default safety_index for ways with no crossings
-UPDATE ways
-SET safety_index = COALESCE(tag_id, 0) * 10
-WHERE safety_index IS NULL;
 EOF
 
+# safety_index from the number of crossing ways, counted with a spatial index.
+python setup_safety_index.py
+
 echo "Database setup complete!"
\ No newline at end of file
@@ -0,0 +1,92 @@
+#!/bin/bash
+
+# Builds the normalized edge-feature table used for routing.
+# Run this after all the setup_add_*.sh scripts, and again whenever an index in `ways` changes.
+
+DB_NAME="tokyo_routing"
+DB_USER="postgres"
+TABLE_NAME="edge_features"
+
+echo "Building the '$TABLE_NAME' table from the 'ways' table..."
+psql -U "$DB_USER" -d "$DB_NAME" -v ON_ERROR_STOP=1 << EOF || { echo "Building edge features failed"; exit 1; }
+BEGIN;
+
+DROP TABLE IF EXISTS ${TABLE_NAME}_new;
+
+-- One row per edge, already normalized to [0, 1] and inverted so that lower is better.
+CREATE TABLE ${TABLE_NAME}_new AS
+WITH raw_inverse_values AS (
+  SELECT
+    gid,
+    length,
+    shade_index,
+    slope_index,
+    safety_index,
+    -- Compute raw inverse values for green, water, and isolation
+    MAX(green_index + 0.01) OVER() - (green_index + 0.01) AS raw_inverse_green_index,
+    MAX(water_index + 0.01) OVER() - (water_index + 0.01) AS raw_inverse_water_index,
+    MAX(isolation_index) OVER() - isolation_index AS raw_inverse_isolation
+  FROM ways
+)
+SELECT
+  gid,
+  COALESCE(
+    (length - MIN(length) OVER()) / NULLIF((MAX(length) OVER() - MIN(length) OVER()), 0),
+    0
+  ) AS norm_length,
+  COALESCE(
+    (raw_inverse_green_index - MIN(raw_inverse_green_index) OVER()) /
+    NULLIF((MAX(raw_inverse_green_index) OVER() - MIN(raw_inverse_green_index) OVER()), 0),
+    0
+  ) AS inverse_green_index,
+  COALESCE(
+    (raw_inverse_water_index - MIN(raw_inverse_water_index) OVER()) /
+    NULLIF((MAX(raw_inverse_water_index) OVER() - MIN(raw_inverse_water_index) OVER()), 0),
+    0
+  ) AS inverse_water_index,
+  COALESCE(
+    (shade_index - MIN(shade_index) OVER()) /
+    NULLIF((MAX(shade_index) OVER() - MIN(shade_index) OVER()), 0),
+    0
+  ) AS norm_shade_index,
+  COALESCE(
+    (slope_index - MIN(slope_index) OVER()) /
+    NULLIF((MAX(slope_index) OVER() - MIN(slope_index) OVER()), 0),
+    0
+  ) AS norm_slope_index,
+  COALESCE(
+    (safety_index - MIN(safety_index) OVER()) /
+    NULLIF((MAX(safety_index) OVER() - MIN(safety_index) OVER()), 0),
+    0
+  ) AS norm_safety_index,
+  COALESCE(
+    (raw_inverse_isolation - MIN(raw_inverse_isolation) OVER()) /
+    NULLIF((MAX(raw_inverse_isolation) OVER() - MIN(raw_inverse_isolation) OVER()), 0),
+    0
+  ) AS inverse_isolation_index
+FROM raw_inverse_values;
+
+ALTER TABLE ${TABLE_NAME}_new ADD PRIMARY KEY (gid);
+
+DROP TABLE IF EXISTS ${TABLE_NAME};
+ALTER TABLE ${TABLE_NAME}_new RENAME TO ${TABLE_NAME};
+ALTER INDEX ${TABLE_NAME}_new_pkey RENAME TO ${TABLE_NAME}_pkey;
+
+-- The version is a content hash, so consumers can tell when the features changed.
+CREATE TABLE IF NOT EXISTS ${TABLE_NAME}_version (
+    version TEXT NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()
+);
+TRUNCATE ${TABLE_NAME}_version;
+INSERT INTO ${TABLE_NAME}_version (version)
+SELECT md5(string_agg(
+    concat_ws(',', gid, norm_length, inverse_green_index, inverse_water_index, norm_shade_index,
+              norm_slope_index, norm_safety_index, inverse_isolation_index),
+    ';' ORDER BY gid
+))
+FROM ${TABLE_NAME};
+
+COMMIT;
+EOF
+
+echo "Edge features have been successfully built."
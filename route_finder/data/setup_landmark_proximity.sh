@@ -0,0 +1,48 @@
+#!/bin/bash
+
+# Precomputes the number of landmarks of each type within 100 meters of each way.
+# Run this after setup_db.sh, and again whenever the ways or landmarks tables change.
+
+DB_NAME="tokyo_routing"
+DB_USER="postgres"
+TABLE_NAME="way_landmark_counts"
+RADIUS=100
+
+echo "Building the '$TABLE_NAME' table from the 'ways' and 'landmarks' tables..."
+psql -U "$DB_USER" -d "$DB_NAME" -v ON_ERROR_STOP=1 << EOF || { echo "Building landmark proximity failed"; exit 1; }
+BEGIN;
+
+-- Reproject both geometries once and index them, instead of per row and per request.
+CREATE TEMP TABLE way_geoms ON COMMIT DROP AS
+SELECT gid, ST_Transform(the_geom, 3857) AS geom FROM ways;
+CREATE INDEX ON way_geoms USING GIST (geom);
+
+CREATE TEMP TABLE landmark_geoms ON COMMIT DROP AS
+SELECT id, type, ST_Transform(geom, 3857) AS geom FROM landmarks WHERE type IS NOT NULL;
+CREATE INDEX ON landmark_geoms USING GIST (geom);
+
+DROP TABLE IF EXISTS ${TABLE_NAME}_new;
+
+-- Sparse (way, type) -> count table, ways without landmarks nearby have no rows.
+CREATE TABLE ${TABLE_NAME}_new AS
+SELECT
+    w.gid,
+    l.type,
+    COUNT(l.id) AS landmark_count
+FROM way_geoms w
+JOIN landmark_geoms l
+ON ST_DWithin(w.geom, l.geom, $RADIUS)
+GROUP BY w.gid, l.type;
+
+ALTER TABLE ${TABLE_NAME}_new ADD PRIMARY KEY (gid, type);
+CREATE INDEX ${TABLE_NAME}_new_type_idx ON ${TABLE_NAME}_new (type);
+
+DROP TABLE IF EXISTS ${TABLE_NAME};
+ALTER TABLE ${TABLE_NAME}_new RENAME TO ${TABLE_NAME};
+ALTER INDEX ${TABLE_NAME}_new_pkey RENAME TO ${TABLE_NAME}_pkey;
+ALTER INDEX ${TABLE_NAME}_new_type_idx RENAME TO ${TABLE_NAME}_type_idx;
+
+COMMIT;
+EOF
+
+echo "Landmark proximity has been successfully built."
@@ -0,0 +1,110 @@
+"""Adds safety_index to `ways` from the number of other ways each way crosses.
+
+A way crosses another one if they intersect without only touching, as in the former self-join of
+setup_db.sh: `ST_Intersects(a.the_geom, b.the_geom) AND NOT ST_Touches(a.the_geom, b.the_geom)`.
+Candidate pairs come from an STRtree of all the geometries instead of a nested loop, and the ways
+are split into spatial partitions which are counted in a process pool. The index is computed with
+the formula of setup_db.sh, `COALESCE(tag_id, 0) * 10 / NULLIF(crossings, 1)`, and written with
+COPY and a single UPDATE of `ways`.
+
+Usage: python setup_safety_index.py [--workers N]
+Requires numpy, shapely, rasterio and psycopg2.
+"""
+import argparse
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import psycopg2
+import shapely
+
+from enrich_edges import DB_NAME, DB_USER, write_indices
+
+# Partitions per worker, so that the workers stay busy when the partitions are uneven.
+PARTITIONS_PER_WORKER = 4
+
+# Set in each worker by _init_worker(), to build the tree once per process.
+_geometries: np.ndarray | None = None
+_tree: shapely.STRtree | None = None
+
+
+def load_ways(connection) -> tuple[np.ndarray, np.ndarray, list[bytes]]:
+    """Return the gid, tag_id (0 if NULL) and WKB geometry of each way."""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT gid, COALESCE(tag_id, 0), ST_AsBinary(the_geom) FROM ways ORDER BY gid")
+        rows: list[tuple[int, int, memoryview]] = cursor.fetchall()
+    gids: np.ndarray = np.array([row[0] for row in rows], dtype=np.int64)
+    tag_ids: np.ndarray = np.array([row[1] for row in rows], dtype=np.int64)
+    return gids, tag_ids, [bytes(row[2]) for row in rows]
+
+
+def _init_worker(wkbs: list[bytes]) -> None:
+    global _geometries, _tree
+    _geometries = shapely.from_wkb(wkbs)
+    _tree = shapely.STRtree(_geometries)
+
+
+def _count_crossings(indices: np.ndarray) -> np.ndarray:
+    """Number of other ways crossed by each way at `indices`."""
+    candidates, others = _tree.query(_geometries[indices], predicate="intersects")
+    ways: np.ndarray = indices[candidates]
+    crosses: np.ndarray = (ways != others) & ~shapely.touches(_geometries[ways], _geometries[others])
+    return np.bincount(candidates[crosses], minlength=len(indices))
+
+
+def spatial_partitions(wkbs: list[bytes], count: int) -> list[np.ndarray]:
+    """Split the ways into about `count` grid cells by the center of their bounding box."""
+    bounds: np.ndarray = shapely.bounds(shapely.from_wkb(wkbs))
+    centers: np.ndarray = (bounds[:, :2] + bounds[:, 2:]) / 2
+    side: int = max(1, math.ceil(math.sqrt(count)))
+    low: np.ndarray = centers.min(axis=0)
+    size: np.ndarray = np.maximum(centers.max(axis=0) - low, 1e-12)
+    cells: np.ndarray = np.minimum(((centers - low) / size * side).astype(np.int64), side - 1)
+    cell: np.ndarray = cells[:, 1] * side + cells[:, 0]
+    order: np.ndarray = np.argsort(cell, kind="stable")
+    bounds_of_cells: np.ndarray = np.flatnonzero(np.diff(cell[order])) + 1
+    return [part for part in np.split(order, bounds_of_cells) if len(part)]
+
+
+def count_crossings(wkbs: list[bytes], workers: int) -> np.ndarray:
+    """Number of other ways crossed by each way."""
+    crossings: np.ndarray = np.zeros(len(wkbs), dtype=np.int64)
+    partitions: list[np.ndarray] = spatial_partitions(wkbs, workers * PARTITIONS_PER_WORKER)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(wkbs,)) as executor:
+        for part, counts in zip(partitions, executor.map(_count_crossings, partitions)):
+            crossings[part] = counts
+    return crossings
+
+
+def safety_indices(tag_ids: np.ndarray, crossings: np.ndarray) -> np.ndarray:
+    """`COALESCE(tag_id, 0) * 10 / NULLIF(crossings, 1)`, or `tag_id * 10` if that is NULL or there is no crossing.
+
+    Both operands are integers in SQL, so the division truncates.
+    """
+    scaled: np.ndarray = tag_ids * 10
+    divided: np.ndarray = crossings >= 2
+    return np.where(divided, scaled // np.maximum(crossings, 1), scaled).astype(np.float64)
+
+
+def main() -> None:
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args: argparse.Namespace = parser.parse_args()
+
+    connection = psycopg2.connect(dbname=DB_NAME, user=DB_USER)
+    try:
+        print("Loading the ways...")
+        gids, tag_ids, wkbs = load_ways(connection)
+        print(f"Counting the crossings of {len(gids)} ways...")
+        crossings: np.ndarray = count_crossings(wkbs, args.workers)
+        print("Writing safety_index...")
+        write_indices(connection, gids, ["safety_index"], safety_indices(tag_ids, crossings)[:, None])
+    finally:
+        connection.close()
+
+    print("Safety indices have been successfully added to the database.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,76 @@
-# retry count
+import os
+
+from dotenv import load_dotenv
+
+
+# Settings below can be overridden by environment variables, so load .env first.
+load_dotenv()
+
+# max number of attempts of a call to the model or the database
 MAX_RETRY_COUNT = 10
 # weight of landmarks
 WEIGHT_LANDMARKS = 0.16
+# walking speed [m/s] used for the duration of routes
+WALKING_SPEED_MPS: float = float(os.getenv("WALKING_SPEED_MPS", "1.4"))
+# routing engine: "graph" searches the in-process graph, "db" calls generate_route() in the database.
+ROUTE_ENGINE: str = os.getenv("ROUTE_ENGINE", "graph")
+# max number of alternative routes of one search (the `k` query parameter)
+MAX_ALTERNATIVE_ROUTES: int = int(os.getenv("MAX_ALTERNATIVE_ROUTES", "5"))
+# cost increase of the edges of a found route when searching the next alternative, e.g. 0.5 adds 50%
+ALTERNATIVE_ROUTE_PENALTY: float = float(os.getenv("ALTERNATIVE_ROUTE_PENALTY", "0.5"))
+# max fraction of the length of an alternative route shared with another route
+ALTERNATIVE_ROUTE_MAX_OVERLAP: float = float(os.getenv("ALTERNATIVE_ROUTE_MAX_OVERLAP", "0.7"))
+# contraction hierarchy built by `python -m server.contraction <path>`, used by large batches, see HIERARCHY_MIN_BATCH_PAIRS
+CONTRACTION_HIERARCHY_PATH: str | None = os.getenv("CONTRACTION_HIERARCHY_PATH") or None
+# seconds between checks of the version of edge_features, the graph is reloaded when it changes
+GRAPH_VERSION_CHECK_SECONDS: float = float(os.getenv("GRAPH_VERSION_CHECK_SECONDS", "60"))
+# max number of route results kept in memory
+ROUTE_CACHE_MAX_SIZE: int = int(os.getenv("ROUTE_CACHE_MAX_SIZE", "4096"))
+# weights are rounded to multiples of this step before routing, so that near-identical weights share cached routes
+ROUTE_CACHE_WEIGHT_STEP: float = float(os.getenv("ROUTE_CACHE_WEIGHT_STEP", "0.01"))
+# number of processes searching the routes of batch requests
+BATCH_MAX_WORKERS: int = int(os.getenv("BATCH_MAX_WORKERS", "4"))
+# min number of pairs of a batch request searched with the contraction hierarchy, customized once for the batch
+HIERARCHY_MIN_BATCH_PAIRS: int = int(os.getenv("HIERARCHY_MIN_BATCH_PAIRS", "20"))
+# max number of (start, end) pairs of one batch request
+MAX_BATCH_PAIRS: int = int(os.getenv("MAX_BATCH_PAIRS", "10000"))
+# number of threads running pipeline stages concurrently, shared by all requests
+PIPELINE_MAX_WORKERS: int = int(os.getenv("PIPELINE_MAX_WORKERS", "16"))
+# deadline [seconds] of each concurrent stage of the search pipeline, measured from the start of the request
+STAGE_DEADLINES: dict[str, float] = {
+    "weights": float(os.getenv("STAGE_DEADLINE_WEIGHTS", "20")),
+    "landmarks": float(os.getenv("STAGE_DEADLINE_LANDMARKS", "20")),
+    "description": float(os.getenv("STAGE_DEADLINE_DESCRIPTION", "60")),
+    "explanation": float(os.getenv("STAGE_DEADLINE_EXPLANATION", "60")),
+}
+# confidence in [0, 1] of the local landmark matcher above which the model is not asked for landmarks,
+# below the 0.67 of a single keyword naming one type, see KeywordMatcher.match()
+LANDMARK_MATCH_MIN_CONFIDENCE: float = float(os.getenv("LANDMARK_MATCH_MIN_CONFIDENCE", "0.6"))
+# confidence in [0, 1] of the local weight estimator above which the model is not asked for weights,
+# below the 0.67 of a single keyword naming one factor, see KeywordMatcher.match()
+WEIGHT_ESTIMATE_MIN_CONFIDENCE: float = float(os.getenv("WEIGHT_ESTIMATE_MIN_CONFIDENCE", "0.6"))
+# max difference between 1 - WEIGHT_LANDMARKS and the sum of the weights of the model, which are then rescaled
+WEIGHT_SUM_TOLERANCE: float = float(os.getenv("WEIGHT_SUM_TOLERANCE", "0.05"))
+# max number of landmarks and named streets of a route described to the model for its explanation
+ROUTE_SUMMARY_MAX_LANDMARKS: int = int(os.getenv("ROUTE_SUMMARY_MAX_LANDMARKS", "10"))
+ROUTE_SUMMARY_MAX_STREETS: int = int(os.getenv("ROUTE_SUMMARY_MAX_STREETS", "8"))
+# max number of LLM results kept in memory
+LLM_CACHE_MAX_SIZE: int = int(os.getenv("LLM_CACHE_MAX_SIZE", "1024"))
+# lifetime [seconds] of cached LLM results
+LLM_CACHE_TTL_SECONDS: float = float(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 60 * 60)))
+# SQLite file keeping cached LLM results across restarts, disabled if empty
+LLM_CACHE_PATH: str | None = os.getenv("LLM_CACHE_PATH") or None
+# "record" appends the model and generate_route() calls to CASSETTE_PATH, "replay" serves them from it
+# with their recorded latencies instead of calling the model and the database (see tests/load_driver.py)
+CASSETTE_MODE: str = os.getenv("CASSETTE_MODE", "")
+CASSETTE_PATH: str = os.getenv("CASSETTE_PATH", "cassette.jsonl")
+# fraction of requests whose details (weights, explanations, response, timings) are logged
+LOG_SAMPLE_RATE: float = float(os.getenv("LOG_SAMPLE_RATE", "0.01"))
+# first and max delay [seconds] between retries, the delay doubles with each attempt
+RETRY_BASE_DELAY_SECONDS: float = float(os.getenv("RETRY_BASE_DELAY_SECONDS", "0.2"))
+RETRY_MAX_DELAY_SECONDS: float = float(os.getenv("RETRY_MAX_DELAY_SECONDS", "5"))
+# max number of retries of all the stages of one request
+RETRY_BUDGET_PER_REQUEST: int = int(os.getenv("RETRY_BUDGET_PER_REQUEST", "10"))
+# consecutive failures opening a circuit breaker, and seconds until a trial call is let through
+CIRCUIT_BREAKER_FAILURE_THRESHOLD: int = int(os.getenv("CIRCUIT_BREAKER_FAILURE_THRESHOLD", "5"))
+CIRCUIT_BREAKER_RESET_SECONDS: float = float(os.getenv("CIRCUIT_BREAKER_RESET_SECONDS", "30"))
@@ -187,3 +187,191 @@ LAMDMARKS_LIST: list[str] = [
     "fire_station",
     "attraction"
 ]
+
+# Keywords naming each landmark type, in Japanese and English, matched by server/landmark_matcher.py.
+# The type itself, with spaces for underscores, is also a keyword. Types not listed are only found by the model.
+LANDMARK_KEYWORDS: dict[str, list[str]] = {
+    "luggage_locker": ["コインロッカー", "ロッカー", "荷物預け", "locker"],
+    "toys": ["おもちゃ", "玩具", "toy"],
+    "hardware": ["金物", "工具"],
+    "crematorium": ["火葬場", "斎場"],
+    "vending_machine": ["自販機", "自動販売機", "vending"],
+    "tailor": ["仕立て", "テーラー"],
+    "museum": ["博物館", "美術館", "資料館", "記念館", "ミュージアム"],
+    "photo": ["写真館", "カメラ店", "camera"],
+    "social_facility": ["福祉施設", "介護施設"],
+    "childcare": ["保育", "託児", "子育て支援"],
+    "research_institute": ["研究所", "研究機関", "research"],
+    "houseware": ["生活雑貨", "日用品", "キッチン用品"],
+    "prep_school": ["塾", "予備校", "学習塾", "cram school"],
+    "parking": ["駐車場", "パーキング", "car park"],
+    "greengrocer": ["八百屋", "青果", "野菜", "果物", "vegetable", "fruit"],
+    "training": ["研修", "トレーニング"],
+    "outdoor": ["アウトドア", "登山用品", "キャンプ用品", "camping"],
+    "magic_and_illusion_supplies": ["手品", "マジック"],
+    "kiosk": ["キオスク", "売店", "スタンド"],
+    "shoes": ["靴屋", "シューズ", "スニーカー", "sneaker"],
+    "fast_food": ["ファストフード", "ファーストフード", "ハンバーガー", "牛丼", "burger"],
+    "townhall": ["市役所", "区役所", "町役場", "役所", "city hall"],
+    "school": ["学校", "小学校", "中学校", "高校"],
+    "clock": ["時計台", "大時計"],
+    "library": ["図書館", "図書室", "読書"],
+    "food": ["食料品", "食品", "グルメ", "食べ歩き", "gourmet"],
+    "dojo": ["道場", "武道", "柔道", "剣道", "空手", "martial arts"],
+    "travel_agency": ["旅行代理店", "旅行会社", "travel agent"],
+    "food_court": ["フードコート"],
+    "hobby": ["趣味", "ホビー", "模型", "プラモデル"],
+    "second_hand": ["古着", "中古", "リサイクルショップ", "古物", "thrift", "used"],
+    "wholesale": ["問屋", "卸売", "業務用"],
+    "stationery": ["文房具", "文具", "ステーショナリー"],
+    "smoking_area": ["喫煙所", "喫煙", "たばこを吸", "タバコを吸", "smoking"],
+    "language_school": ["英会話", "語学学校", "語学"],
+    "charging_station": ["充電スタンド", "充電ステーション", "ev charger"],
+    "apartment": ["マンション", "アパート"],
+    "police": ["交番", "警察", "派出所", "駐在所", "police box"],
+    "biergarten": ["ビアガーデン", "beer garden"],
+    "archaeological_site": ["遺跡", "史跡", "古墳", "貝塚", "ruins", "historic site"],
+    "beauty": ["美容", "エステ", "ネイル", "beauty salon", "nail"],
+    "tobacco": ["たばこ屋", "タバコ屋", "煙草"],
+    "restaurant": ["レストラン", "食事", "ランチ", "ディナー", "ご飯", "ごはん", "飲食店", "食堂", "和食", "洋食",
+                   "中華", "イタリアン", "フレンチ", "ラーメン", "寿司", "そば", "うどん", "lunch", "dinner"],
+    "kindergarten": ["幼稚園", "こども園"],
+    "shower": ["シャワー"],
+    "bar": ["バー", "居酒屋", "飲み屋", "お酒を飲", "一杯", "pub crawl"],
+    "coffee": ["コーヒー豆", "珈琲豆", "coffee beans"],
+    "shelter": ["避難所", "雨宿り", "東屋", "あずまや", "屋根"],
+    "wayside_shrine": ["祠", "地蔵", "お地蔵", "道祖神", "ほこら"],
+    "organic": ["オーガニック", "有機", "自然食品"],
+    "public_building": ["公共施設", "公民館"],
+    "car_rental": ["レンタカー", "rent a car"],
+    "viewpoint": ["展望", "眺望", "景色", "絶景", "見晴らし", "夜景", "眺め", "view", "scenery", "scenic", "vista"],
+    "community_centre": ["コミュニティセンター", "集会所", "地域センター", "区民センター", "community center"],
+    "bicycle_rental": ["レンタサイクル", "シェアサイクル", "貸し自転車", "bike rental", "bike share"],
+    "hospital": ["病院", "総合病院", "救急"],
+    "mall": ["ショッピングモール", "モール", "ショッピングセンター", "商業施設", "shopping center"],
+    "memorial": ["記念碑", "慰霊碑"],
+    "waste_basket": ["ゴミ箱", "ごみ箱", "くずかご", "trash", "garbage"],
+    "gas": ["ガス"],
+    "pub": ["パブ", "ビール", "beer"],
+    "kitchen": ["キッチン", "台所"],
+    "interior_decoration": ["インテリア", "内装", "interior"],
+    "fuel": ["ガソリンスタンド", "給油", "gas station"],
+    "atm": ["atm", "現金", "お金を下ろ", "お金をおろ", "キャッシュ"],
+    "college": ["大学", "キャンパス", "専門学校", "university", "campus"],
+    "video": ["レンタルビデオ", "dvd"],
+    "parcel_locker": ["宅配ロッカー", "宅配ボックス"],
+    "car_parts": ["カー用品", "自動車部品"],
+    "bakery": ["パン屋", "ベーカリー", "bread"],
+    "karaoke_box": ["カラオケ", "karaoke"],
+    "pet": ["ペットショップ", "ペット", "犬", "猫", "dog", "cat"],
+    "mobile_phone": ["携帯ショップ", "スマホ", "携帯電話", "smartphone"],
+    "toilets": ["トイレ", "お手洗い", "化粧室", "便所", "restroom", "toilet", "bathroom"],
+    "music": ["楽器", "レコード", "cd"],
+    "sports": ["スポーツ用品", "スポーツ", "運動"],
+    "collector": ["コレクション", "骨董市", "collectibles"],
+    "funeral_directors": ["葬儀", "葬儀社", "funeral"],
+    "car_sharing": ["カーシェア", "カーシェアリング"],
+    "medical_supply": ["医療用品", "介護用品"],
+    "pet_grooming": ["トリミング", "ペットサロン", "grooming"],
+    "tea": ["お茶", "日本茶", "紅茶", "緑茶", "茶葉", "抹茶"],
+    "confectionery": ["和菓子", "お菓子", "菓子", "駄菓子", "甘味", "sweets", "candy"],
+    "community_centre;theatre": ["市民会館", "文化会館"],
+    "books": ["本屋", "書店", "古本", "book"],
+    "nursing_home": ["老人ホーム", "介護施設"],
+    "rice": ["米屋", "お米"],
+    "monument": ["モニュメント", "記念塔", "銅像", "statue"],
+    "motorcycle": ["バイク", "オートバイ"],
+    "watches": ["腕時計", "時計屋", "時計店", "watch"],
+    "copyshop": ["コピー", "印刷", "copy", "print"],
+    "artwork": ["アート", "彫刻", "オブジェ", "パブリックアート", "壁画", "芸術", "art", "sculpture", "mural"],
+    "coworking_space": ["コワーキング", "作業", "仕事", "リモートワーク", "coworking", "work"],
+    "religion": ["宗教", "仏具"],
+    "bag": ["鞄", "かばん", "カバン", "バッグ"],
+    "massage": ["マッサージ", "整体", "指圧", "リラクゼーション", "整骨"],
+    "bbq": ["バーベキュー", "bbq", "barbecue"],
+    "drinking_water": ["水飲み", "給水", "飲み水", "水分補給", "water fountain"],
+    "pottery": ["陶器", "焼き物", "陶芸", "ceramics"],
+    "variety_store": ["100円ショップ", "百円ショップ", "100均", "雑貨", "ダイソー"],
+    "jewelry": ["宝石", "ジュエリー", "アクセサリー", "jewellery", "accessory"],
+    "laundry": ["コインランドリー", "洗濯", "laundromat"],
+    "hairdresser": ["美容院", "美容室", "床屋", "理容", "ヘアサロン", "散髪", "barber", "hair salon"],
+    "newsagent": ["新聞", "雑誌", "newspaper", "magazine"],
+    "supermarket": ["スーパー", "スーパーマーケット", "買い物", "食材", "grocery", "shopping"],
+    "veterinary": ["動物病院", "獣医", "vet"],
+    "clinic": ["クリニック", "診療所", "医院"],
+    "butcher": ["肉屋", "精肉", "お肉"],
+    "radiotechnics": ["電子部品", "無線"],
+    "love_hotel": ["ラブホテル"],
+    "marketplace": ["市場", "マルシェ", "朝市", "商店街", "market"],
+    "car_repair": ["自動車整備", "車検", "修理工場"],
+    "bicycle_parking": ["駐輪場", "自転車置き場", "bike parking"],
+    "chemist": ["ドラッグストア", "薬局", "drugstore"],
+    "hostel": ["ホステル", "ゲストハウス"],
+    "pawnbroker": ["質屋"],
+    "bus_station": ["バスターミナル", "バス停", "bus"],
+    "parking_entrance": ["駐車場入口"],
+    "guest_house": ["民宿", "旅館", "ゲストハウス", "inn"],
+    "dentist": ["歯医者", "歯科", "dental"],
+    "taxi": ["タクシー", "taxi", "cab"],
+    "storage_rental": ["トランクルーム", "レンタル倉庫", "storage"],
+    "cinema": ["映画館", "映画", "シネマ", "movie", "film"],
+    "recycling": ["リサイクル", "資源回収", "回収ボックス"],
+    "internet_cafe": ["ネットカフェ", "漫画喫茶", "マンガ喫茶", "ネカフェ", "manga cafe"],
+    "courthouse": ["裁判所", "court"],
+    "curtain": ["カーテン"],
+    "bed": ["寝具", "布団", "ベッド"],
+    "public_bath": ["銭湯", "温泉", "スーパー銭湯", "風呂", "サウナ", "sento", "onsen", "hot spring", "sauna"],
+    "deli": ["惣菜", "お惣菜", "デリ", "弁当", "お弁当", "テイクアウト", "delicatessen", "takeout"],
+    "nightclub": ["クラブ", "ナイトクラブ", "club"],
+    "pharmacy": ["調剤薬局", "薬局", "medicine"],
+    "telephone": ["公衆電話", "phone booth"],
+    "fountain": ["噴水", "水辺", "fountain"],
+    "theatre": ["劇場", "演劇", "芝居", "ホール", "舞台", "コンサート", "theater", "concert", "play"],
+    "social_facility;community_centre": ["福祉会館", "福祉センター"],
+    "hairdresser_supply": ["美容用品"],
+    "furniture": ["家具", "インテリアショップ"],
+    "information": ["案内所", "観光案内", "インフォメーション", "案内板", "地図", "tourist information", "map"],
+    "cosmetics": ["化粧品", "コスメ", "makeup"],
+    "gallery": ["ギャラリー", "画廊", "展示", "展覧会", "絵画", "exhibition", "painting"],
+    "doityourself": ["ホームセンター", "diy", "日曜大工"],
+    "car": ["自動車販売", "ディーラー", "car dealer"],
+    "motorcycle_parking": ["バイク駐車場", "バイク置き場"],
+    "milestone": ["道標", "一里塚", "里程標"],
+    "pastry": ["ケーキ", "洋菓子", "スイーツ", "パティスリー", "デザート", "cake", "dessert"],
+    "hotel": ["ホテル", "宿泊"],
+    "photo_booth": ["証明写真", "プリクラ", "photo booth"],
+    "cafe": ["カフェ", "喫茶", "喫茶店", "珈琲", "コーヒー", "休憩", "ひと休み", "一休み", "お茶する", "coffee", "break"],
+    "seafood": ["魚屋", "鮮魚", "海鮮", "fish"],
+    "florist": ["花屋", "生花", "花束", "フラワー", "flower"],
+    "electronics": ["家電", "電気屋", "家電量販店", "電器"],
+    "shoe_repair": ["靴修理", "合鍵"],
+    "antiques": ["骨董", "アンティーク", "古道具", "antique"],
+    "ice_cream": ["アイスクリーム", "アイス", "ジェラート", "ソフトクリーム", "gelato", "soft serve"],
+    "doctors": ["内科", "医者", "診察", "doctor"],
+    "dairy": ["乳製品", "牛乳", "チーズ"],
+    "appliance": ["家電製品"],
+    "post_box": ["ポスト", "郵便ポスト", "手紙を出", "mailbox"],
+    "electrical": ["電気工事", "電材"],
+    "bench": ["ベンチ", "座って", "座れる", "腰掛け", "休める", "休憩", "bench", "sit", "rest"],
+    "convenience": ["コンビニ", "コンビニエンスストア", "convenience store", "konbini"],
+    "clothes": ["洋服", "衣料", "アパレル", "ファッション", "clothing", "fashion", "apparel"],
+    "boutique": ["ブティック", "セレクトショップ"],
+    "money_lender": ["金融", "ローン"],
+    "alcohol": ["酒屋", "お酒", "ワイン", "日本酒", "liquor", "wine", "sake"],
+    "place_of_worship": ["神社", "寺", "お寺", "寺院", "教会", "参拝", "お参り", "御朱印", "パワースポット",
+                         "shrine", "temple", "church"],
+    "optician": ["眼鏡", "メガネ", "めがね", "コンタクト", "glasses"],
+    "bank": ["銀行", "信用金庫", "信金"],
+    "lottery": ["宝くじ", "ロト"],
+    "dry_cleaning": ["クリーニング", "dry cleaner"],
+    "post_office": ["郵便局", "post office"],
+    "bicycle": ["自転車屋", "自転車", "サイクリング", "cycling", "bike shop"],
+    "baby_goods": ["ベビー用品", "赤ちゃん", "ベビーカー", "baby"],
+    "fire_station": ["消防署", "消防"],
+    "attraction": ["観光", "名所", "見どころ", "観光地", "スポット", "遊園地", "sightseeing", "tourist"],
+}
+
+# Phrases containing keywords of LANDMARK_KEYWORDS without naming their types, skipped by the matcher.
+LANDMARK_STOP_PHRASES: list[str] = [
+    "精一杯", "目一杯", "お腹一杯", "おなか一杯", "仕事帰り", "作業着", "to work", "after work", "the rest of",
+]
@@ -2,22 +2,36 @@
 import dataclasses
 import json
 import logging
+import math
 import os
-from typing import Any
+import time
+from typing import Any, Iterator
 
 from dotenv import load_dotenv
-from flask import Flask, send_from_directory, request, jsonify
+from flask import Flask, Response, send_from_directory, request, jsonify, stream_with_context
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
-from geojson_length import calculate_distance, Unit
 
-from constants import WEIGHT_LANDMARKS
-from request_response_data import SearchRequest, Location, SearchResponse, Route, Place
+from constants import (
+    MAX_ALTERNATIVE_ROUTES,
+    MAX_BATCH_PAIRS,
+    RETRY_BUDGET_PER_REQUEST,
+    WALKING_SPEED_MPS,
+    WEIGHT_LANDMARKS,
+)
+from request_response_data import SearchRequest, Location, SearchResponse, Route, RouteEncoding, Place
 from server.add_explanation import add_explanation
-from server.calculate_weights import calc_weights
+from server.cache import get_llm_cache
+from server.calculate_weights import calc_weights, default_weights
 from server.extract_landmarks import extract_landmarks
 from server.generate_description import generate_description
-from server.get_routes import get_routes
+from server.db_pool import warm_up_pool
+from server.get_routes import RouteNotFoundError, get_alternative_routes, get_route_cache, get_routes_batch
+from server.metrics import RequestMetrics, get_request_metrics, observe, render, sampled, start_request, timer
+from server.pipeline import SearchPipeline
+from server.route_encoding import EncodedRoute, dumps, encode_route, geometry_lines, line_lengths
+from server.route_summary import RouteSummary, summarize_geojson
+from server.retry import start_retry_budget
 
 
 load_dotenv()
@@ -28,8 +42,16 @@ DB_HOST: str | None = os.getenv("DB_HOST")
 DB_PORT: str | None = os.getenv("DB_PORT")
 DB_INSTANCE_CONNECTION_NAME: str | None = os.getenv("DB_INSTANCE_CONNECTION_NAME")
 DB_NAME: str = os.environ["DB_NAME"]
+# Connection pool. The defaults fit gunicorn with 8 threads.
+DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "8"))
+DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "2"))
+DB_POOL_TIMEOUT: float = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING: bool = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+DB_POOL_WARM_UP: int = int(os.getenv("DB_POOL_WARM_UP", str(DB_POOL_SIZE)))
 
 _HTTP_400_BAD_REQUEST: int = 400
+_HTTP_404_NOT_FOUND: int = 404
 
 logger: logging.Logger = logging.getLogger(__name__)
 
@@ -44,8 +66,65 @@ else:
     db_url = f'postgresql+pg8000://{DB_USER}:{DB_PASSWORD}@/{DB_NAME}?unix_sock=/cloudsql/{DB_INSTANCE_CONNECTION_NAME}/.s.PGSQL.5432'
 
 app.config['SQLALCHEMY_DATABASE_URI'] = db_url
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+    "pool_size": DB_POOL_SIZE,
+    "max_overflow": DB_MAX_OVERFLOW,
+    "pool_timeout": DB_POOL_TIMEOUT,
+    "pool_recycle": DB_POOL_RECYCLE,
+    "pool_pre_ping": DB_POOL_PRE_PING,
+}
 db = SQLAlchemy(app)
 
+# Batch workers are spawned, so they import this module again as __mp_main__ when the server runs as
+# `python src/main.py`. They only route on their copy of the graph and must not open connections.
+if __name__ != "__mp_main__":
+    with app.app_context():
+        warm_up_pool(db.engine, DB_POOL_WARM_UP)
+
+
+@app.before_request
+def start_request_metrics():
+    """Collect the stage timings of each request, see server/metrics.py."""
+    start_request()
+
+
+@app.after_request
+def finish_request_metrics(response: Response) -> Response:
+    """Send the stage timings in the Server-Timing header, and record the request once it is sent.
+
+    Streamed responses send their headers before the stages run, so only the histograms get their timings.
+    """
+    metrics: RequestMetrics | None = get_request_metrics()
+    if metrics is None:
+        return response
+    if metrics.timings:
+        response.headers["Server-Timing"] = metrics.server_timing()
+
+    endpoint: str = request.endpoint or "unknown"
+    status: int = response.status_code
+
+    def record() -> None:
+        seconds: float = time.perf_counter() - metrics.started_at
+        observe("request_seconds", seconds, endpoint=endpoint)
+        if metrics.sampled:
+            logger.error(json.dumps({
+                "event": "request",
+                "endpoint": endpoint,
+                "status": status,
+                "duration_ms": round(seconds * 1000, 1),
+                "timings_ms": metrics.timings_ms(),
+            }))
+
+    response.call_on_close(record)
+    return response
+
+
+@app.errorhandler(RouteNotFoundError)
+def route_not_found(error: RouteNotFoundError):
+    """A search between ends that no route connects is not a failure of the server."""
+    logger.error(f"[{__name__}] {error=}")
+    return jsonify({"error": str(error)}), _HTTP_404_NOT_FOUND
+
 
 @app.route("/")
 def server():
@@ -53,117 +132,398 @@ def server():
     return send_from_directory(app.static_folder, "index.html")
 
 
-@app.route("/search")
-def search():
-    """Search API endpoint."""
-    logger.error(f"[{__name__}] process started.")
+@app.route("/stats")
+def stats():
+    return jsonify({"llm_cache": get_llm_cache().stats(), "route_cache": get_route_cache().stats()})
+
 
+@app.route("/metrics")
+def metrics():
+    """Stage and request duration histograms, LLM token and retry counts, in the Prometheus text format."""
+    return Response(render(), mimetype="text/plain; version=0.0.4")
+
+
+def _parse_search_request() -> tuple[SearchRequest | None, str | None]:
+    """Build the search request from the query parameters, or return an error message."""
     preference: str | None = request.args.get("q")
     start_location: str | None = request.args.get("s")
     end_location: str | None = request.args.get("e")
+    # Number of alternative routes.
+    num_routes: str = request.args.get("k", "1")
     # Delay seconds for emulating server delay.
     delay: str | None = request.args.get("delay")
-    logger.error(f"[{__name__}] request: {preference=}, {start_location=}, {end_location=}")
+    if sampled():
+        logger.error(f"[{__name__}] request: {preference=}, {start_location=}, {end_location=}")
 
     # Validate the request.
     if not preference or not start_location or not end_location:
-        return (
-            jsonify({"error": "Missing preference, start, or end location."}),
-            _HTTP_400_BAD_REQUEST,
-        )
+        return None, "Missing preference, start, or end location."
 
     start_loc_obj: Location | None = Location.from_str(start_location)
     end_loc_obj: Location | None = Location.from_str(end_location)
     if start_loc_obj is None or end_loc_obj is None:
-        return (
-            jsonify({"error": "Invalid start or end location."}),
-            _HTTP_400_BAD_REQUEST,
-        )
+        return None, "Invalid start or end location."
+
+    if not num_routes.isdigit() or int(num_routes) < 1:
+        return None, "Invalid number of routes."
+
+    # Encoding of the route geometries, see RouteEncoding.
+    encoding: RouteEncoding | None = RouteEncoding.from_params(request.args)
+    if encoding is None:
+        return None, "Invalid route encoding."
 
     req: SearchRequest | None = SearchRequest(
-        preference, start_loc_obj, end_loc_obj
+        preference, start_loc_obj, end_loc_obj, min(int(num_routes), MAX_ALTERNATIVE_ROUTES), encoding
     )
     if req is None:
-        return jsonify({"error": "Invalid request."}), _HTTP_400_BAD_REQUEST
+        return None, "Invalid request."
+    return req, None
+
+
+def _run_search(req: SearchRequest) -> Iterator[tuple[str, Any]]:
+    """Run the search pipeline, yielding (event, data) as each part of the response is ready.
+
+    The last event is "response" with the whole SearchResponse.
+    """
+    preference: str = req.query
+    start_loc_obj: Location = req.start_location
+    end_loc_obj: Location = req.end_location
+
+    start_retry_budget(RETRY_BUDGET_PER_REQUEST)
+
+    # Stages not depending on each other run concurrently:
+    # weights and landmarks first, then the description overlaps with the routes and the explanation.
+    pipeline: SearchPipeline = SearchPipeline()
+    pipeline.submit("weights", calc_weights, preference)
+    pipeline.submit("landmarks", extract_landmarks, preference)
 
     # calculate weights of variables
-    weights: dict[str, float] = calc_weights(preference)
-    logger.error(f"[{__name__}] {weights=}")
+    weights: dict[str, float] = pipeline.result("weights", default_weights())
+    if sampled():
+        logger.error(f"[{__name__}] {weights=}")
+    yield "weights", {"weights": weights}
 
     # generate description
-    description: str = generate_description(preference, weights)
-    logger.error(f"[{__name__}] {description=}")
+    pipeline.submit("description", generate_description, preference, weights)
 
     # inference landmarks
-    landmarks: list[str] = extract_landmarks(preference)
-    logger.error(f"[{__name__}] {landmarks=}")
+    landmarks: list[str] = pipeline.result("landmarks", [])
+    if sampled():
+        logger.error(f"[{__name__}] {landmarks=}")
 
     # get info of routes and landmarks
-    routes_info: str
-    landmarks_info: str | None
-
-    routes_info, landmarks_info = get_routes(
-        db,
-        start_lat=start_loc_obj.latitude,
-        start_lon=start_loc_obj.longitude,
-        end_lat=end_loc_obj.latitude,
-        end_lon=end_loc_obj.longitude,
-        weight_length=weights['weight_length'],
-        weight_green_index=weights['weight_green_index'],
-        weight_water_index=weights['weight_water_index'],
-        weight_shade_index=weights['weight_shade_index'],
-        weight_slope_index=weights['weight_slope_index'],
-        weight_road_safety=weights['weight_road_safety'],
-        weight_isolation=weights['weight_isolation'],
-        weight_landmarks=WEIGHT_LANDMARKS,
-        landmarks=landmarks,
-    )
-    routes_info_dict: dict[str, Any] = {
-        "type": "Feature",
-        "properties": {},
-        "geometry": json.loads(routes_info)
-    }
+    with timer("route"):
+        routes_infos: list[tuple[str, str | None, list[float] | None, RouteSummary | None]] = get_alternative_routes(
+            db,
+            start_lat=start_loc_obj.latitude,
+            start_lon=start_loc_obj.longitude,
+            end_lat=end_loc_obj.latitude,
+            end_lon=end_loc_obj.longitude,
+            weight_length=weights['weight_length'],
+            weight_green_index=weights['weight_green_index'],
+            weight_water_index=weights['weight_water_index'],
+            weight_shade_index=weights['weight_shade_index'],
+            weight_slope_index=weights['weight_slope_index'],
+            weight_road_safety=weights['weight_road_safety'],
+            weight_isolation=weights['weight_isolation'],
+            weight_landmarks=WEIGHT_LANDMARKS,
+            landmarks=landmarks,
+            k=req.num_routes,
+        )
 
-    # calculate
-    # distance [meters]
-    distance: float = calculate_distance(routes_info_dict, Unit.meters)
-    logger.error(f"[{__name__}] {distance=}")
-    # duration [minutes]
-    duration: int = int(distance / 1.4 / 60)
-    logger.error(f"[{__name__}] {duration=}")
+    measured_routes: list[tuple[EncodedRoute, list[float], float, int]] = []
+    summaries: list[RouteSummary] = []
+    for index, (routes_info, landmarks_info, edge_lengths, summary) in enumerate(routes_infos):
+        with timer("distance"):
+            encoded, edge_lengths, distance, duration = _measure_route(
+                routes_info, edge_lengths, req.encoding, start_loc_obj
+            )
+        measured_routes.append((encoded, edge_lengths, distance, duration))
+        # Routes of the "db" engine come without the edge indices, so only their geometry is summarized.
+        if summary is None:
+            with timer("summary"):
+                summary = summarize_geojson(routes_info, landmarks_info, edge_lengths, start_loc_obj)
+        summaries.append(summary)
+        yield "route", {
+            "index": index,
+            "path_geo_json": encoded.path_geo_json,
+            "paths": encoded.paths,
+            "path_polyline": encoded.path_polyline,
+            "edge_distances_in_meter": edge_lengths,
+            "cumulative_distances_in_meter": encoded.cumulative_distances,
+            "distance_in_meter": distance,
+            "walking_duration_in_minutes": duration,
+        }
 
-    # add explanation
-    explained_info: dict[str, Any] = add_explanation(preference, routes_info, landmarks_info)
-    logger.error(f"[{__name__}] {explained_info=}")
+    description: str | None = None
+    if pipeline.done("description"):
+        description = pipeline.result("description", "")
+        if sampled():
+            logger.error(f"[{__name__}] {description=}")
+        yield "description", {"paragraphs": [description]}
 
-    # generate response
-    route: Route = Route(
-        title=explained_info["title"],
-        description=explained_info["summary"],
-        paths=[],
-        path_geo_json={
-            "type": "FeatureCollection",
-            "features": [routes_info_dict],
-        },
-        places=[
+    # add explanation, the ones of the alternative routes concurrently with the best route
+    for index, summary in enumerate(summaries[1:], start=1):
+        pipeline.submit(f"explanation:{index}", add_explanation, preference, summary)
+
+    routes: list[Route] = []
+    for index, summary in enumerate(summaries):
+        explained_info: dict[str, Any]
+        if index == 0:
+            with timer("explanation"):
+                explained_info = add_explanation(preference, summary)
+        else:
+            explained_info = pipeline.result(f"explanation:{index}", {"title": "", "summary": "", "details": []})
+        if sampled():
+            logger.error(f"[{__name__}] {explained_info=}")
+        places: list[Place] = [
             Place(
                 place.get("name", ""),
                 place.get("description", ""),
                 Location(place.get("latitude", 0), place.get("longitude", 0))
             ) for place in explained_info["details"]
-        ],
-        distance_in_meter=distance,
-        walking_duration_in_minutes=duration,
-    )
+        ]
+        yield "explanation", {
+            "index": index,
+            "title": explained_info["title"],
+            "description": explained_info["summary"],
+            "places": places,
+        }
+
+        encoded, edge_lengths, distance, duration = measured_routes[index]
+        routes.append(Route(
+            title=explained_info["title"],
+            description=explained_info["summary"],
+            paths=encoded.paths,
+            path_geo_json=encoded.path_geo_json,
+            places=places,
+            distance_in_meter=distance,
+            walking_duration_in_minutes=duration,
+            path_polyline=encoded.path_polyline,
+            edge_distances_in_meter=edge_lengths,
+            cumulative_distances_in_meter=encoded.cumulative_distances,
+        ))
+
+    if description is None:
+        description = pipeline.result("description", "")
+        if sampled():
+            logger.error(f"[{__name__}] {description=}")
+        yield "description", {"paragraphs": [description]}
+
+    # generate response
     response: SearchResponse = SearchResponse(
         request=req,
         paragraphs=[description],
-        routes=[route],
+        routes=routes,
     )
-    logger.error(f"[{__name__}] {response=}")
+    if sampled():
+        logger.error(f"[{__name__}] {response=}")
+    yield "response", response
+
+
+def _measure_route(
+    routes_info: str, edge_lengths: list[float] | None, encoding: RouteEncoding, start: Location | None
+) -> tuple[EncodedRoute, list[float], float, int]:
+    """Encode the route geometry for the response and compute its distance and walking duration.
+
+    The distance is the sum of the edge lengths found by the search. Only routes of the "db" engine,
+    which come without them, are measured on their geometry.
+    """
+    geometry: dict[str, Any] = json.loads(routes_info)
+    # Routes with the edge lengths of the search come from the graph engine, whose lines are in walking
+    # order and direction.
+    ordered: bool = edge_lengths is not None
+    if edge_lengths is None:
+        edge_lengths = line_lengths(geometry_lines(geometry))
 
+    # calculate
+    # distance [meters]
+    distance: float = sum(edge_lengths)
+    if sampled():
+        logger.error(f"[{__name__}] {distance=}")
+    # duration [minutes]
+    duration: int = int(distance / WALKING_SPEED_MPS / 60)
+    if sampled():
+        logger.error(f"[{__name__}] {duration=}")
+    return encode_route(geometry, edge_lengths, encoding, start, ordered), edge_lengths, distance, duration
+
+
+@app.route("/search")
+def search():
+    """Search API endpoint."""
+    logger.error(f"[{__name__}] process started.")
+
+    req: SearchRequest | None
+    error: str | None
+    req, error = _parse_search_request()
+    if req is None:
+        return jsonify({"error": error}), _HTTP_400_BAD_REQUEST
+
+    response: SearchResponse | None = None
+    for event, data in _run_search(req):
+        if event == "response":
+            response = data
+
+    with timer("serialization"):
+        body: str = dumps(response)
     logger.error(f"[{__name__}] process completed.")
-    return jsonify(dataclasses.asdict(response))
+    return Response(body, mimetype="application/json")
+
+
+@app.route("/search/stream")
+def search_stream():
+    """Search API endpoint streaming each part of the response as soon as it is ready.
+
+    The body is newline-delimited JSON. Each line is {"event": ..., "data": ...}, with the events
+    "weights", "route", "description" and "explanation" in the order they complete, then
+    "response" with the same body as /search. A failure is sent as an "error" event.
+    "route" and "explanation" are sent for each route, with its "index" in the response.
+    """
+    logger.error(f"[{__name__}] stream process started.")
+
+    req: SearchRequest | None
+    error: str | None
+    req, error = _parse_search_request()
+    if req is None:
+        return jsonify({"error": error}), _HTTP_400_BAD_REQUEST
+
+    def generate() -> Iterator[str]:
+        try:
+            for event, data in _run_search(req):
+                with timer("serialization"):
+                    line: str = dumps({"event": event, "data": data}) + "\n"
+                yield line
+        except Exception as e:
+            logger.error(f"[{__name__}] stream process failed. {e=}")
+            yield dumps({"event": "error", "data": {"error": str(e)}}) + "\n"
+            return
+
+        logger.error(f"[{__name__}] stream process completed.")
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="application/x-ndjson",
+        # Ask proxies not to buffer the stream.
+        headers={"X-Accel-Buffering": "no", "Cache-Control": "no-cache"},
+    )
+
+
+@app.route("/search/batch", methods=["POST"])
+def search_batch():
+    """Batch API endpoint computing the routes of many (start, end) pairs with the same preference.
+
+    The JSON body has "pairs", a list of {"s": "lat,lon", "e": "lat,lon"}, and either "q", a preference,
+    or "weights", the weights returned by calc_weights() with optional "landmarks" types. The route
+    geometries are encoded as given by "format", "precision" and "simplify" (see RouteEncoding).
+    Explanations and descriptions are not generated.
+
+    The body of the response is newline-delimited JSON like /search/stream: a "weights" event, then
+    a "route" event for each pair in the order they are found, with the "index" of the pair. Pairs
+    without a route are sent as "error" events with their "index".
+    """
+    logger.error(f"[{__name__}] batch process started.")
+
+    body: Any = request.get_json(silent=True)
+    if not isinstance(body, dict) or not isinstance(body.get("pairs"), list):
+        return jsonify({"error": "Missing pairs."}), _HTTP_400_BAD_REQUEST
+    if len(body["pairs"]) > MAX_BATCH_PAIRS:
+        return jsonify({"error": f"Too many pairs, at most {MAX_BATCH_PAIRS}."}), _HTTP_400_BAD_REQUEST
+
+    pairs: list[tuple[float, float, float, float]] = []
+    for pair in body["pairs"]:
+        start_loc_obj: Location | None = Location.from_str(pair.get("s")) if isinstance(pair, dict) else None
+        end_loc_obj: Location | None = Location.from_str(pair.get("e")) if isinstance(pair, dict) else None
+        if start_loc_obj is None or end_loc_obj is None:
+            return jsonify({"error": "Invalid start or end location."}), _HTTP_400_BAD_REQUEST
+        pairs.append(
+            (start_loc_obj.latitude, start_loc_obj.longitude, end_loc_obj.latitude, end_loc_obj.longitude)
+        )
+
+    encoding: RouteEncoding | None = RouteEncoding.from_params(body)
+    if encoding is None:
+        return jsonify({"error": "Invalid route encoding."}), _HTTP_400_BAD_REQUEST
+
+    weights: dict[str, float] | None = body.get("weights")
+    landmarks: list[str] = body.get("landmarks") or []
+    preference: str | None = body.get("q")
+    if not isinstance(landmarks, list) or not all(isinstance(landmark, str) for landmark in landmarks):
+        return jsonify({"error": "Invalid landmarks."}), _HTTP_400_BAD_REQUEST
+    if weights is not None:
+        if not _valid_weights(weights):
+            return jsonify({"error": "Invalid weights."}), _HTTP_400_BAD_REQUEST
+        weights = {name: float(value) for name, value in weights.items()}
+    elif not preference or not isinstance(preference, str):
+        return jsonify({"error": "Missing preference or weights."}), _HTTP_400_BAD_REQUEST
+
+    def generate() -> Iterator[str]:
+        nonlocal weights, landmarks
+        try:
+            if weights is None:
+                start_retry_budget(RETRY_BUDGET_PER_REQUEST)
+                pipeline: SearchPipeline = SearchPipeline()
+                pipeline.submit("weights", calc_weights, preference)
+                pipeline.submit("landmarks", extract_landmarks, preference)
+                weights = pipeline.result("weights", default_weights())
+                landmarks = pipeline.result("landmarks", [])
+            yield dumps({"event": "weights", "data": {"weights": weights, "landmarks": landmarks}}) + "\n"
+
+            for index, routes_info, landmarks_info, edge_lengths in get_routes_batch(
+                db,
+                pairs,
+                weight_length=weights['weight_length'],
+                weight_green_index=weights['weight_green_index'],
+                weight_water_index=weights['weight_water_index'],
+                weight_shade_index=weights['weight_shade_index'],
+                weight_slope_index=weights['weight_slope_index'],
+                weight_road_safety=weights['weight_road_safety'],
+                weight_isolation=weights['weight_isolation'],
+                weight_landmarks=WEIGHT_LANDMARKS,
+                landmarks=landmarks,
+            ):
+                if routes_info is None:
+                    yield dumps({"event": "error", "data": {"index": index, "error": "No route found."}}) + "\n"
+                    continue
+
+                start_lat, start_lon = pairs[index][:2]
+                encoded, edge_lengths, distance, duration = _measure_route(
+                    routes_info, edge_lengths, encoding, Location(start_lat, start_lon)
+                )
+                yield dumps({"event": "route", "data": {
+                    "index": index,
+                    "path_geo_json": encoded.path_geo_json,
+                    "paths": encoded.paths,
+                    "path_polyline": encoded.path_polyline,
+                    "edge_distances_in_meter": edge_lengths,
+                    "cumulative_distances_in_meter": encoded.cumulative_distances,
+                    "landmarks_geo_json": json.loads(landmarks_info) if landmarks_info else None,
+                    "distance_in_meter": distance,
+                    "walking_duration_in_minutes": duration,
+                }}) + "\n"
+        except Exception as e:
+            logger.error(f"[{__name__}] batch process failed. {e=}")
+            yield dumps({"event": "error", "data": {"error": str(e)}}) + "\n"
+            return
+
+        logger.error(f"[{__name__}] batch process completed.")
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="application/x-ndjson",
+        # Ask proxies not to buffer the stream.
+        headers={"X-Accel-Buffering": "no", "Cache-Control": "no-cache"},
+    )
+
+
+def _valid_weights(weights: Any) -> bool:
+    """Whether the weights have the factors of calc_weights() with finite, non-negative numbers."""
+    return (
+        isinstance(weights, dict) and
+        set(weights) == set(default_weights()) and
+        all(
+            isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value) and value >= 0
+            for value in weights.values()
+        )
+    )
 
 
 if __name__ == "__main__":
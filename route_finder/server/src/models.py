@@ -2,10 +2,22 @@ import os
 
 import google.generativeai as genai
 
+from server.cassette import RecordingModel, ReplayModel, get_cassette
+
 
 # configure google api
 genai.configure(api_key=os.environ['GOOGLE_API_KEY'])
 model = genai.GenerativeModel('gemini-pro')
+# record or replay the responses for load tests, see constants.CASSETTE_MODE
+_cassette = get_cassette()
+if _cassette is not None:
+    model = ReplayModel(_cassette) if _cassette.replaying else RecordingModel(model, _cassette)
 
 def get_model():
     return model
+
+
+def set_model(new_model) -> None:
+    """Replace the model, such as by a stub without network access in benchmarks."""
+    global model
+    model = new_model
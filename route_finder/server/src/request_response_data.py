@@ -35,6 +35,45 @@ class Place:
     location: Location
 
 
+@dataclasses.dataclass
+class RouteEncoding:
+    """How the geometries of routes are encoded in the response."""
+
+    # "geojson": MultiLineString of the edges in path_geo_json,
+    # "linestring": one ordered LineString in path_geo_json and paths,
+    # "polyline": encoded polyline in path_polyline.
+    format: str = "geojson"
+    # Decimal digits of the coordinates, all of them if None (5 for polylines).
+    precision: int | None = None
+    # Tolerance [m] of the Douglas-Peucker simplification, not simplified if 0.
+    simplify: float = 0.0
+
+    FORMATS = ("geojson", "linestring", "polyline")
+
+    @classmethod
+    def from_params(cls, params: dict) -> "RouteEncoding":
+        """Create RouteEncoding object from the "format", "precision" and "simplify" parameters."""
+        encoding: RouteEncoding = cls()
+        try:
+            encoding.format = params.get("format") or encoding.format
+            if params.get("precision") not in (None, ""):
+                encoding.precision = int(params["precision"])
+            if params.get("simplify") not in (None, ""):
+                encoding.simplify = float(params["simplify"])
+        except (TypeError, ValueError):
+            _logger.warning(f"Invalid route encoding: {params}")
+            return None
+
+        if (
+            encoding.format not in cls.FORMATS
+            or (encoding.precision is not None and not 0 <= encoding.precision <= 10)
+            or not 0 <= encoding.simplify < float("inf")
+        ):
+            _logger.warning(f"Invalid route encoding: {params}")
+            return None
+        return encoding
+
+
 @dataclasses.dataclass
 class Route:
     """Route dataclass."""
@@ -43,11 +82,17 @@ class Route:
     description: str
     # This is a list of locations that make up the route, sorted from start to end.
     paths: list[Location]
-    path_geo_json: dict
+    path_geo_json: dict | None
     places: list[Place]
     distance_in_meter: float
     # We consider only walking time.
     walking_duration_in_minutes: float
+    # Encoded polyline of the route, only with the "polyline" encoding.
+    path_polyline: str | None = None
+    # Length of each edge, in the order of the lines of the "geojson" encoding.
+    edge_distances_in_meter: list[float] = dataclasses.field(default_factory=list)
+    # Distance from the start to each point of paths (or of path_polyline).
+    cumulative_distances_in_meter: list[float] = dataclasses.field(default_factory=list)
 
 
 @dataclasses.dataclass
@@ -57,6 +102,9 @@ class SearchRequest:
     query: str
     start_location: Location
     end_location: Location
+    # Number of alternative routes to return, at most (the `k` query parameter).
+    num_routes: int = 1
+    encoding: RouteEncoding = dataclasses.field(default_factory=RouteEncoding)
 
 
 @dataclasses.dataclass
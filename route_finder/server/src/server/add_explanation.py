@@ -3,24 +3,31 @@ import logging
 import textwrap
 from typing import Any
 
-from constants import MAX_RETRY_COUNT
 from models import get_model
+from server.metrics import record_llm_usage
+from server.retry import call_with_breaker, get_circuit_breaker, retry
+from server.route_summary import RouteSummary
 
 
 _logger = logging.getLogger(__name__)
 
 
-def add_explanation(
-    preference: str, routes_info: str, landmarks_info: str | None
-) -> dict[str, Any]:
+def add_explanation(preference: str, summary: RouteSummary) -> dict[str, Any]:
+    """Title, summary and details of a route, from its summary rather than its geometry, which keeps the
+    prompt small and its size independent of the length of the route."""
     _logger.error(f'[{__name__}] started.')
 
     prompt: str = textwrap.dedent(
         f"""
         入力値のデータを読み込んで、そのデータが示すルートの特徴を説明する文章を生成してください。
         # 入力値のデータに関する情報
-        - 入力値 1: ルートの情報を示す MultiLineString 型の GeoJSON データ
-        - 入力値 2: 見どころの情報を示す Point 型の GeoJSON データ
+        - 入力値 1: ルートの特徴を示す JSON データ
+            - length_m: ルートの全長 [m]
+            - start, end: 出発地と目的地の [緯度, 経度]
+            - shares: ルートの全長のうち、緑 (green), 水辺 (water), 日陰 (shade), 平坦さ (flat), 安全さ (safe), 静けさ (quiet) の各観点で周辺の上位 25% に入る道の割合
+            - max_slope_degrees: ルート上の最大の傾斜 [度]
+            - streets: ルートが通る主な道の名前 (name) と、その道を歩く距離 (length_m)。通る順
+        - 入力値 2: ルート沿いの見どころの名前 (name), 種類 (type), 緯度 (latitude), 経度 (longitude), 出発地からの距離 (distance_m) を示す JSON データ。通る順
         - 入力値 3: ルートと見どころの観点を示す文字列
         # 出力する項目
         - title
@@ -58,32 +65,34 @@ def add_explanation(
             ]
         }}
         # 入力値 1: ルートデータ
-        {routes_info}
+        {summary.route_json()}
         # 入力値 2: 見どころデータ
-        {landmarks_info}
+        {summary.landmarks_json()}
         # 入力値 3: 観点
         {preference}
         """
     )
 
-    for retry_count in range(MAX_RETRY_COUNT):
+    def explain() -> dict[str, Any]:
+        response: Any = call_with_breaker(
+            lambda: get_model().generate_content(prompt), get_circuit_breaker("model")
+        )
+        record_llm_usage("explanation", response)
+        text: str = response.text
         try:
-            response: Any = get_model().generate_content(prompt)
-            explained_info: dict[str, Any] = json.loads(response.text)
+            explained_info: dict[str, Any] = json.loads(text)
+        except ValueError as e:
+            raise Exception(f"Invalid explanation JSON. {text}") from e
 
-            if (
-                "title" not in explained_info or
-                "summary" not in explained_info or
-                "details" not in explained_info
-            ):
-                raise Exception("Invalid explanation format.")
-        except Exception as e:
-            _logger.error(f"[{__name__}] failed to add explanation. {response.text} {e=}")
+        if (
+            "title" not in explained_info or
+            "summary" not in explained_info or
+            "details" not in explained_info
+        ):
+            raise Exception("Invalid explanation format.")
+        return explained_info
 
-            if retry_count > MAX_RETRY_COUNT:
-                raise e
-
-            _logger.error(f"[{__name__}] retry: {retry_count + 1}.")
+    explained_info: dict[str, Any] = retry(explain, name="add_explanation")
 
     _logger.error(f'[{__name__}] completed.')
     return explained_info
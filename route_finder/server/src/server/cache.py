@@ -0,0 +1,151 @@
+import collections
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Any, Hashable
+
+from constants import LLM_CACHE_MAX_SIZE, LLM_CACHE_PATH, LLM_CACHE_TTL_SECONDS
+
+
+_logger = logging.getLogger(__name__)
+
+
+class LruCache:
+    """Thread-safe in-memory cache with size-bounded LRU eviction and an optional TTL."""
+
+    def __init__(self, max_size: int, ttl_seconds: float | None = None):
+        self._max_size: int = max_size
+        self._ttl_seconds: float | None = ttl_seconds
+        # key -> (stored_at, value), ordered from least to most recently used.
+        self._entries: collections.OrderedDict[Hashable, tuple[float, Any]] = collections.OrderedDict()
+        self._lock: threading.Lock = threading.Lock()
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def _is_expired(self, stored_at: float) -> bool:
+        return self._ttl_seconds is not None and time.time() - stored_at > self._ttl_seconds
+
+    def get(self, key: Hashable) -> Any | None:
+        """Return the value for the key, or None if it is missing or expired."""
+        with self._lock:
+            entry: tuple[float, Any] | None = self._entries.get(key)
+            if entry is None or self._is_expired(entry[0]):
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, value: Any, stored_at: float | None = None) -> None:
+        with self._lock:
+            self._entries[key] = (time.time() if stored_at is None else stored_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            lookups: int = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self._max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+
+class LlmCache:
+    """Cache of LLM results keyed by the normalized input text and the prompt version.
+
+    Entries are kept in an LruCache, and also in a SQLite file when a path is given
+    so that they survive restarts. Values must be JSON serializable.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float, path: str | None = None):
+        self._ttl_seconds: float = ttl_seconds
+        self._memory: LruCache = LruCache(max_size, ttl_seconds)
+        self._connection: sqlite3.Connection | None = None
+        self._lock: threading.Lock = threading.Lock()
+        self.disk_hits: int = 0
+
+        if path:
+            self._connection = sqlite3.connect(path, check_same_thread=False)
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, value TEXT, stored_at REAL)"
+            )
+            self._connection.execute(
+                "DELETE FROM llm_cache WHERE stored_at < ?", (time.time() - ttl_seconds,)
+            )
+            self._connection.commit()
+            _logger.error(f'[{__name__}] opened disk cache. {path=}')
+
+    @staticmethod
+    def make_key(namespace: str, prompt_version: str, text: str) -> str:
+        return f"{namespace}:{prompt_version}:{normalize_text(text)}"
+
+    def get(self, namespace: str, prompt_version: str, text: str) -> Any | None:
+        key: str = self.make_key(namespace, prompt_version, text)
+        value: Any | None = self._memory.get(key)
+        if value is not None or self._connection is None:
+            return value
+
+        with self._lock:
+            row: tuple[str, float] | None = self._connection.execute(
+                "SELECT value, stored_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or time.time() - row[1] > self._ttl_seconds:
+            return None
+
+        value = json.loads(row[0])
+        self._memory.put(key, value, stored_at=row[1])
+        with self._lock:
+            self.disk_hits += 1
+        return value
+
+    def put(self, namespace: str, prompt_version: str, text: str, value: Any) -> None:
+        key: str = self.make_key(namespace, prompt_version, text)
+        stored_at: float = time.time()
+        self._memory.put(key, value, stored_at=stored_at)
+        if self._connection is None:
+            return
+
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, stored_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), stored_at),
+            )
+            self._connection.commit()
+
+    def stats(self) -> dict[str, Any]:
+        # A disk hit is counted as a miss of the memory cache, but the LLM call was still skipped.
+        stats: dict[str, Any] = self._memory.stats()
+        stats["hits"] += self.disk_hits
+        stats["misses"] -= self.disk_hits
+        lookups: int = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = stats["hits"] / lookups if lookups else 0.0
+        stats["disk_hits"] = self.disk_hits
+        return stats
+
+
+def normalize_text(text: str) -> str:
+    """Normalize width, case and whitespace so that trivially different inputs share an entry."""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text)).strip().lower()
+
+
+_llm_cache: LlmCache = LlmCache(LLM_CACHE_MAX_SIZE, LLM_CACHE_TTL_SECONDS, LLM_CACHE_PATH)
+
+
+def get_llm_cache() -> LlmCache:
+    return _llm_cache
@@ -1,19 +1,27 @@
 import logging
+import re
 import textwrap
 from typing import Any
 
-from constants import WEIGHT_LANDMARKS
+from constants import WEIGHT_ESTIMATE_MIN_CONFIDENCE, WEIGHT_LANDMARKS, WEIGHT_SUM_TOLERANCE
 from models import get_model
+from server.cache import get_llm_cache
+from server.metrics import increment, record_llm_usage
+from server.retry import get_circuit_breaker, retry
+from server.weight_estimator import WEIGHT_NAMES, WeightEstimate, estimate_weights, normalize_weights
 
 
 _logger = logging.getLogger(__name__)
 
+# Bump this when the prompt changes, so that cached results of the old prompt are not used.
+_PROMPT_VERSION: str = "2"
+_WEIGHT_PATTERN = re.compile(r"(weight_[a-z_]+)\s*[=:]\s*(-?[0-9]*\.?[0-9]+(?:e-?[0-9]+)?)")
 
-def calc_weights(query: str) -> dict[str, float]:
-    _logger.error(f'[{__name__}] started.')
 
+def default_weights() -> dict[str, float]:
+    """Uniform weights, used when the weights can not be calculated."""
     avg_weight: float = (1 - WEIGHT_LANDMARKS) / 7
-    weights_calculated: dict[str, float] = {
+    return {
         "weight_length": avg_weight,
         "weight_green_index": avg_weight,
         "weight_water_index": avg_weight,
@@ -23,6 +31,43 @@ def calc_weights(query: str) -> dict[str, float]:
         "weight_isolation": avg_weight,
     }
 
+
+def calc_weights(query: str) -> dict[str, float]:
+    """Weights of the route factors for the preference, summing to 1 - WEIGHT_LANDMARKS.
+
+    The local estimator answers when it is confident enough, otherwise the model is asked.
+    If the model fails, the estimate is used when it found any keyword, else uniform weights.
+    """
+    _logger.error(f'[{__name__}] started.')
+
+    estimate: WeightEstimate = estimate_weights(query)
+    if estimate.confidence >= WEIGHT_ESTIMATE_MIN_CONFIDENCE:
+        increment("weight_calculations_total", source="estimator")
+        _logger.error(f'[{__name__}] completed with estimator. {estimate.confidence=}')
+        return estimate.weights
+
+    cached: dict[str, float] | None = get_llm_cache().get("weights", _PROMPT_VERSION, query)
+    if cached is not None:
+        _logger.error(f'[{__name__}] completed with cache.')
+        increment("weight_calculations_total", source="cache")
+        return dict(cached)
+
+    weights: dict[str, float] | None = model_weights(query)
+    if weights is not None:
+        increment("weight_calculations_total", source="model")
+        get_llm_cache().put("weights", _PROMPT_VERSION, query, weights)
+    else:
+        increment("weight_calculations_total", source="fallback")
+        weights = estimate.weights if estimate.confidence > 0 else default_weights()
+
+    _logger.error(f'[{__name__}] completed.')
+    return weights
+
+
+def model_weights(query: str) -> dict[str, float] | None:
+    """Weights of the model for the preference, None if its reply can not be used."""
+    avg_weight: float = (1 - WEIGHT_LANDMARKS) / 7
+
     prompt: str = textwrap.dedent(
         f"""
         # 目的
@@ -51,27 +96,27 @@ def calc_weights(query: str) -> dict[str, float]:
     )
 
     try:
-        response: Any = get_model().generate_content(prompt)
+        response: Any = retry(
+            lambda: get_model().generate_content(prompt),
+            name="calc_weights",
+            breaker=get_circuit_breaker("model"),
+        )
+        record_llm_usage("weights", response)
         text: str = response.text
 
         # Parse weights from response
         weights: dict[str, float] = {}
-        for part in text.split(','):
-            key, value = part.strip().split('=')
-            weights[key.strip()] = float(value)
-
-        # error if sum of weights is not 1 - WEIGHT_LANDMARKS
-        if sum(weights.values()) != 1 - WEIGHT_LANDMARKS:
-            raise Exception(f"Sum of weights is not {1 - WEIGHT_LANDMARKS}")
-
-        # error if any key in weights is not in weights_calculated
-        for key in weights:
-            if key in weights_calculated:
-                weights_calculated[key] = weights[key]
-            else:
+        for key, value in _WEIGHT_PATTERN.findall(text):
+            # error if any key in weights is not a weight to calculate
+            if key not in WEIGHT_NAMES:
                 raise Exception(f"Invalid weight key: {key}")
+            weights[key] = float(value)
+
+        # error if sum of weights is not 1 - WEIGHT_LANDMARKS, rounding errors of the reply are rescaled
+        normalized: dict[str, float] | None = normalize_weights(weights, WEIGHT_SUM_TOLERANCE)
+        if normalized is None:
+            raise Exception(f"Sum of weights is not {1 - WEIGHT_LANDMARKS}. {weights=}")
+        return normalized
     except Exception as e:
         _logger.error(f"[{__name__}] failed to calculate weights. {e=}")
-
-    _logger.error(f'[{__name__}] completed.')
-    return weights_calculated
+        return None
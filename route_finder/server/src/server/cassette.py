@@ -0,0 +1,142 @@
+import dataclasses
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any
+
+from constants import CASSETTE_MODE, CASSETTE_PATH
+from server.retry import NotRetryableError
+
+
+_logger = logging.getLogger(__name__)
+
+
+class CassetteMissError(NotRetryableError):
+    """Raised in replay mode for a call that was not recorded."""
+
+
+class Cassette:
+    """Recorded responses of the model and of generate_route(), with their latencies.
+
+    The file has one JSON object per line, {"kind", "key", "response", "latency"}, appended as calls
+    complete, so that the threads and workers of a recording server can share it. A call recorded
+    several times is replayed in turn with each of its responses.
+    """
+
+    def __init__(self, path: str, mode: str):
+        self.path: str = path
+        self.mode: str = mode
+        # "<kind>:<key>" -> recorded (response, latency [seconds])
+        self._entries: dict[str, list[tuple[Any, float]]] = {}
+        self._next: dict[str, int] = {}
+        self._lock: threading.Lock = threading.Lock()
+
+        if mode == "replay":
+            with open(path) as f:
+                for line in f:
+                    if line.strip():
+                        entry: dict[str, Any] = json.loads(line)
+                        self._entries.setdefault(f"{entry['kind']}:{entry['key']}", []).append(
+                            (entry["response"], entry["latency"])
+                        )
+            _logger.error(f'[{__name__}] loaded cassette. {path=}, calls={len(self._entries)}')
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    @staticmethod
+    def make_key(request: Any) -> str:
+        return hashlib.sha256(json.dumps(request, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+    def record(self, kind: str, request: Any, response: Any, latency: float) -> None:
+        line: str = json.dumps({
+            "kind": kind,
+            "key": self.make_key(request),
+            "response": response,
+            "latency": latency,
+        }, ensure_ascii=False)
+        with self._lock:
+            with open(self.path, "a") as f:
+                f.write(line + "\n")
+
+    def replay(self, kind: str, request: Any) -> Any:
+        """Return the recorded response after its recorded latency."""
+        key: str = f"{kind}:{self.make_key(request)}"
+        with self._lock:
+            entries: list[tuple[Any, float]] | None = self._entries.get(key)
+            if not entries:
+                raise CassetteMissError(f"No recorded {kind} call. {key=}")
+            index: int = self._next.get(key, 0)
+            self._next[key] = (index + 1) % len(entries)
+        response, latency = entries[index]
+        time.sleep(latency)
+        return response
+
+
+@dataclasses.dataclass
+class CassetteUsage:
+    prompt_token_count: int
+    candidates_token_count: int
+
+
+@dataclasses.dataclass
+class CassetteResponse:
+    """The parts of a generate_content() response used by the server."""
+
+    text: str
+    usage_metadata: CassetteUsage
+
+
+class RecordingModel:
+    """Calls the model and records its responses to the cassette."""
+
+    def __init__(self, model: Any, cassette: Cassette):
+        self._model: Any = model
+        self._cassette: Cassette = cassette
+
+    def generate_content(self, prompt: str) -> Any:
+        started_at: float = time.perf_counter()
+        response: Any = self._model.generate_content(prompt)
+        latency: float = time.perf_counter() - started_at
+        try:
+            # .text raises for blocked responses, which are not recorded.
+            text: str = response.text
+        except Exception as e:
+            _logger.error(f'[{__name__}] not recorded. {e=}')
+            return response
+
+        usage: Any = getattr(response, "usage_metadata", None)
+        self._cassette.record("generate_content", prompt, {
+            "text": text,
+            "prompt_token_count": getattr(usage, "prompt_token_count", 0) or 0,
+            "candidates_token_count": getattr(usage, "candidates_token_count", 0) or 0,
+        }, latency)
+        return response
+
+
+class ReplayModel:
+    """Answers with the responses of the cassette instead of calling the model."""
+
+    def __init__(self, cassette: Cassette):
+        self._cassette: Cassette = cassette
+
+    def generate_content(self, prompt: str) -> CassetteResponse:
+        response: dict[str, Any] = self._cassette.replay("generate_content", prompt)
+        return CassetteResponse(
+            response["text"],
+            CassetteUsage(response["prompt_token_count"], response["candidates_token_count"]),
+        )
+
+
+_cassette: Cassette | None = (
+    Cassette(CASSETTE_PATH, CASSETTE_MODE) if CASSETTE_MODE in ("record", "replay") else None
+)
+
+
+def get_cassette() -> Cassette | None:
+    """The cassette of CASSETTE_MODE, None when calls are neither recorded nor replayed."""
+    return _cassette
@@ -0,0 +1,26 @@
+import logging
+
+from sqlalchemy import Connection, Engine, text
+
+
+_logger = logging.getLogger(__name__)
+
+
+def warm_up_pool(engine: Engine, connections: int) -> None:
+    """Open connections up front, so that requests do not pay for connection setup.
+
+    The connections are checked out at the same time, so the pool really holds that many
+    when they are returned. Failures are logged, the server can still start without the DB.
+    """
+    opened: list[Connection] = []
+    try:
+        for _ in range(connections):
+            connection: Connection = engine.connect()
+            opened.append(connection)
+            connection.execute(text("SELECT 1"))
+        _logger.error(f'[{__name__}] warmed up {len(opened)} connections.')
+    except Exception as e:
+        _logger.error(f'[{__name__}] failed to warm up connections. {e=}')
+    finally:
+        for connection in opened:
+            connection.close()
@@ -2,16 +2,47 @@ import logging
 import textwrap
 from typing import Any
 
+from constants import LANDMARK_MATCH_MIN_CONFIDENCE
 from landmarks import LAMDMARKS_LIST
 from models import get_model
+from server.cache import get_llm_cache
+from server.landmark_matcher import MAX_LANDMARKS, LandmarkMatch, match_landmarks
+from server.metrics import increment, record_llm_usage
+from server.retry import get_circuit_breaker, retry
 
 
 _logger = logging.getLogger(__name__)
 
+# Bump this when the prompt changes, so that cached results of the old prompt are not used.
+_PROMPT_VERSION: str = "3"
+_LANDMARKS: frozenset[str] = frozenset(LAMDMARKS_LIST)
+
 
 def extract_landmarks(preference: str) -> list[str]:
+    """Landmark types related to the preference.
+
+    Types named in the preference are found by the local matcher, the model is only asked when
+    the matcher is not confident enough. The types of the matcher are then only candidates given to
+    the model, and its reply decides. They are used if the model fails.
+    """
     _logger.error(f'[{__name__}] started.')
 
+    matched: LandmarkMatch = match_landmarks(preference)
+    if matched.confidence >= LANDMARK_MATCH_MIN_CONFIDENCE:
+        increment("landmark_extractions_total", source="matcher")
+        _logger.error(f'[{__name__}] completed with matcher. {matched.confidence=}')
+        return matched.landmarks
+
+    cached: list[str] | None = get_llm_cache().get("landmarks", _PROMPT_VERSION, preference)
+    if cached is not None:
+        _logger.error(f'[{__name__}] completed with cache.')
+        increment("landmark_extractions_total", source="cache")
+        return list(cached)
+
+    candidates: str = (
+        f"- 入力文から次のワードが候補として見つかりました。入力文に合うものだけを使うこと: {', '.join(matched.landmarks)}"
+        if matched.landmarks else ""
+    )
     prompt: str = textwrap.dedent(
         f"""
         入力文の内容に関連するワードをワードリストから抽出してください。
@@ -19,6 +50,7 @@ def extract_landmarks(preference: str) -> list[str]:
         - ワードはワードリストから選ぶこと。
         - 抽出するワードの数は最大 10 とすること。
         - 出力は次の出力例のようにカンマ区切りで出力すること。
+        {candidates}
         # 出力例
         例 1. museum, library, hospital
         例 2. outdoor, photo, bench
@@ -32,11 +64,22 @@ def extract_landmarks(preference: str) -> list[str]:
 
     landmarks: list[str] = []
     try:
-        response: Any = get_model().generate_content(prompt)
-        landmarks: list[str] = response.text.split(",")
+        response: Any = retry(
+            lambda: get_model().generate_content(prompt),
+            name="extract_landmarks",
+            breaker=get_circuit_breaker("model"),
+        )
+        record_llm_usage("landmarks", response)
+        # return only landmarks in the landmarks list
+        for part in response.text.split(","):
+            landmark: str = part.strip().strip("`'\"").lower()
+            if landmark in _LANDMARKS and landmark not in landmarks and len(landmarks) < MAX_LANDMARKS:
+                landmarks.append(landmark)
+        increment("landmark_extractions_total", source="model")
+        get_llm_cache().put("landmarks", _PROMPT_VERSION, preference, landmarks)
     except Exception as e:
         _logger.error(f"[{__name__}] failed to extract landmarks. {e=}")
+        landmarks = list(matched.landmarks)
 
     _logger.error(f'[{__name__}] completed.')
-    # return only landmarks in the landmarks list
-    return [landmark for landmark in landmarks if landmark in LAMDMARKS_LIST]
\ No newline at end of file
+    return landmarks
\ No newline at end of file
@@ -3,6 +3,8 @@ import textwrap
 from typing import Any
 
 from models import get_model
+from server.metrics import record_llm_usage
+from server.retry import get_circuit_breaker, retry
 
 
 _logger = logging.getLogger(__name__)
@@ -29,7 +31,12 @@ def generate_description(query: str, weights: dict[str, float]) -> str:
     )
 
     try:
-        response: Any = get_model().generate_content(prompt)
+        response: Any = retry(
+            lambda: get_model().generate_content(prompt),
+            name="generate_description",
+            breaker=get_circuit_breaker("model"),
+        )
+        record_llm_usage("description", response)
         description = response.text
     except Exception as e:
         _logger.error(f'[{__name__}] failed to generate description. {e=}')
@@ -1,14 +1,38 @@
 import logging
-from typing import Any
+import math
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+from typing import Any, Iterator
 
+import numpy as np
 from sqlalchemy import text
 
-from constants import MAX_RETRY_COUNT
+from constants import (
+    ALTERNATIVE_ROUTE_MAX_OVERLAP,
+    ALTERNATIVE_ROUTE_PENALTY,
+    BATCH_MAX_WORKERS,
+    HIERARCHY_MIN_BATCH_PAIRS,
+    ROUTE_CACHE_MAX_SIZE,
+    ROUTE_CACHE_WEIGHT_STEP,
+    ROUTE_ENGINE,
+)
+from server.cache import LruCache
+from server.cassette import Cassette, get_cassette
+from server.contraction import CustomizedMetric
+from server.retry import get_circuit_breaker, retry
+from server.route_graph import RouteGraph, RoutePath, get_route_graph
+from server.route_summary import RouteSummary, summarize_path
 
 
 _logger = logging.getLogger(__name__)
 
 
+class RouteNotFoundError(Exception):
+    """No route connects the start and the end, such as ends on parts of the graph not connected."""
+
+
 def get_routes(
     db,
     start_lat: float,
@@ -25,8 +49,349 @@ def get_routes(
     weight_landmarks: float,
     landmarks: list[str],
 ) -> tuple[str, str | None]:
-    _logger.error(f'[{__name__}] started.')
+    """Get the best route as (route GeoJSON, landmarks GeoJSON), like generate_route() in the database.
+
+    The edge lengths and summary of the route come with get_alternative_routes().
+    """
+    route_info, landmarks_info, _, _ = get_alternative_routes(
+        db,
+        start_lat=start_lat,
+        start_lon=start_lon,
+        end_lat=end_lat,
+        end_lon=end_lon,
+        weight_length=weight_length,
+        weight_green_index=weight_green_index,
+        weight_water_index=weight_water_index,
+        weight_shade_index=weight_shade_index,
+        weight_slope_index=weight_slope_index,
+        weight_road_safety=weight_road_safety,
+        weight_isolation=weight_isolation,
+        weight_landmarks=weight_landmarks,
+        landmarks=landmarks,
+        k=1,
+    )[0]
+    return route_info, landmarks_info
+
+
+def get_alternative_routes(
+    db,
+    start_lat: float,
+    start_lon: float,
+    end_lat: float,
+    end_lon: float,
+    weight_length: float,
+    weight_green_index: float,
+    weight_water_index: float,
+    weight_shade_index: float,
+    weight_slope_index: float,
+    weight_road_safety: float,
+    weight_isolation: float,
+    weight_landmarks: float,
+    landmarks: list[str],
+    k: int,
+) -> list[tuple[str, str | None, list[float] | None, RouteSummary | None]]:
+    """Get up to k diverse routes, the best first, as (route GeoJSON, landmarks GeoJSON, edge lengths, summary).
+
+    The edge lengths [m] are in the order of the lines of the route GeoJSON. The edge lengths and the summary
+    for the explanation are None with the "db" engine.
+    The alternatives share one snapping and one edge cost computation (see RouteGraph.alternative_paths()).
+    The "db" engine only returns the best route.
+    """
+    _logger.error(f'[{__name__}] started. {k=}')
+
+    if ROUTE_ENGINE == "db":
+        if k > 1:
+            _logger.error(f'[{__name__}] alternative routes are not supported by the db engine.')
+        return [(*_get_routes_from_db(
+            db,
+            start_lat=start_lat,
+            start_lon=start_lon,
+            end_lat=end_lat,
+            end_lon=end_lon,
+            weight_length=weight_length,
+            weight_green_index=weight_green_index,
+            weight_water_index=weight_water_index,
+            weight_shade_index=weight_shade_index,
+            weight_slope_index=weight_slope_index,
+            weight_road_safety=weight_road_safety,
+            weight_isolation=weight_isolation,
+            weight_landmarks=weight_landmarks,
+            landmarks=landmarks,
+        ), None, None)]
+
+    graph: RouteGraph = get_route_graph(db)
+    nodes, _ = graph.snapper.snap_many([start_lat, end_lat], [start_lon, end_lon])
+    source, target = nodes.tolist()
+
+    weights: list[float] = _quantize([
+        weight_length,
+        weight_green_index,
+        weight_water_index,
+        weight_shade_index,
+        weight_slope_index,
+        weight_road_safety,
+        weight_isolation,
+        weight_landmarks,
+    ])
+    # Landmarks are part of the key even without their weight, since the returned landmarks depend on them.
+    key: tuple = (graph.feature_version, source, target, tuple(weights), tuple(sorted(set(landmarks))), k)
+    routes: list[tuple[str, str | None, list[float] | None, RouteSummary | None]] | None = _route_cache.get(key)
+    if routes is not None:
+        _logger.error(f'[{__name__}] completed from cache. {len(routes)} routes.')
+        return list(routes)
+
+    edge_costs: np.ndarray = _edge_costs(graph, weights[:-1], weights[-1], landmarks)
 
+    paths: list[RoutePath]
+    if k > 1:
+        paths = graph.alternative_paths(
+            source,
+            target,
+            edge_costs,
+            k,
+            penalty=ALTERNATIVE_ROUTE_PENALTY,
+            max_overlap=ALTERNATIVE_ROUTE_MAX_OVERLAP,
+        )
+    else:
+        path: RoutePath | None = graph.shortest_path(source, target, edge_costs)
+        paths = [path] if path is not None else []
+    if not paths:
+        raise RouteNotFoundError("No route found.")
+
+    routes = [
+        (
+            graph.route_geojson(path),
+            graph.landmarks_geojson(path, landmarks),
+            graph.edge_lengths(path),
+            summarize_path(graph, path, landmarks),
+        )
+        for path in paths
+    ]
+    _route_cache.put(key, routes)
+    _logger.error(f'[{__name__}] completed. {len(paths)} routes.')
+    return list(routes)
+
+
+def get_routes_batch(
+    db,
+    pairs: list[tuple[float, float, float, float]],
+    weight_length: float,
+    weight_green_index: float,
+    weight_water_index: float,
+    weight_shade_index: float,
+    weight_slope_index: float,
+    weight_road_safety: float,
+    weight_isolation: float,
+    weight_landmarks: float,
+    landmarks: list[str],
+) -> Iterator[tuple[int, str | None, str | None, list[float] | None]]:
+    """Get the routes of many (start_lat, start_lon, end_lat, end_lon) pairs with the same weights.
+
+    Yields (index of the pair, route GeoJSON, landmarks GeoJSON, edge lengths) in the order the routes
+    are found, with None values when there is no route. Snapping and edge costs are computed once, pairs are
+    grouped by their start node so that one search finds the routes to all of its ends, and the groups
+    are searched in a process pool. With a contraction hierarchy and at least HIERARCHY_MIN_BATCH_PAIRS
+    pairs, the hierarchy is customized once for the batch and each pair is a query of it instead.
+    """
+    _logger.error(f'[{__name__}] batch started. {len(pairs)} pairs.')
+
+    if ROUTE_ENGINE == "db":
+        for index, (start_lat, start_lon, end_lat, end_lon) in enumerate(pairs):
+            try:
+                routes_info, landmarks_info = _get_routes_from_db(
+                    db,
+                    start_lat=start_lat,
+                    start_lon=start_lon,
+                    end_lat=end_lat,
+                    end_lon=end_lon,
+                    weight_length=weight_length,
+                    weight_green_index=weight_green_index,
+                    weight_water_index=weight_water_index,
+                    weight_shade_index=weight_shade_index,
+                    weight_slope_index=weight_slope_index,
+                    weight_road_safety=weight_road_safety,
+                    weight_isolation=weight_isolation,
+                    weight_landmarks=weight_landmarks,
+                    landmarks=landmarks,
+                )
+            except Exception as e:
+                _logger.error(f'[{__name__}] batch pair {index} failed. {e=}')
+                routes_info, landmarks_info = None, None
+            yield index, routes_info, landmarks_info, None
+        return
+
+    if not pairs:
+        return
+
+    graph: RouteGraph = get_route_graph(db)
+    coords: np.ndarray = np.array(pairs, dtype=np.float64).reshape(-1, 4)
+    sources, _ = graph.snapper.snap_many(coords[:, 0], coords[:, 1])
+    targets, _ = graph.snapper.snap_many(coords[:, 2], coords[:, 3])
+    edge_costs: np.ndarray = _edge_costs(
+        graph,
+        [
+            weight_length,
+            weight_green_index,
+            weight_water_index,
+            weight_shade_index,
+            weight_slope_index,
+            weight_road_safety,
+            weight_isolation,
+        ],
+        weight_landmarks,
+        landmarks,
+    )
+
+    # start node -> [(index of the pair, end node)]
+    groups: dict[int, list[tuple[int, int]]] = {}
+    for index, (source, target) in enumerate(zip(sources.tolist(), targets.tolist())):
+        groups.setdefault(source, []).append((index, target))
+
+    # Customizing costs more than a few Dijkstra searches, so it only pays off for larger batches.
+    metric: CustomizedMetric | None = None
+    if graph.hierarchy is not None and len(pairs) >= HIERARCHY_MIN_BATCH_PAIRS:
+        metric = graph.hierarchy.customize(edge_costs)
+
+    # A few chunks per worker balance the load, while sending the edge costs only once per chunk.
+    group_items: list[tuple[int, list[tuple[int, int]]]] = list(groups.items())
+    chunk_size: int = max(1, math.ceil(len(group_items) / (4 * BATCH_MAX_WORKERS)))
+    futures: list[Future] = _submit_route_groups(
+        graph,
+        [group_items[begin:begin + chunk_size] for begin in range(0, len(group_items), chunk_size)],
+        edge_costs,
+        metric,
+        landmarks,
+    )
+    for future in as_completed(futures):
+        yield from future.result()
+
+    _logger.error(f'[{__name__}] batch completed. {len(groups)} start nodes.')
+
+
+# Results of the graph engine. Keys contain the version of the edge features, so results of
+# a reloaded graph never mix with the previous ones, which are evicted over time.
+_route_cache: LruCache = LruCache(ROUTE_CACHE_MAX_SIZE)
+
+
+def get_route_cache() -> LruCache:
+    return _route_cache
+
+
+def _quantize(weights: list[float]) -> list[float]:
+    """Round the weights to multiples of ROUTE_CACHE_WEIGHT_STEP, so near-identical weights share a key."""
+    if ROUTE_CACHE_WEIGHT_STEP <= 0:
+        return [float(weight) for weight in weights]
+    return [round(round(weight / ROUTE_CACHE_WEIGHT_STEP) * ROUTE_CACHE_WEIGHT_STEP, 10) for weight in weights]
+
+
+def _edge_costs(
+    graph: RouteGraph, weights: list[float], weight_landmarks: float, landmarks: list[str]
+) -> np.ndarray:
+    landmark_counts: np.ndarray | None = None
+    if weight_landmarks and landmarks:
+        landmark_counts = graph.landmark_counts(landmarks)
+    return graph.edge_costs(np.array(weights), weight_landmarks, landmark_counts)
+
+
+_batch_executor: ProcessPoolExecutor | None = None
+# Graph sent to the workers of _batch_executor.
+_batch_executor_graph: RouteGraph | None = None
+_batch_executor_lock: threading.Lock = threading.Lock()
+# Graph of a batch worker process, set by _init_batch_worker().
+_worker_graph: RouteGraph | None = None
+
+
+def _submit_route_groups(
+    graph: RouteGraph,
+    chunks: list[list[tuple[int, list[tuple[int, int]]]]],
+    edge_costs: np.ndarray,
+    metric: CustomizedMetric | None,
+    landmarks: list[str],
+) -> list[Future]:
+    """Search the chunks of groups in the process pool of batches, whose workers hold the given graph.
+
+    The workers receive the graph once when they start, so the pool is replaced when the graph is, e.g.
+    after a reload on a new version of edge_features. Batches already submitted to the previous pool
+    finish on it. Submitting under the lock keeps a concurrent replacement from shutting the pool down
+    between its creation and the submissions.
+    """
+    global _batch_executor, _batch_executor_graph
+    with _batch_executor_lock:
+        if _batch_executor is None or _batch_executor_graph is not graph:
+            if _batch_executor is not None:
+                _logger.error(f'[{__name__}] graph changed, replacing the batch workers.')
+                _batch_executor.shutdown(wait=False)
+            # Forking a process running threads may copy locks held by other threads, so spawn the workers.
+            _batch_executor = ProcessPoolExecutor(
+                max_workers=BATCH_MAX_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_batch_worker,
+                initargs=(graph,),
+            )
+            _batch_executor_graph = graph
+        return [_batch_executor.submit(_route_groups, chunk, edge_costs, metric, landmarks) for chunk in chunks]
+
+
+def _init_batch_worker(graph: RouteGraph) -> None:
+    global _worker_graph
+    _worker_graph = graph
+
+
+def _route_groups(
+    groups: list[tuple[int, list[tuple[int, int]]]],
+    edge_costs: np.ndarray,
+    metric: CustomizedMetric | None,
+    landmarks: list[str],
+) -> list[tuple[int, str | None, str | None, list[float] | None]]:
+    """Search the routes of the pairs of each start node, in a batch worker process.
+
+    With a customized metric, each pair is a query of the hierarchy, otherwise one Dijkstra search
+    finds the routes to all the ends of a start node.
+    """
+    results: list[tuple[int, str | None, str | None, list[float] | None]] = []
+    for source, ends in groups:
+        paths: dict[int, RoutePath]
+        if metric is not None:
+            paths = {
+                target: path for _, target in ends
+                if (path := _worker_graph.hierarchy_path(metric, source, target)) is not None
+            }
+        else:
+            paths = _worker_graph.shortest_paths(source, [target for _, target in ends], edge_costs)
+        for index, target in ends:
+            path: RoutePath | None = paths.get(target)
+            if path is None:
+                results.append((index, None, None, None))
+            else:
+                results.append((
+                    index,
+                    _worker_graph.route_geojson(path),
+                    _worker_graph.landmarks_geojson(path, landmarks),
+                    _worker_graph.edge_lengths(path),
+                ))
+    return results
+
+
+def _get_routes_from_db(
+    db,
+    start_lat: float,
+    start_lon: float,
+    end_lat: float,
+    end_lon: float,
+    weight_length: float,
+    weight_green_index: float,
+    weight_water_index: float,
+    weight_shade_index: float,
+    weight_slope_index: float,
+    weight_road_safety: float,
+    weight_isolation: float,
+    weight_landmarks: float,
+    landmarks: list[str],
+) -> tuple[str, str | None]:
+    """Get routes with the generate_route() function in the database.
+
+    With CASSETTE_MODE, the results are recorded, or replayed without the database.
+    """
     sql: str = text(
         """
         SELECT * FROM generate_route(
@@ -47,43 +412,48 @@ def get_routes(
         """
     )
 
-    for retry_count in range(MAX_RETRY_COUNT):
-        try:
-            response: Any = db.session.execute(
-                sql,
-                {
-                    "weight_length": weight_length,
-                    "weight_green_index": weight_green_index,
-                    "weight_water_index": weight_water_index,
-                    "weight_shade_index": weight_shade_index,
-                    "weight_slope_index": weight_slope_index,
-                    "weight_road_safety": weight_road_safety,
-                    "weight_isolation": weight_isolation,
-                    "weight_landmarks": weight_landmarks,
-                    "landmarks": landmarks,
-                    "start_lat": start_lat,
-                    "start_lon": start_lon,
-                    "end_lat": end_lat,
-                    "end_lon": end_lon,
-                },
-            )
-            row: Any = response.fetchone()
-
-            if not row:
-                raise Exception("No route found.")
+    params: dict[str, Any] = {
+        "weight_length": weight_length,
+        "weight_green_index": weight_green_index,
+        "weight_water_index": weight_water_index,
+        "weight_shade_index": weight_shade_index,
+        "weight_slope_index": weight_slope_index,
+        "weight_road_safety": weight_road_safety,
+        "weight_isolation": weight_isolation,
+        "weight_landmarks": weight_landmarks,
+        "landmarks": landmarks,
+        "start_lat": start_lat,
+        "start_lon": start_lon,
+        "end_lat": end_lat,
+        "end_lon": end_lon,
+    }
 
-            route_info: str = row[0]
-            landmarks_info: str | None = row[1] if len(row) > 1 else None
-        except Exception as e:
+    def query() -> Any:
+        try:
+            return db.session.execute(sql, params).fetchone()
+        except Exception:
             db.session.rollback()
-            _logger.error(f"[{__name__}] failed to get routes. {e=}")
-
-            if retry_count > MAX_RETRY_COUNT:
-                raise e
+            raise
 
-            _logger.error(f"[{__name__}] retry: {retry_count + 1}.")
+    cassette: Cassette | None = get_cassette()
+    row: Any
+    if cassette is not None and cassette.replaying:
+        row = cassette.replay("generate_route", params)
+    else:
+        started_at: float = time.perf_counter()
+        try:
+            row = retry(query, name="generate_route", breaker=get_circuit_breaker("db"))
         finally:
             db.session.close()
+        if cassette is not None:
+            cassette.record("generate_route", params, list(row) if row else None, time.perf_counter() - started_at)
+
+    # generate_route() returns NULLs when there is no route, retrying would not help.
+    if not row or row[0] is None:
+        raise RouteNotFoundError("No route found.")
+
+    route_info: str = row[0]
+    landmarks_info: str | None = row[1] if len(row) > 1 else None
 
     _logger.error(f'[{__name__}] completed.')
     return route_info, landmarks_info
@@ -0,0 +1,114 @@
+import collections
+import dataclasses
+import re
+
+from server.cache import normalize_text
+
+
+_WORD_CHARACTER = re.compile(r"[a-z0-9]")
+# Negations of what a keyword names, as in "the park was not green" or "緑じゃない道". "ない" alone is not one:
+# "人混みのない" or "坂のない" still ask for the factor of the keyword.
+_NEGATION = re.compile(r"\b(?:not|no|never|without|nor|[a-z]+n't)\b|じゃな|ではな|以外")
+# Share of the characters of a text covered by keywords above which the text is taken as fully understood,
+# low enough for "緑の多い道".
+_FULL_COVERAGE: float = 0.15
+# The confidence of n keywords is n / (n + _KEYWORD_DOUBT), 0.67 for a single one.
+_KEYWORD_DOUBT: float = 0.5
+
+
+@dataclasses.dataclass
+class KeywordMatch:
+    """Labels whose keywords are found in a text."""
+
+    # label -> number of its keywords in the text, in the order the labels were found
+    scores: dict[str, float]
+    # in [0, 1], see KeywordMatcher.match()
+    confidence: float
+
+
+class KeywordMatcher:
+    """Scores the labels whose keywords are found in a text, with an index of keywords by first characters.
+
+    Keywords are indexed by their first two characters (the first one for one-character keywords),
+    so a text is matched with a couple of lookups per character, whatever the number of keywords.
+    At each position the longest keyword is taken, so "調剤薬局" does not also count as "薬局".
+    ASCII keywords only match whole words.
+    """
+
+    def __init__(self, keywords: dict[str, list[str]], stop_phrases: list[str] = ()):
+        """keywords: label -> keywords naming it.
+        stop_phrases: phrases containing keywords without naming their labels, such as the place name "品川"
+        for "川", which are skipped like keywords of no label.
+        """
+        # normalized keyword -> labels it names
+        labels_of: dict[str, set[str]] = collections.defaultdict(set)
+        for label, label_keywords in keywords.items():
+            for keyword in label_keywords:
+                labels_of[normalize_text(keyword)].add(label)
+        for phrase in stop_phrases:
+            labels_of[normalize_text(phrase)] = set()
+
+        # first characters -> (keyword, labels), the longest keywords first
+        self._index: dict[str, list[tuple[str, tuple[str, ...]]]] = collections.defaultdict(list)
+        for keyword, labels in sorted(labels_of.items(), key=lambda item: -len(item[0])):
+            self._index[keyword[:2]].append((keyword, tuple(sorted(labels))))
+
+    def match(self, text: str) -> KeywordMatch:
+        """Scores of the labels of the keywords in the text, and how much they can be trusted.
+
+        A keyword naming several labels, like "休憩" (cafe, bench), adds less to each of them. The confidence
+        grows with the number of keywords, n / (n + _KEYWORD_DOUBT), so a single keyword naming one label
+        is enough for 0.67. It is scaled by the share of the keywords naming a single label, and lowered
+        for texts mostly not covered by keywords. Which keyword a negation applies to is not known, so a
+        negated text matches nothing, with a confidence of 0, and is left to the model.
+        """
+        text = normalize_text(text)
+        scores: dict[str, float] = {}
+        if _NEGATION.search(text):
+            return KeywordMatch(scores, 0.0)
+
+        keywords: int = 0
+        specific_keywords: int = 0
+        covered: int = 0
+        i: int = 0
+        while i < len(text):
+            found: tuple[str, tuple[str, ...]] | None = self._longest_keyword(text, i)
+            if found is None:
+                i += 1
+                continue
+            keyword, labels = found
+            i += len(keyword)
+            if not labels:
+                continue
+            for label in labels:
+                scores[label] = scores.get(label, 0.0) + 1 / len(labels)
+            keywords += 1
+            specific_keywords += len(labels) == 1
+            covered += sum(char.isalnum() for char in keyword)
+
+        if keywords == 0:
+            return KeywordMatch(scores, 0.0)
+        content: int = sum(char.isalnum() for char in text)
+        confidence: float = (
+            keywords / (keywords + _KEYWORD_DOUBT)
+            * specific_keywords / keywords
+            * min(1.0, covered / content / _FULL_COVERAGE)
+        )
+        return KeywordMatch(scores, confidence)
+
+    def _longest_keyword(self, text: str, i: int) -> tuple[str, tuple[str, ...]] | None:
+        for key in (text[i:i + 2], text[i]):
+            for keyword, labels in self._index.get(key, ()):
+                if text.startswith(keyword, i) and _is_whole_word(text, i, keyword):
+                    return keyword, labels
+        return None
+
+
+def _is_whole_word(text: str, start: int, keyword: str) -> bool:
+    if not keyword.isascii():
+        return True
+    end: int = start + len(keyword)
+    return (
+        (start == 0 or not _WORD_CHARACTER.match(text[start - 1]))
+        and (end == len(text) or not _WORD_CHARACTER.match(text[end]))
+    )
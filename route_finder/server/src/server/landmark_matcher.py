@@ -0,0 +1,35 @@
+import dataclasses
+
+from landmarks import LANDMARK_KEYWORDS, LANDMARK_STOP_PHRASES
+from server.keyword_matcher import KeywordMatch, KeywordMatcher
+
+
+# max number of landmark types of a preference, as asked to the model
+MAX_LANDMARKS: int = 10
+
+
+@dataclasses.dataclass
+class LandmarkMatch:
+    """Landmark types found in a text, the most named first."""
+
+    landmarks: list[str]
+    # in [0, 1], see KeywordMatcher.match(): 0 without keywords or with a negation, 0.67 for a single keyword
+    confidence: float
+
+
+# The type itself, with spaces for underscores, is also a keyword.
+_matcher: KeywordMatcher = KeywordMatcher(
+    {
+        landmark_type: [landmark_type.replace("_", " "), *keywords]
+        for landmark_type, keywords in LANDMARK_KEYWORDS.items()
+    },
+    LANDMARK_STOP_PHRASES,
+)
+
+
+def match_landmarks(text: str) -> LandmarkMatch:
+    """Landmark types named in the text, found locally in microseconds."""
+    match: KeywordMatch = _matcher.match(text)
+    # sorted() is stable, so types with the same score stay in the order they were found.
+    landmarks: list[str] = sorted(match.scores, key=lambda landmark_type: -match.scores[landmark_type])[:MAX_LANDMARKS]
+    return LandmarkMatch(landmarks, match.confidence)
@@ -0,0 +1,156 @@
+import contextlib
+import contextvars
+import random
+import threading
+import time
+from typing import Any, Iterator
+
+from constants import LOG_SAMPLE_RATE
+
+
+# Upper bounds [seconds] of the buckets of the duration histograms.
+DURATION_BUCKETS: tuple[float, ...] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+_PREFIX: str = "route_finder"
+
+
+class Histogram:
+    """Cumulative histogram of observed values, like a Prometheus histogram."""
+
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets: tuple[float, ...] = buckets
+        self.counts: list[int] = [0] * len(buckets)
+        self.count: int = 0
+        self.sum: float = 0.0
+
+    def observe(self, value: float) -> None:
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+
+# (metric name, sorted label items) -> Histogram or counter value, for the whole process.
+_histograms: dict[tuple[str, tuple[tuple[str, str], ...]], Histogram] = {}
+_counters: dict[tuple[str, tuple[tuple[str, str], ...]], float] = {}
+_lock: threading.Lock = threading.Lock()
+
+
+def observe(name: str, value: float, **labels: str) -> None:
+    """Add a value to the histogram of the metric with these labels."""
+    key: tuple[str, tuple[tuple[str, str], ...]] = (name, tuple(sorted(labels.items())))
+    with _lock:
+        histogram: Histogram | None = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = Histogram(DURATION_BUCKETS)
+        histogram.observe(value)
+
+
+def increment(name: str, value: float = 1, **labels: str) -> None:
+    """Add a value to the counter of the metric with these labels."""
+    key: tuple[str, tuple[tuple[str, str], ...]] = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def render() -> str:
+    """All the metrics in the Prometheus text exposition format."""
+    lines: list[str] = []
+    with _lock:
+        for name in sorted({name for name, _ in _histograms}):
+            lines.append(f"# TYPE {_PREFIX}_{name} histogram")
+            for (histogram_name, labels), histogram in sorted(_histograms.items()):
+                if histogram_name != name:
+                    continue
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    lines.append(f"{_PREFIX}_{name}_bucket{_labels(labels, le=str(bound))} {count}")
+                lines.append(f"{_PREFIX}_{name}_bucket{_labels(labels, le='+Inf')} {histogram.count}")
+                lines.append(f"{_PREFIX}_{name}_sum{_labels(labels)} {histogram.sum}")
+                lines.append(f"{_PREFIX}_{name}_count{_labels(labels)} {histogram.count}")
+        for name in sorted({name for name, _ in _counters}):
+            lines.append(f"# TYPE {_PREFIX}_{name} counter")
+            for (counter_name, labels), value in sorted(_counters.items()):
+                if counter_name == name:
+                    lines.append(f"{_PREFIX}_{name}{_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def _labels(labels: tuple[tuple[str, str], ...], **extra: str) -> str:
+    items: list[tuple[str, str]] = list(labels) + list(extra.items())
+    if not items:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in items) + "}"
+
+
+class RequestMetrics:
+    """Stage timings of one request, and whether its details are logged."""
+
+    def __init__(self, sampled: bool):
+        self.sampled: bool = sampled
+        self.started_at: float = time.perf_counter()
+        # stage -> total seconds, in the order the stages started
+        self.timings: dict[str, float] = {}
+        self._lock: threading.Lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.timings[stage] = self.timings.get(stage, 0.0) + seconds
+
+    def timings_ms(self) -> dict[str, float]:
+        with self._lock:
+            return {stage: round(seconds * 1000, 1) for stage, seconds in self.timings.items()}
+
+    def server_timing(self) -> str:
+        """Value of the Server-Timing header, with durations in milliseconds."""
+        return ", ".join(f"{stage};dur={duration}" for stage, duration in self.timings_ms().items())
+
+
+# The metrics of the current request. Pipeline stages run with a copy of the request's context,
+# so they add to the same object.
+_request_metrics: contextvars.ContextVar[RequestMetrics | None] = contextvars.ContextVar(
+    "request_metrics", default=None
+)
+
+
+def start_request() -> RequestMetrics:
+    """Start collecting the timings of the current request, sampled for logging at LOG_SAMPLE_RATE."""
+    metrics: RequestMetrics = RequestMetrics(random.random() < LOG_SAMPLE_RATE)
+    _request_metrics.set(metrics)
+    return metrics
+
+
+def get_request_metrics() -> RequestMetrics | None:
+    return _request_metrics.get()
+
+
+def sampled() -> bool:
+    """Whether the details of the current request should be logged."""
+    metrics: RequestMetrics | None = _request_metrics.get()
+    return metrics is not None and metrics.sampled
+
+
+@contextlib.contextmanager
+def timer(stage: str) -> Iterator[None]:
+    """Time a stage, for the Server-Timing of the request and the stage_seconds histogram.
+
+    Stages named "<stage>:<suffix>" are recorded as <stage>, adding up their durations.
+    """
+    stage = stage.partition(":")[0]
+    started_at: float = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds: float = time.perf_counter() - started_at
+        observe("stage_seconds", seconds, stage=stage)
+        metrics: RequestMetrics | None = _request_metrics.get()
+        if metrics is not None:
+            metrics.add(stage, seconds)
+
+
+def record_llm_usage(stage: str, response: Any) -> None:
+    """Count the prompt and output tokens of a generate_content() response."""
+    usage: Any = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return
+    increment("llm_tokens_total", getattr(usage, "prompt_token_count", 0) or 0, stage=stage, kind="prompt")
+    increment("llm_tokens_total", getattr(usage, "candidates_token_count", 0) or 0, stage=stage, kind="output")
@@ -0,0 +1,55 @@
+import logging
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from request_response_data import Location
+
+
+_logger = logging.getLogger(__name__)
+
+_METERS_PER_DEGREE: float = 111_320.0
+
+
+class NodeSnapper:
+    """Snaps locations to the closest graph node with a KD-tree over node coordinates.
+
+    Coordinates are projected to a local equirectangular plane around the center of
+    the nodes, so the Euclidean distance in the tree is approximately in meters.
+    A query costs O(log N), so it stays flat as the covered area grows.
+    """
+
+    def __init__(self, node_coords: np.ndarray):
+        """node_coords: (N, 2) array of (longitude, latitude)."""
+        self._origin: np.ndarray = (
+            node_coords.mean(axis=0) if len(node_coords) > 0 else np.zeros(2)
+        )
+        self._scale: np.ndarray = _METERS_PER_DEGREE * np.array(
+            [np.cos(np.radians(self._origin[1])), 1.0]
+        )
+        self._tree: cKDTree = cKDTree(self._project(node_coords))
+        _logger.error(f'[{__name__}] built index. nodes={len(node_coords)}')
+
+    def _project(self, coords: np.ndarray) -> np.ndarray:
+        return (coords - self._origin) * self._scale
+
+    def snap(self, location: Location) -> int:
+        """Index of the node closest to the location."""
+        _, index = self._tree.query(self._project(np.array([location.longitude, location.latitude])))
+        return int(index)
+
+    def snap_many(self, latitudes: np.ndarray, longitudes: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Indices of the nodes closest to each point, and the distances to them in meters."""
+        points: np.ndarray = np.column_stack([
+            np.asarray(longitudes, dtype=np.float64), np.asarray(latitudes, dtype=np.float64)
+        ])
+        distances, indices = self._tree.query(self._project(points))
+        return indices.astype(np.int64), distances
+
+    def snap_locations(self, locations: list[Location]) -> np.ndarray:
+        """Indices of the nodes closest to each location."""
+        indices, _ = self.snap_many(
+            [location.latitude for location in locations],
+            [location.longitude for location in locations],
+        )
+        return indices
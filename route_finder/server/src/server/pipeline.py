@@ -0,0 +1,62 @@
+import contextvars
+import logging
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, TypeVar
+
+from constants import PIPELINE_MAX_WORKERS, STAGE_DEADLINES
+from server.metrics import timer
+
+
+_logger = logging.getLogger(__name__)
+
+_T = TypeVar("_T")
+
+# Shared by all requests, so the number of concurrent LLM calls of the process is bounded.
+_executor: ThreadPoolExecutor = ThreadPoolExecutor(
+    max_workers=PIPELINE_MAX_WORKERS, thread_name_prefix="pipeline"
+)
+
+
+class SearchPipeline:
+    """Runs independent stages of one search request concurrently.
+
+    Each stage has a deadline measured from the start of the pipeline (see
+    STAGE_DEADLINES). If a stage fails or misses its deadline, its default value
+    is used instead, so the request waits for the critical path only.
+    """
+
+    def __init__(self):
+        self._started_at: float = time.monotonic()
+        self._futures: dict[str, Future] = {}
+
+    def submit(self, name: str, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> None:
+        """Start the stage in the background, in a copy of the current context, timed as `name`."""
+        def run() -> Any:
+            with timer(name):
+                return fn(*args, **kwargs)
+
+        context: contextvars.Context = contextvars.copy_context()
+        self._futures[name] = _executor.submit(context.run, run)
+
+    def done(self, name: str) -> bool:
+        """Whether the stage has finished, without waiting for it."""
+        return self._futures[name].done()
+
+    def result(self, name: str, default: _T) -> _T:
+        """Wait for the stage until its deadline.
+
+        Stages named "<stage>:<suffix>", such as "explanation:1" for one of several routes,
+        share the deadline of <stage>.
+        """
+        future: Future = self._futures.pop(name)
+        deadline: float = STAGE_DEADLINES[name.partition(":")[0]]
+        timeout: float = max(0.0, deadline - (time.monotonic() - self._started_at))
+        try:
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            future.cancel()
+            _logger.error(f"[{__name__}] stage {name} missed its deadline of {deadline}s.")
+        except Exception as e:
+            _logger.error(f"[{__name__}] stage {name} failed. {e=}")
+        return default
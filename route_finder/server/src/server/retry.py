@@ -0,0 +1,172 @@
+import contextvars
+import logging
+import random
+import threading
+import time
+from typing import Callable, TypeVar
+
+from constants import (
+    CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+    CIRCUIT_BREAKER_RESET_SECONDS,
+    MAX_RETRY_COUNT,
+    RETRY_BASE_DELAY_SECONDS,
+    RETRY_MAX_DELAY_SECONDS,
+)
+from server.metrics import increment
+
+
+_logger = logging.getLogger(__name__)
+
+_T = TypeVar("_T")
+
+
+class NotRetryableError(Exception):
+    """Error that retrying would not fix, raised at once by retry() and not counted by breakers."""
+
+
+class CircuitOpenError(NotRetryableError):
+    """Raised instead of calling a dependency whose circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """Stops calling a failing dependency for a while.
+
+    After `failure_threshold` consecutive failures the circuit opens and calls fail
+    fast for `reset_seconds`. Then a single trial call is let through: its success
+    closes the circuit, its failure opens it again.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, reset_seconds: float):
+        self.name: str = name
+        self._failure_threshold: int = failure_threshold
+        self._reset_seconds: float = reset_seconds
+        self._failures: int = 0
+        self._opened_at: float | None = None
+        self._trial_running: bool = False
+        self._lock: threading.Lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened_at is not None
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._trial_running or time.monotonic() - self._opened_at < self._reset_seconds:
+                return False
+            self._trial_running = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def release_trial(self) -> None:
+        """End a trial call that neither succeeded nor failed, so that the next call is a trial again."""
+        with self._lock:
+            self._trial_running = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._trial_running or (self._opened_at is None and self._failures >= self._failure_threshold):
+                _logger.error(f"[{__name__}] circuit {self.name} opened.")
+                self._opened_at = time.monotonic()
+                self._trial_running = False
+
+
+_circuit_breakers: dict[str, CircuitBreaker] = {}
+_circuit_breakers_lock: threading.Lock = threading.Lock()
+
+
+def get_circuit_breaker(name: str) -> CircuitBreaker:
+    """Process-wide circuit breaker of a dependency, such as "model" or "db"."""
+    with _circuit_breakers_lock:
+        if name not in _circuit_breakers:
+            _circuit_breakers[name] = CircuitBreaker(
+                name, CIRCUIT_BREAKER_FAILURE_THRESHOLD, CIRCUIT_BREAKER_RESET_SECONDS
+            )
+        return _circuit_breakers[name]
+
+
+class RetryBudget:
+    """Number of retries left for one request, shared by all of its stages."""
+
+    def __init__(self, retries: int):
+        self._remaining: int = retries
+        self._lock: threading.Lock = threading.Lock()
+
+    def consume(self) -> bool:
+        with self._lock:
+            if self._remaining <= 0:
+                return False
+            self._remaining -= 1
+            return True
+
+
+# The budget of the current request. Pipeline stages run with a copy of the request's context,
+# so they share the same budget object.
+_retry_budget: contextvars.ContextVar[RetryBudget | None] = contextvars.ContextVar(
+    "retry_budget", default=None
+)
+
+
+def start_retry_budget(retries: int) -> None:
+    """Limit the total number of retries of the current request."""
+    _retry_budget.set(RetryBudget(retries))
+
+
+def call_with_breaker(fn: Callable[[], _T], breaker: CircuitBreaker) -> _T:
+    """Call fn once through the breaker, raising CircuitOpenError without calling it when open."""
+    if not breaker.allow():
+        raise CircuitOpenError(f"Circuit {breaker.name} is open.")
+
+    try:
+        result: _T = fn()
+    except NotRetryableError:
+        # Not a failure of the dependency, but a trial call must not keep the circuit open forever.
+        breaker.release_trial()
+        raise
+    except Exception:
+        breaker.record_failure()
+        raise
+
+    breaker.record_success()
+    return result
+
+
+def retry(
+    fn: Callable[[], _T],
+    name: str,
+    breaker: CircuitBreaker | None = None,
+    max_attempts: int = MAX_RETRY_COUNT,
+    base_delay: float = RETRY_BASE_DELAY_SECONDS,
+    max_delay: float = RETRY_MAX_DELAY_SECONDS,
+) -> _T:
+    """Call fn until it succeeds, with exponential backoff and full jitter between attempts.
+
+    The last error is raised when the attempts or the request's retry budget run out.
+    With a breaker, each attempt goes through call_with_breaker() and an open circuit
+    is not retried, nor is any other NotRetryableError.
+    """
+    for attempt in range(max_attempts):
+        try:
+            return fn() if breaker is None else call_with_breaker(fn, breaker)
+        except NotRetryableError:
+            raise
+        except Exception as e:
+            _logger.error(f"[{__name__}] {name} failed. {e=}")
+
+            budget: RetryBudget | None = _retry_budget.get()
+            if attempt + 1 >= max_attempts or (budget is not None and not budget.consume()):
+                raise e
+
+            increment("retries_total", stage=name)
+            delay: float = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+            _logger.error(f"[{__name__}] {name} retry: {attempt + 1} in {delay:.2f}s.")
+            time.sleep(delay)
+
+    raise ValueError("max_attempts must be positive.")
@@ -0,0 +1,281 @@
+import dataclasses
+import math
+from typing import Any
+
+import numpy as np
+import orjson
+
+from request_response_data import Location, RouteEncoding
+
+# Meters per degree of latitude, for planar distances.
+_METERS_PER_DEGREE: float = 111320.0
+# Mean radius [m] of the earth, for great-circle distances.
+_EARTH_RADIUS: float = 6371008.8
+# Decimal digits of the coordinates used to match the ends of segments.
+_ENDPOINT_DIGITS: int = 9
+# Precision of encoded polylines if not given, the one of the Google Maps APIs.
+DEFAULT_POLYLINE_PRECISION: int = 5
+
+
+@dataclasses.dataclass
+class EncodedRoute:
+    """Route geometry as it is sent in responses, see RouteEncoding."""
+
+    path_geo_json: dict | None
+    paths: list[Location]
+    path_polyline: str | None
+    # Distance [m] from the start to each point of paths (or of the polyline), empty for "geojson".
+    cumulative_distances: list[float]
+
+
+def encode_route(
+    geometry: dict[str, Any],
+    edge_lengths: list[float],
+    encoding: RouteEncoding,
+    start: Location | None = None,
+    ordered: bool = False,
+) -> EncodedRoute:
+    """Encode the geometry of a route (a MultiLineString of its edges) in the requested format.
+
+    The segments are merged into one line for the "linestring" and "polyline" formats, whose points get
+    their distance from the start from `edge_lengths`, the length [m] of each segment. See merge_lines()
+    for `start` and `ordered`.
+    """
+    if encoding.format == "geojson":
+        lines: list[np.ndarray] = []
+        for line in geometry_lines(geometry):
+            coords: np.ndarray = np.asarray(line, dtype=np.float64)
+            lines.append(_round(coords[douglas_peucker(coords, encoding.simplify)], encoding.precision))
+        return EncodedRoute(
+            path_geo_json=_feature_collection(
+                {"type": "MultiLineString", "coordinates": [line.tolist() for line in lines]}
+            ),
+            paths=[],
+            path_polyline=None,
+            cumulative_distances=[],
+        )
+
+    coords, distances = merge_lines(
+        geometry_lines(geometry), edge_lengths, (start.longitude, start.latitude) if start else None, ordered
+    )
+    keep: np.ndarray = douglas_peucker(coords, encoding.simplify)
+    coords, distances = coords[keep], distances[keep]
+    if encoding.format == "polyline":
+        precision: int = DEFAULT_POLYLINE_PRECISION if encoding.precision is None else encoding.precision
+        return EncodedRoute(
+            path_geo_json=None,
+            paths=[],
+            path_polyline=encode_polyline(coords, precision),
+            cumulative_distances=np.round(distances, 1).tolist(),
+        )
+
+    coords = _round(coords, encoding.precision)
+    return EncodedRoute(
+        path_geo_json=_feature_collection({"type": "LineString", "coordinates": coords.tolist()}),
+        paths=[Location(lat, lon) for lon, lat in coords.tolist()],
+        path_polyline=None,
+        cumulative_distances=np.round(distances, 1).tolist(),
+    )
+
+
+def merge_lines(
+    lines: list[list[list[float]]],
+    lengths: list[float],
+    start: tuple[float, float] | None = None,
+    ordered: bool = False,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Chain the segments of a route into one ordered line of (lon, lat) points.
+
+    With `ordered`, the segments are already in walking order and direction, like the routes of the
+    graph engine, and are only concatenated. Otherwise, as for the "db" engine, segments are joined at
+    their shared end points and reversed where needed, which cannot tell the order of a route passing
+    a node twice. The line then starts at the loose end nearest to `start`. If the segments are not
+    connected, the gap is bridged to the nearest end of the remaining segments.
+
+    Also returns the distance from the start of each point. The length of each segment is taken from
+    `lengths` and split among its points in proportion to their planar distances.
+    """
+    segments: list[np.ndarray] = []
+    along: list[np.ndarray] = []
+    for line, length in zip(lines, lengths):
+        if len(line) > 0:
+            segments.append(np.asarray(line, dtype=np.float64)[:, :2])
+            along.append(_fractions(segments[-1]) * length)
+    if not segments:
+        return np.empty((0, 2)), np.empty(0)
+    if ordered:
+        return _concatenate_lines(segments, along)
+
+    ends: dict[tuple[float, float], list[tuple[int, bool]]] = {}
+    for index, segment in enumerate(segments):
+        for reverse, point in ((False, segment[0]), (True, segment[-1])):
+            ends.setdefault(_key(point), []).append((index, reverse))
+
+    # The loose ends of a path are shared by an odd number of segment ends.
+    loose: list[tuple[int, bool]] = [incident[0] for incident in ends.values() if len(incident) % 2 == 1]
+    candidates: list[tuple[int, bool]] = loose or [(0, False)]
+    if start is not None:
+        first: tuple[int, bool] = min(candidates, key=lambda end: _distance(_first_point(segments, end), start))
+    else:
+        first = candidates[0]
+
+    used: np.ndarray = np.zeros(len(segments), dtype=bool)
+    parts: list[np.ndarray] = []
+    distances: list[np.ndarray] = []
+    covered: float = 0.0
+    current: tuple[int, bool] | None = first
+    while current is not None:
+        index, reverse = current
+        used[index] = True
+        segment: np.ndarray = segments[index][::-1] if reverse else segments[index]
+        segment_along: np.ndarray = along[index][-1] - along[index][::-1] if reverse else along[index]
+        skip: int = 1 if parts else 0
+        parts.append(segment[skip:])
+        distances.append(covered + segment_along[skip:])
+        covered += float(along[index][-1])
+
+        last: np.ndarray = segment[-1]
+        current = next(
+            ((other, other_reverse) for other, other_reverse in ends[_key(last)] if not used[other]), None
+        )
+        if current is None and not used.all():
+            remaining: list[tuple[int, bool]] = [
+                (other, other_reverse) for other in np.flatnonzero(~used).tolist() for other_reverse in (False, True)
+            ]
+            current = min(remaining, key=lambda end: _distance(_first_point(segments, end), last))
+            parts.append(_first_point(segments, current)[None, :])
+            distances.append(np.array([covered]))
+    return np.concatenate(parts), np.concatenate(distances)
+
+
+def _concatenate_lines(segments: list[np.ndarray], along: list[np.ndarray]) -> tuple[np.ndarray, np.ndarray]:
+    """Points and distances of segments in walking order, without the repeated joints."""
+    parts: list[np.ndarray] = []
+    distances: list[np.ndarray] = []
+    covered: float = 0.0
+    for segment, segment_along in zip(segments, along):
+        skip: int = 1 if parts and _key(segment[0]) == _key(parts[-1][-1]) else 0
+        parts.append(segment[skip:])
+        distances.append(covered + segment_along[skip:])
+        covered += float(segment_along[-1])
+    return np.concatenate(parts), np.concatenate(distances)
+
+
+def line_lengths(lines: list[list[list[float]]]) -> list[float]:
+    """Great-circle length [m] of each line of (lon, lat) points.
+
+    Only needed for routes without known edge lengths, i.e. from the "db" engine.
+    """
+    lengths: list[float] = []
+    for line in lines:
+        coords: np.ndarray = np.radians(np.asarray(line, dtype=np.float64).reshape(-1, 2)[:, :2])
+        lon, lat = coords[:, 0], coords[:, 1]
+        a: np.ndarray = (
+            np.sin(np.diff(lat) / 2) ** 2 + np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin(np.diff(lon) / 2) ** 2
+        )
+        lengths.append(float((2 * _EARTH_RADIUS * np.arcsin(np.sqrt(a))).sum()))
+    return lengths
+
+
+def douglas_peucker(coords: np.ndarray, tolerance: float) -> np.ndarray:
+    """Mask of the points of a line of (lon, lat) points kept by the Douglas-Peucker simplification.
+
+    The tolerance is in meters, all the points are kept if it is 0.
+    """
+    keep: np.ndarray = np.ones(len(coords), dtype=bool)
+    if tolerance <= 0 or len(coords) <= 2:
+        return keep
+
+    points: np.ndarray = _to_meters(coords)
+    keep[1:-1] = False
+    stack: list[tuple[int, int]] = [(0, len(coords) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        inner: np.ndarray = points[first + 1:last]
+        direction: np.ndarray = points[last] - points[first]
+        length: float = float(np.hypot(*direction))
+        offsets: np.ndarray = inner - points[first]
+        if length == 0:
+            distances: np.ndarray = np.hypot(offsets[:, 0], offsets[:, 1])
+        else:
+            distances = np.abs(offsets[:, 0] * direction[1] - offsets[:, 1] * direction[0]) / length
+        farthest: int = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            middle: int = first + 1 + farthest
+            keep[middle] = True
+            stack.extend([(first, middle), (middle, last)])
+    return keep
+
+
+def encode_polyline(coords: np.ndarray, precision: int = DEFAULT_POLYLINE_PRECISION) -> str:
+    """Encoded polyline (the format of the Google Maps APIs) of a line of (lon, lat) points."""
+    # The format stores latitudes first, as deltas of integers.
+    values: np.ndarray = np.round(coords[:, 1::-1] * 10 ** precision).astype(np.int64)
+    deltas: np.ndarray = np.diff(values, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).ravel()
+    chars: list[str] = []
+    for delta in deltas.tolist():
+        value: int = ~(delta << 1) if delta < 0 else delta << 1
+        while value >= 0x20:
+            chars.append(chr((0x20 | (value & 0x1F)) + 63))
+            value >>= 5
+        chars.append(chr(value + 63))
+    return "".join(chars)
+
+
+def dumps(value: Any) -> str:
+    """Serialize a response to compact JSON with orjson.
+
+    orjson serializes dataclasses and numpy values directly, without the deep copy of `dataclasses.asdict`.
+    NaN and infinities are written as null.
+    """
+    return orjson.dumps(value, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+
+
+def geometry_lines(geometry: dict[str, Any]) -> list[list[list[float]]]:
+    """Lines of a LineString or MultiLineString GeoJSON geometry."""
+    if geometry["type"] == "LineString":
+        return [geometry["coordinates"]]
+    return geometry["coordinates"]
+
+
+def _feature_collection(geometry: dict[str, Any]) -> dict[str, Any]:
+    return {
+        "type": "FeatureCollection",
+        "features": [{"type": "Feature", "properties": {}, "geometry": geometry}],
+    }
+
+
+def _round(coords: np.ndarray, precision: int | None) -> np.ndarray:
+    return coords if precision is None else np.round(coords, precision)
+
+
+def _to_meters(coords: np.ndarray) -> np.ndarray:
+    # Equirectangular projection, accurate enough at the scale of a walk.
+    scale: float = math.cos(math.radians(float(coords[:, 1].mean())))
+    return coords[:, :2] * [_METERS_PER_DEGREE * scale, _METERS_PER_DEGREE]
+
+
+def _fractions(coords: np.ndarray) -> np.ndarray:
+    """Fraction of the planar length of a line from its first point to each point."""
+    if len(coords) < 2:
+        return np.zeros(len(coords))
+    steps: np.ndarray = np.hypot(*np.diff(_to_meters(coords), axis=0).T)
+    total: float = float(steps.sum())
+    if total == 0:
+        return np.linspace(0.0, 1.0, len(coords))
+    return np.concatenate([[0.0], np.cumsum(steps)]) / total
+
+
+def _key(point: np.ndarray) -> tuple[float, float]:
+    return round(float(point[0]), _ENDPOINT_DIGITS), round(float(point[1]), _ENDPOINT_DIGITS)
+
+
+def _first_point(segments: list[np.ndarray], end: tuple[int, bool]) -> np.ndarray:
+    index, reverse = end
+    return segments[index][-1] if reverse else segments[index][0]
+
+
+def _distance(point: np.ndarray, other: Any) -> float:
+    return math.hypot(float(point[0]) - float(other[0]), float(point[1]) - float(other[1]))
@@ -0,0 +1,605 @@
+import dataclasses
+import heapq
+import json
+import logging
+import math
+import os
+import threading
+import time
+from typing import Any
+
+import numpy as np
+import scipy.sparse
+from flask import Flask, current_app
+from sqlalchemy import text
+
+from constants import CONTRACTION_HIERARCHY_PATH, GRAPH_VERSION_CHECK_SECONDS
+from server.contraction import ContractionHierarchy, CustomizedMetric, topology_key
+from server.node_snapper import NodeSnapper
+from server.retry import get_circuit_breaker, retry
+
+
+_logger = logging.getLogger(__name__)
+
+# Columns of `edge_features` (built by data/setup_edge_features.sh), in the order of the weight arguments
+# of get_routes().
+FEATURE_COLUMNS: tuple[str, ...] = (
+    "norm_length",
+    "inverse_green_index",
+    "inverse_water_index",
+    "norm_shade_index",
+    "norm_slope_index",
+    "norm_safety_index",
+    "inverse_isolation_index",
+)
+# Cost used by generate_route() for ways without any of the requested landmarks nearby.
+NO_LANDMARK_COST: float = 1e6
+# Radius [m in EPSG:3857] used for landmark proximity, same as generate_route().
+LANDMARK_RADIUS: float = 100.0
+
+_EARTH_RADIUS: float = 6378137.0
+
+_FEATURE_VERSION_QUERY = text("SELECT version FROM edge_features_version")
+
+
+def _normalize(values: np.ndarray) -> np.ndarray:
+    """Min-max normalize values like `COALESCE((x - MIN) / NULLIF(MAX - MIN, 0), 0)` in SQL."""
+    valid: np.ndarray = ~np.isnan(values)
+    if not valid.any():
+        return np.zeros_like(values)
+
+    low: float = values[valid].min()
+    high: float = values[valid].max()
+    if high == low:
+        return np.zeros_like(values)
+
+    return np.nan_to_num((values - low) / (high - low), nan=0.0)
+
+
+def to_web_mercator(lon: np.ndarray, lat: np.ndarray) -> np.ndarray:
+    """Project EPSG:4326 coordinates to EPSG:3857."""
+    x: np.ndarray = _EARTH_RADIUS * np.radians(lon)
+    y: np.ndarray = _EARTH_RADIUS * np.log(np.tan(np.pi / 4 + np.radians(lat) / 2))
+    return np.column_stack([x, y])
+
+
+@dataclasses.dataclass
+class RoutePath:
+
+    # Node indices of the graph, sorted from start to end.
+    nodes: list[int]
+    # Edge indices of the graph, sorted from start to end.
+    edges: list[int]
+    cost: float
+
+
+class RouteGraph:
+    """Walkable graph of `ways` kept in memory as CSR-style NumPy arrays.
+
+    Edges are undirected like `pgr_dijkstra(..., directed := false)`. Per-request
+    costs are a weighted sum of the precomputed feature matrix, so a search only
+    needs a weight vector.
+    """
+
+    def __init__(
+        self,
+        feature_version: str,
+        edge_gid: np.ndarray,
+        edge_source: np.ndarray,
+        edge_target: np.ndarray,
+        features: np.ndarray,
+        edge_length: np.ndarray,
+        geometry_offsets: np.ndarray,
+        geometry_coords: np.ndarray,
+        node_id: np.ndarray,
+        node_coords: np.ndarray,
+        landmark_id: np.ndarray,
+        landmark_name: list[str | None],
+        landmark_type: np.ndarray,
+        landmark_coords: np.ndarray,
+        proximity_types: list[str],
+        proximity_counts: scipy.sparse.csc_matrix,
+        edge_name: list[str | None] | None = None,
+        edge_slope: np.ndarray | None = None,
+    ):
+        self.feature_version: str = feature_version
+        self.edge_gid: np.ndarray = edge_gid
+        self.edge_source: np.ndarray = edge_source
+        self.edge_target: np.ndarray = edge_target
+        self.features: np.ndarray = features
+        # Length [m] of each edge, `ways.length_m`.
+        self.edge_length: np.ndarray = edge_length
+        # Street name and mean slope [degrees] of each edge, `ways.name` and `ways.slope_index`, to describe routes.
+        self.edge_name: list[str | None] = edge_name if edge_name is not None else [None] * len(edge_gid)
+        self.edge_slope: np.ndarray = (
+            edge_slope if edge_slope is not None else np.full(len(edge_gid), np.nan)
+        )
+        # Upper bound of each feature over the best quarter of the ways (lower is better), kept below its worst
+        # value so that a feature equal on most ways, like water far from rivers, does not include them all.
+        self.best_quarter_bounds: np.ndarray = np.zeros(features.shape[1])
+        if len(features) > 0:
+            worst: np.ndarray = features.max(axis=0)
+            self.best_quarter_bounds = np.minimum(np.quantile(features, 0.25, axis=0), np.nextafter(worst, -np.inf))
+        self.geometry_offsets: np.ndarray = geometry_offsets
+        self.geometry_coords: np.ndarray = geometry_coords
+        self.node_id: np.ndarray = node_id
+        self.node_coords: np.ndarray = node_coords
+        self.landmark_id: np.ndarray = landmark_id
+        self.landmark_name: list[str | None] = landmark_name
+        self.landmark_type: np.ndarray = landmark_type
+        self.landmark_coords: np.ndarray = landmark_coords
+        self.landmark_mercator: np.ndarray = to_web_mercator(landmark_coords[:, 0], landmark_coords[:, 1])
+        self.snapper: NodeSnapper = NodeSnapper(node_coords)
+        # (edges x landmark types) counts of landmarks within LANDMARK_RADIUS of each edge.
+        self.proximity_counts: scipy.sparse.csc_matrix = proximity_counts
+        self._proximity_columns: dict[str, int] = {
+            landmark_type: i for i, landmark_type in enumerate(proximity_types)
+        }
+
+        # Each undirected edge is stored as two arcs, grouped by their tail node.
+        num_edges: int = len(edge_gid)
+        arc_tail: np.ndarray = np.concatenate([edge_source, edge_target])
+        arc_head: np.ndarray = np.concatenate([edge_target, edge_source])
+        arc_edge: np.ndarray = np.concatenate([np.arange(num_edges), np.arange(num_edges)])
+        order: np.ndarray = np.argsort(arc_tail, kind="stable")
+        self.indptr: np.ndarray = np.concatenate(
+            [[0], np.cumsum(np.bincount(arc_tail, minlength=len(node_id)))]
+        )
+        self.arc_head: np.ndarray = arc_head[order]
+        self.arc_edge: np.ndarray = arc_edge[order]
+
+        # Set by load() when a hierarchy built for this topology is available, see server/contraction.py.
+        self.hierarchy: ContractionHierarchy | None = None
+
+        # Python lists are much faster than NumPy arrays for element access in the search loop.
+        self._indptr_list: list[int] = self.indptr.tolist()
+        self._arc_head_list: list[int] = self.arc_head.tolist()
+        self._arc_edge_list: list[int] = self.arc_edge.tolist()
+
+    @property
+    def num_nodes(self) -> int:
+        return len(self.node_id)
+
+    @property
+    def num_edges(self) -> int:
+        return len(self.edge_gid)
+
+    @classmethod
+    def load(cls, db) -> "RouteGraph":
+        """Load `ways`, `edge_features`, `ways_vertices_pgr`, `landmarks` and `way_landmark_counts`."""
+        _logger.error(f'[{__name__}] loading graph.')
+
+        try:
+            feature_version: str = db.session.execute(_FEATURE_VERSION_QUERY).scalar_one()
+            way_rows: list[Any] = db.session.execute(text(
+                f"""
+                SELECT w.gid, w.source, w.target, {", ".join(f"f.{column}" for column in FEATURE_COLUMNS)},
+                    w.length_m, w.name, w.slope_index, ST_AsGeoJSON(w.the_geom)
+                FROM ways w
+                JOIN edge_features f ON f.gid = w.gid
+                WHERE w.source IS NOT NULL AND w.target IS NOT NULL
+                ORDER BY w.gid
+                """
+            )).fetchall()
+            vertex_rows: list[Any] = db.session.execute(text(
+                "SELECT id, ST_X(the_geom), ST_Y(the_geom) FROM ways_vertices_pgr ORDER BY id"
+            )).fetchall()
+            landmark_rows: list[Any] = db.session.execute(text(
+                "SELECT id, name, type, ST_X(geom), ST_Y(geom) FROM landmarks ORDER BY id"
+            )).fetchall()
+            proximity_rows: list[Any] = db.session.execute(text(
+                "SELECT gid, type, landmark_count FROM way_landmark_counts"
+            )).fetchall()
+        finally:
+            db.session.close()
+
+        graph: RouteGraph = cls.from_rows(feature_version, way_rows, vertex_rows, landmark_rows, proximity_rows)
+        _logger.error(f'[{__name__}] loaded graph. nodes={graph.num_nodes}, edges={graph.num_edges}, '
+                      f'features={graph.feature_version}')
+
+        if CONTRACTION_HIERARCHY_PATH and os.path.exists(CONTRACTION_HIERARCHY_PATH):
+            hierarchy: ContractionHierarchy = ContractionHierarchy.load(CONTRACTION_HIERARCHY_PATH)
+            if hierarchy.topology_key == topology_key(graph.num_nodes, graph.edge_source, graph.edge_target):
+                graph.hierarchy = hierarchy
+                _logger.error(f'[{__name__}] loaded hierarchy. arcs={hierarchy.num_arcs}')
+            else:
+                _logger.error(f'[{__name__}] ignored hierarchy built for another topology. '
+                              f'{CONTRACTION_HIERARCHY_PATH=}')
+        return graph
+
+    @classmethod
+    def from_rows(
+        cls,
+        feature_version: str,
+        way_rows: list[Any],
+        vertex_rows: list[Any],
+        landmark_rows: list[Any],
+        proximity_rows: list[Any],
+    ) -> "RouteGraph":
+        """Build the graph from the rows of the queries of load(), sorted by id.
+
+        way_rows: (gid, source, target, *FEATURE_COLUMNS, length_m, name, slope_index, GeoJSON geometry)
+        vertex_rows: (id, lon, lat)
+        landmark_rows: (id, name, type, lon, lat)
+        proximity_rows: (gid, type, landmark_count)
+        """
+        node_id: np.ndarray = np.array([row[0] for row in vertex_rows], dtype=np.int64)
+        node_coords: np.ndarray = np.array([row[1:3] for row in vertex_rows], dtype=np.float64).reshape(-1, 2)
+
+        num_features: int = len(FEATURE_COLUMNS)
+        features: np.ndarray = np.array(
+            [row[3:3 + num_features] for row in way_rows], dtype=np.float64
+        ).reshape(-1, num_features)
+        edge_length: np.ndarray = np.array([row[-4] or 0.0 for row in way_rows], dtype=np.float64)
+        edge_slope: np.ndarray = np.array(
+            [row[-2] if row[-2] is not None else np.nan for row in way_rows], dtype=np.float64
+        )
+
+        geometries: list[list[list[float]]] = [json.loads(row[-1])["coordinates"] for row in way_rows]
+        geometry_offsets: np.ndarray = np.concatenate(
+            [[0], np.cumsum([len(coords) for coords in geometries])]
+        ).astype(np.int64)
+        geometry_coords: np.ndarray = np.array(
+            [point[:2] for coords in geometries for point in coords], dtype=np.float64
+        ).reshape(-1, 2)
+
+        edge_gid: np.ndarray = np.array([row[0] for row in way_rows], dtype=np.int64)
+        edge_index: dict[int, int] = {gid: i for i, gid in enumerate(edge_gid.tolist())}
+        proximity_types: list[str] = sorted({row[1] for row in proximity_rows})
+        type_columns: dict[str, int] = {landmark_type: i for i, landmark_type in enumerate(proximity_types)}
+        # Skip counts of ways that are not part of the graph.
+        proximity_rows = [row for row in proximity_rows if row[0] in edge_index]
+        proximity_counts: scipy.sparse.csc_matrix = scipy.sparse.csc_matrix(
+            (
+                [row[2] for row in proximity_rows],
+                (
+                    [edge_index[row[0]] for row in proximity_rows],
+                    [type_columns[row[1]] for row in proximity_rows],
+                ),
+            ),
+            shape=(len(edge_gid), len(proximity_types)),
+            dtype=np.float64,
+        )
+
+        return cls(
+            feature_version=feature_version,
+            edge_gid=edge_gid,
+            edge_source=np.searchsorted(node_id, [row[1] for row in way_rows]),
+            edge_target=np.searchsorted(node_id, [row[2] for row in way_rows]),
+            features=features,
+            edge_length=edge_length,
+            geometry_offsets=geometry_offsets,
+            geometry_coords=geometry_coords,
+            node_id=node_id,
+            node_coords=node_coords,
+            landmark_id=np.array([row[0] for row in landmark_rows], dtype=np.int64),
+            landmark_name=[row[1] for row in landmark_rows],
+            landmark_type=np.array([row[2] or "" for row in landmark_rows], dtype=object),
+            landmark_coords=np.array([row[3:5] for row in landmark_rows], dtype=np.float64).reshape(-1, 2),
+            proximity_types=proximity_types,
+            proximity_counts=proximity_counts,
+            edge_name=[row[-3] or None for row in way_rows],
+            edge_slope=edge_slope,
+        )
+
+    def landmark_counts(self, landmark_types: list[str]) -> np.ndarray:
+        """Count landmarks of the given types within LANDMARK_RADIUS of each edge."""
+        columns: list[int] = sorted({
+            self._proximity_columns[landmark_type]
+            for landmark_type in landmark_types
+            if landmark_type in self._proximity_columns
+        })
+        if not columns:
+            return np.zeros(self.num_edges, dtype=np.float64)
+        return np.asarray(self.proximity_counts[:, columns].sum(axis=1)).ravel()
+
+    def edge_costs(
+        self, weights: np.ndarray, weight_landmarks: float, landmark_counts: np.ndarray | None
+    ) -> np.ndarray:
+        """Composite cost of each edge for the given feature weights."""
+        costs: np.ndarray = self.features @ weights
+        if weight_landmarks and landmark_counts is not None:
+            landmark_cost: np.ndarray = np.where(
+                landmark_counts > 0, 1.0 / np.maximum(landmark_counts, 1), NO_LANDMARK_COST
+            )
+            costs = costs + weight_landmarks * _normalize(landmark_cost)
+        return costs
+
+    def shortest_path(self, source: int, target: int, edge_costs: np.ndarray) -> RoutePath | None:
+        """Run Dijkstra from source to target.
+
+        A single search is faster than customizing the contraction hierarchy for its costs, so the
+        hierarchy is only used by batches, see hierarchy_path().
+        """
+        return self.shortest_paths(source, [target], edge_costs).get(target)
+
+    def hierarchy_path(self, metric: CustomizedMetric, source: int, target: int) -> RoutePath | None:
+        """Query the contraction hierarchy with a metric customized once for many searches."""
+        result: tuple[list[int], list[int], float] | None = self.hierarchy.query(metric, source, target)
+        if result is None:
+            return None
+        nodes, edges, cost = result
+        return RoutePath(nodes=nodes, edges=edges, cost=cost)
+
+    def shortest_paths(self, source: int, targets: list[int], edge_costs: np.ndarray) -> dict[int, RoutePath]:
+        """Run Dijkstra from source once for all targets, and stop as soon as they are all settled.
+
+        Unreachable targets are missing from the result, the source itself is a path without edges.
+        """
+        indptr: list[int] = self._indptr_list
+        arc_head: list[int] = self._arc_head_list
+        arc_edge: list[int] = self._arc_edge_list
+        costs: list[float] = edge_costs.tolist()
+
+        remaining: set[int] = set(targets) - {source}
+        distance: dict[int, float] = {source: 0.0}
+        previous: dict[int, tuple[int, int]] = {}
+        settled: set[int] = set()
+        heap: list[tuple[float, int]] = [(0.0, source)]
+        while heap and remaining:
+            cost, node = heapq.heappop(heap)
+            if node in settled:
+                continue
+            settled.add(node)
+            remaining.discard(node)
+
+            for arc in range(indptr[node], indptr[node + 1]):
+                head: int = arc_head[arc]
+                new_cost: float = cost + costs[arc_edge[arc]]
+                if new_cost < distance.get(head, math.inf):
+                    distance[head] = new_cost
+                    previous[head] = (node, arc_edge[arc])
+                    heapq.heappush(heap, (new_cost, head))
+
+        paths: dict[int, RoutePath] = {}
+        for target in set(targets):
+            if target != source and target not in settled:
+                continue
+            nodes: list[int] = [target]
+            edges: list[int] = []
+            while nodes[-1] != source:
+                node, edge = previous[nodes[-1]]
+                nodes.append(node)
+                edges.append(edge)
+            nodes.reverse()
+            edges.reverse()
+            paths[target] = RoutePath(nodes=nodes, edges=edges, cost=distance[target])
+        return paths
+
+    def alternative_paths(
+        self,
+        source: int,
+        target: int,
+        edge_costs: np.ndarray,
+        k: int,
+        penalty: float,
+        max_overlap: float,
+    ) -> list[RoutePath]:
+        """Find up to k diverse paths with the penalty method.
+
+        After each search the costs of the edges on the found path are multiplied by
+        (1 + penalty), so the next search prefers other edges. A path sharing more than
+        max_overlap of its length with an already accepted path is skipped. The cost of
+        each returned path is measured with the original edge costs.
+        """
+        paths: list[RoutePath] = []
+        penalized_costs: np.ndarray = edge_costs.copy()
+        # Overlaps are shares of the length [m] of the path, not of its min-max normalized norm_length.
+        lengths: np.ndarray = self.edge_length
+        # Searches may return a rejected path again, so allow a few more than k.
+        for _ in range(3 * k):
+            path: RoutePath | None = self.shortest_path(source, target, penalized_costs)
+            if path is None:
+                break
+            penalized_costs[path.edges] *= 1 + penalty
+
+            if any(_overlap(path, accepted, lengths) > max_overlap for accepted in paths):
+                continue
+            path.cost = float(edge_costs[path.edges].sum())
+            paths.append(path)
+            if len(paths) >= k:
+                break
+        return paths
+
+    def edge_coordinates(self, edge: int) -> np.ndarray:
+        return self.geometry_coords[self.geometry_offsets[edge]:self.geometry_offsets[edge + 1]]
+
+    def edge_lengths(self, path: RoutePath) -> list[float]:
+        """Length [m] of each edge of the path, in the order of route_geojson()."""
+        return self.edge_length[path.edges].tolist()
+
+    def route_geojson(self, path: RoutePath) -> str:
+        """Route geometry like `ST_AsGeoJSON(ST_Collect(geom))`, with the lines of the edges in walking order and
+        direction, see merge_lines()."""
+        lines: list[list[list[float]]] = []
+        for edge, node in zip(path.edges, path.nodes):
+            coords: np.ndarray = self.edge_coordinates(edge)
+            lines.append((coords if self.edge_source[edge] == node else coords[::-1]).tolist())
+        return json.dumps({"type": "MultiLineString", "coordinates": lines})
+
+    def route_segments(self, path: RoutePath) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Segments of the geometries of the path in EPSG:3857, as (starts, ends), and the distance [m] along
+        the route from its start to each end of the segments, as (start distances, end distances).
+
+        Distances within an edge are interpolated on its geometry and scaled to its length, following the
+        direction the edge is walked.
+        """
+        edges: np.ndarray = np.asarray(path.edges, dtype=np.int64)
+        first_point: np.ndarray = self.geometry_offsets[edges]
+        counts: np.ndarray = self.geometry_offsets[edges + 1] - first_point
+        # Indices of the points of all the edges, edge after edge.
+        point_edge: np.ndarray = np.repeat(np.arange(len(edges)), counts)
+        points: np.ndarray = (
+            np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(first_point, counts)
+        )
+        coords: np.ndarray = self.geometry_coords[points]
+        mercator: np.ndarray = to_web_mercator(coords[:, 0], coords[:, 1])
+
+        # Position of each point on its edge, from 0 at its first point to 1 at its last one.
+        same_edge: np.ndarray = point_edge[:-1] == point_edge[1:]
+        steps: np.ndarray = np.where(same_edge, np.linalg.norm(np.diff(mercator, axis=0), axis=1), 0.0)
+        travelled: np.ndarray = np.concatenate([[0.0], np.cumsum(steps)])
+        edge_begin: np.ndarray = np.cumsum(counts) - counts
+        travelled -= np.repeat(travelled[edge_begin], counts)
+        edge_extent: np.ndarray = np.repeat(travelled[edge_begin + counts - 1], counts)
+        position: np.ndarray = np.divide(travelled, edge_extent, out=np.zeros_like(travelled), where=edge_extent > 0)
+
+        # Edges stored from their target to their source are walked backwards.
+        forward: np.ndarray = self.edge_source[edges] == np.asarray(path.nodes[:-1], dtype=np.int64)
+        position = np.where(np.repeat(forward, counts), position, 1 - position)
+        lengths: np.ndarray = self.edge_length[edges]
+        edge_start: np.ndarray = np.cumsum(lengths) - lengths
+        along: np.ndarray = np.repeat(edge_start, counts) + position * np.repeat(lengths, counts)
+
+        return mercator[:-1][same_edge], mercator[1:][same_edge], along[:-1][same_edge], along[1:][same_edge]
+
+    def route_landmarks(
+        self, path: RoutePath, landmark_types: list[str]
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Landmarks of the given types within LANDMARK_RADIUS of the route, as (landmark indices, distances [m]
+        to the route, distances [m] along the route from its start to their nearest point on it)."""
+        candidates: np.ndarray = np.flatnonzero(np.isin(self.landmark_type, landmark_types))
+        if len(candidates) == 0 or not path.edges:
+            return np.empty(0, dtype=np.int64), np.empty(0), np.empty(0)
+
+        starts, ends, start_along, end_along = self.route_segments(path)
+        # Only the landmarks in the bounding box of the route are compared with all of its segments.
+        points: np.ndarray = np.concatenate([starts, ends])
+        low: np.ndarray = points.min(axis=0) - LANDMARK_RADIUS
+        high: np.ndarray = points.max(axis=0) + LANDMARK_RADIUS
+        mercator: np.ndarray = self.landmark_mercator[candidates]
+        candidates = candidates[((mercator >= low) & (mercator <= high)).all(axis=1)]
+
+        distances, segments, fractions = nearest_segments(self.landmark_mercator[candidates], starts, ends)
+        near: np.ndarray = distances <= LANDMARK_RADIUS
+        segments = segments[near]
+        along: np.ndarray = start_along[segments] + fractions[near] * (end_along[segments] - start_along[segments])
+        return candidates[near], distances[near], along
+
+    def landmarks_geojson(self, path: RoutePath, landmark_types: list[str]) -> str:
+        """Landmarks of the given types within LANDMARK_RADIUS of the route, as a FeatureCollection."""
+        features: list[dict[str, Any]] = []
+        for landmark in self.route_landmarks(path, landmark_types)[0].tolist():
+            lon, lat = self.landmark_coords[landmark].tolist()
+            features.append({
+                "type": "Feature",
+                "geometry": {"type": "Point", "coordinates": [lon, lat]},
+                "properties": {
+                    "id": int(self.landmark_id[landmark]),
+                    "name": self.landmark_name[landmark],
+                    "type": self.landmark_type[landmark],
+                },
+            })
+
+        return json.dumps({"type": "FeatureCollection", "features": features}, ensure_ascii=False)
+
+
+def _overlap(path: RoutePath, other: RoutePath, lengths: np.ndarray) -> float:
+    """Fraction of the length of path shared with other."""
+    total: float = float(lengths[path.edges].sum())
+    if total <= 0:
+        return 1.0 if set(path.edges) == set(other.edges) else 0.0
+    shared: np.ndarray = np.intersect1d(path.edges, other.edges)
+    return float(lengths[shared].sum()) / total
+
+
+def nearest_segments(
+    points: np.ndarray, starts: np.ndarray, ends: np.ndarray
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Distance from each point to the nearest segment, the index of that segment, and the position of
+    the closest point on it as a fraction of its length."""
+    result: np.ndarray = np.full(len(points), np.inf)
+    segments: np.ndarray = np.zeros(len(points), dtype=np.int64)
+    fractions: np.ndarray = np.zeros(len(points))
+    direction: np.ndarray = ends - starts
+    squared_length: np.ndarray = np.maximum(np.einsum("ij,ij->i", direction, direction), 1e-12)
+    # Chunk the points to bound the size of the (points x segments) matrix.
+    chunk_size: int = max(1, 1_000_000 // max(len(starts), 1))
+    for begin in range(0, len(points), chunk_size):
+        chunk: np.ndarray = points[begin:begin + chunk_size]
+        offset: np.ndarray = chunk[:, None, :] - starts[None, :, :]
+        ratio: np.ndarray = np.clip(np.einsum("psj,sj->ps", offset, direction) / squared_length, 0.0, 1.0)
+        nearest: np.ndarray = starts[None, :, :] + ratio[:, :, None] * direction[None, :, :]
+        distances: np.ndarray = np.sqrt(((chunk[:, None, :] - nearest) ** 2).sum(axis=2))
+        closest: np.ndarray = distances.argmin(axis=1)
+        rows: np.ndarray = np.arange(len(chunk))
+        result[begin:begin + chunk_size] = distances[rows, closest]
+        segments[begin:begin + chunk_size] = closest
+        fractions[begin:begin + chunk_size] = ratio[rows, closest]
+    return result, segments, fractions
+
+
+_route_graph: RouteGraph | None = None
+_route_graph_lock: threading.Lock = threading.Lock()
+_version_checked_at: float = 0.0
+
+
+def set_route_graph(graph: RouteGraph | None) -> None:
+    """Use this graph instead of the one of the database, such as a synthetic graph in benchmarks.
+
+    The graph is kept even if the version of `edge_features` changes. With None, the graph is loaded
+    again on next use.
+    """
+    global _route_graph, _version_checked_at
+    with _route_graph_lock:
+        _route_graph = graph
+        _version_checked_at = math.inf if graph is not None else 0.0
+
+
+def get_route_graph(db) -> RouteGraph:
+    """Return the process-wide graph, loading it on first use.
+
+    Every GRAPH_VERSION_CHECK_SECONDS, one request starts a thread comparing the version of `edge_features`
+    with the graph's and reloading the graph when they differ. Requests keep using the current graph until
+    the new one is swapped in.
+    """
+    global _route_graph, _version_checked_at
+    if _route_graph is None:
+        with _route_graph_lock:
+            if _route_graph is None:
+                _route_graph = retry(
+                    lambda: RouteGraph.load(db), name="load_route_graph", breaker=get_circuit_breaker("db")
+                )
+                _version_checked_at = time.monotonic()
+    elif time.monotonic() - _version_checked_at > GRAPH_VERSION_CHECK_SECONDS and _route_graph_lock.acquire(
+        blocking=False
+    ):
+        # The thread releases the lock, so no other check starts while it runs.
+        try:
+            _version_checked_at = time.monotonic()
+            threading.Thread(
+                target=_reload_route_graph,
+                args=(current_app._get_current_object(), db),
+                name="reload_route_graph",
+                daemon=True,
+            ).start()
+        except Exception as e:
+            _logger.error(f'[{__name__}] failed to start the graph reload. {e=}')
+            _route_graph_lock.release()
+    return _route_graph
+
+
+def _reload_route_graph(app: Flask, db) -> None:
+    """Reload the graph if the version of `edge_features` changed, then release _route_graph_lock."""
+    global _route_graph
+    try:
+        with app.app_context():
+            version: str = retry(
+                lambda: _feature_version(db), name="check_graph_version", breaker=get_circuit_breaker("db")
+            )
+            if version != _route_graph.feature_version:
+                _logger.error(f'[{__name__}] edge features changed. {version=}')
+                _route_graph = retry(
+                    lambda: RouteGraph.load(db), name="load_route_graph", breaker=get_circuit_breaker("db")
+                )
+    except Exception as e:
+        _logger.error(f'[{__name__}] failed to reload the graph. {e=}')
+    finally:
+        _route_graph_lock.release()
+
+
+def _feature_version(db) -> str:
+    try:
+        return db.session.execute(_FEATURE_VERSION_QUERY).scalar_one()
+    finally:
+        db.session.close()
@@ -0,0 +1,192 @@
+import dataclasses
+import json
+from typing import Any
+
+import numpy as np
+
+from constants import ROUTE_SUMMARY_MAX_LANDMARKS, ROUTE_SUMMARY_MAX_STREETS
+from request_response_data import Location
+from server.route_encoding import geometry_lines, line_lengths, merge_lines
+from server.route_graph import (
+    FEATURE_COLUMNS,
+    LANDMARK_RADIUS,
+    RouteGraph,
+    RoutePath,
+    nearest_segments,
+    to_web_mercator,
+)
+
+
+# summary factor -> column of edge_features, lower is better
+SUMMARY_FACTORS: dict[str, str] = {
+    "green": "inverse_green_index",
+    "water": "inverse_water_index",
+    "shade": "norm_shade_index",
+    "flat": "norm_slope_index",
+    "safe": "norm_safety_index",
+    "quiet": "inverse_isolation_index",
+}
+_FACTOR_COLUMNS: list[int] = [FEATURE_COLUMNS.index(column) for column in SUMMARY_FACTORS.values()]
+# Decimal digits of the coordinates in the summary, about 1 m.
+_COORDINATE_DIGITS: int = 5
+
+
+@dataclasses.dataclass
+class RouteSummary:
+    """Compact features of a route, given to the model instead of its geometry."""
+
+    length_m: int
+    # [latitude, longitude]
+    start: list[float]
+    end: list[float]
+    # factor -> share of the length of the route along the best quarter of the ways of the network for it
+    shares: dict[str, float] | None = None
+    max_slope_degrees: float | None = None
+    # the longest named streets, in the order they are walked: {"name", "length_m"}
+    streets: list[dict[str, Any]] = dataclasses.field(default_factory=list)
+    # landmarks near the route, in the order they are passed:
+    # {"name", "type", "latitude", "longitude", "distance_m"}, distance_m along the route from its start
+    landmarks: list[dict[str, Any]] = dataclasses.field(default_factory=list)
+
+    def route_json(self) -> str:
+        """The features of the route without its landmarks, as JSON for the prompt."""
+        return json.dumps({
+            name: value for name, value in dataclasses.asdict(self).items()
+            if name != "landmarks" and value is not None and value != []
+        }, ensure_ascii=False)
+
+    def landmarks_json(self) -> str:
+        return json.dumps(self.landmarks, ensure_ascii=False)
+
+
+def summarize_path(graph: RouteGraph, path: RoutePath, landmark_types: list[str]) -> RouteSummary:
+    """Summary of a path of the graph, computed from the per-edge arrays of its edges."""
+    edges: np.ndarray = np.asarray(path.edges, dtype=np.int64)
+    lengths: np.ndarray = graph.edge_length[edges]
+    total: float = float(lengths.sum())
+
+    # Share of the length on the best quarter of the ways, for each factor.
+    best: np.ndarray = graph.features[edges][:, _FACTOR_COLUMNS] <= graph.best_quarter_bounds[_FACTOR_COLUMNS]
+    shares: np.ndarray = lengths @ best / total if total > 0 else np.zeros(len(SUMMARY_FACTORS))
+
+    slopes: np.ndarray = graph.edge_slope[edges]
+    max_slope: float | None = float(np.nanmax(slopes)) if np.isfinite(slopes).any() else None
+
+    start_lon, start_lat = graph.node_coords[path.nodes[0]].tolist()
+    end_lon, end_lat = graph.node_coords[path.nodes[-1]].tolist()
+    return RouteSummary(
+        length_m=round(total),
+        start=_location(start_lat, start_lon),
+        end=_location(end_lat, end_lon),
+        shares={factor: round(float(share), 2) for factor, share in zip(SUMMARY_FACTORS, shares)},
+        max_slope_degrees=round(max_slope, 1) if max_slope is not None else None,
+        streets=_streets(graph, edges, lengths),
+        landmarks=_path_landmarks(graph, path, landmark_types),
+    )
+
+
+def summarize_geojson(
+    routes_info: str, landmarks_info: str | None, edge_lengths: list[float], start: Location | None
+) -> RouteSummary:
+    """Summary of a route known only by its GeoJSON, from the "db" engine: without the edge indices,
+    only its length, ends and landmarks."""
+    geometry: dict[str, Any] = json.loads(routes_info)
+    lines: list[list[list[float]]] = geometry_lines(geometry)
+    if len(edge_lengths) != len(lines):
+        edge_lengths = line_lengths(lines)
+    coords, distances = merge_lines(
+        lines, edge_lengths, (start.longitude, start.latitude) if start is not None else None
+    )
+    if len(coords) == 0:
+        return RouteSummary(length_m=0, start=[], end=[])
+
+    landmarks: list[dict[str, Any]] = []
+    features: list[dict[str, Any]] = json.loads(landmarks_info)["features"] if landmarks_info else []
+    points: np.ndarray = np.array(
+        [feature["geometry"]["coordinates"][:2] for feature in features], dtype=np.float64
+    ).reshape(-1, 2)
+    if len(points) > 0:
+        mercator: np.ndarray = to_web_mercator(coords[:, 0], coords[:, 1])
+        if len(mercator) == 1:
+            mercator = np.repeat(mercator, 2, axis=0)
+            distances = np.repeat(distances, 2)
+        nearest, segments, fractions = nearest_segments(
+            to_web_mercator(points[:, 0], points[:, 1]), mercator[:-1], mercator[1:]
+        )
+        along: np.ndarray = distances[segments] + fractions * (distances[segments + 1] - distances[segments])
+        properties: list[dict[str, Any]] = [feature.get("properties") or {} for feature in features]
+        landmarks = _top_landmarks(
+            [item.get("name") for item in properties],
+            [item.get("type") for item in properties],
+            points,
+            nearest,
+            along,
+        )
+
+    return RouteSummary(
+        length_m=round(float(distances[-1])),
+        start=_location(coords[0, 1], coords[0, 0]),
+        end=_location(coords[-1, 1], coords[-1, 0]),
+        landmarks=landmarks,
+    )
+
+
+def _streets(graph: RouteGraph, edges: np.ndarray, lengths: np.ndarray) -> list[dict[str, Any]]:
+    """The ROUTE_SUMMARY_MAX_STREETS longest named streets of the path, in the order they are walked."""
+    names: np.ndarray = np.array([graph.edge_name[edge] or "" for edge in edges.tolist()], dtype=object)
+    if len(names) == 0:
+        return []
+    unique, first, inverse = np.unique(names, return_index=True, return_inverse=True)
+    street_lengths: np.ndarray = np.bincount(inverse, weights=lengths, minlength=len(unique))
+    named: np.ndarray = np.flatnonzero(unique != "")
+    longest: np.ndarray = named[np.argsort(-street_lengths[named], kind="stable")][:ROUTE_SUMMARY_MAX_STREETS]
+    return [
+        {"name": unique[i], "length_m": round(float(street_lengths[i]))}
+        for i in longest[np.argsort(first[longest])].tolist()
+    ]
+
+
+def _path_landmarks(graph: RouteGraph, path: RoutePath, landmark_types: list[str]) -> list[dict[str, Any]]:
+    landmarks, nearest, along = graph.route_landmarks(path, landmark_types)
+    return _top_landmarks(
+        [graph.landmark_name[i] for i in landmarks.tolist()],
+        graph.landmark_type[landmarks].tolist(),
+        graph.landmark_coords[landmarks],
+        nearest,
+        along,
+    )
+
+
+def _top_landmarks(
+    names: list[str | None], types: list[str | None], coords: np.ndarray, nearest: np.ndarray, along: np.ndarray
+) -> list[dict[str, Any]]:
+    """The ROUTE_SUMMARY_MAX_LANDMARKS landmarks within LANDMARK_RADIUS closest to the route, named ones
+    first and one per name, in the order they are passed."""
+    near: np.ndarray = np.flatnonzero(nearest <= LANDMARK_RADIUS)
+    order: np.ndarray = near[np.lexsort((nearest[near], [not names[i] for i in near.tolist()]))]
+    selected: list[int] = []
+    seen: set[str] = set()
+    for i in order.tolist():
+        if len(selected) >= ROUTE_SUMMARY_MAX_LANDMARKS:
+            break
+        if names[i]:
+            if names[i] in seen:
+                continue
+            seen.add(names[i])
+        selected.append(i)
+
+    selected.sort(key=lambda i: along[i])
+    return [
+        {
+            "name": names[i],
+            "type": types[i],
+            "latitude": round(float(coords[i, 1]), _COORDINATE_DIGITS),
+            "longitude": round(float(coords[i, 0]), _COORDINATE_DIGITS),
+            "distance_m": round(float(along[i])),
+        }
+        for i in selected
+    ]
+
+
+def _location(lat: float, lon: float) -> list[float]:
+    return [round(float(lat), _COORDINATE_DIGITS), round(float(lon), _COORDINATE_DIGITS)]
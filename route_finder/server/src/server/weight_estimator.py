@@ -0,0 +1,119 @@
+import dataclasses
+import math
+
+from constants import WEIGHT_LANDMARKS
+from server.keyword_matcher import KeywordMatch, KeywordMatcher
+
+
+# weights of the route factors, as returned by calc_weights()
+WEIGHT_NAMES: tuple[str, ...] = (
+    "weight_length",
+    "weight_green_index",
+    "weight_water_index",
+    "weight_shade_index",
+    "weight_slope_index",
+    "weight_road_safety",
+    "weight_isolation",
+)
+
+# Keywords of preferences for each factor, in Japanese and English, following the descriptions of the
+# factors in the prompt of calc_weights().
+WEIGHT_KEYWORDS: dict[str, list[str]] = {
+    "weight_length": [
+        "最短", "近道", "早く", "速く", "急ぎ", "急いで", "時間がない", "時間が無い", "すぐ", "効率", "近い",
+        "短い", "最速", "遅刻", "間に合", "通勤", "通学", "shortest", "fastest", "quick", "quickly", "hurry",
+        "direct", "shortcut", "efficient",
+    ],
+    "weight_green_index": [
+        "緑", "自然", "公園", "木々", "並木", "森", "花", "植物", "庭園", "紅葉", "新緑", "桜",
+        "green", "nature", "park", "trees", "forest", "garden", "flowers",
+    ],
+    "weight_water_index": [
+        "水辺", "川", "河川", "川沿い", "池", "湖", "海", "せせらぎ", "運河", "噴水", "river", "lake",
+        "pond", "water", "waterside", "canal", "sea",
+    ],
+    "weight_shade_index": [
+        "日陰", "木陰", "涼しい", "涼し", "暑い", "暑さ", "日差し", "日射し", "日焼け", "直射日光", "真夏", "夏",
+        "shade", "shady", "cool", "hot", "sunny", "summer",
+    ],
+    "weight_slope_index": [
+        "坂", "坂道", "階段", "平ら", "平坦", "傾斜", "勾配", "楽な", "楽に", "疲れ", "足が痛", "膝", "ベビーカー",
+        "車椅子", "車いす", "高齢", "お年寄り", "杖", "荷物", "slope", "hill", "hills", "stairs", "flat",
+        "wheelchair", "stroller", "easy",
+    ],
+    "weight_road_safety": [
+        "安全", "安心", "危なくない", "明るい", "夜道", "夜", "子供", "子ども", "こども", "交通量", "歩道",
+        "車が少な", "事故", "防犯", "女性", "safe", "safety", "secure", "night", "kids", "children", "sidewalk",
+    ],
+    "weight_isolation": [
+        "静か", "閑静", "人混み", "人ごみ", "混雑", "落ち着", "のんびり", "ゆったり", "一人", "ひとり", "穏やか",
+        "喧騒", "人が少な", "人通りの少な", "隠れ家", "quiet", "calm", "peaceful", "crowd", "crowds", "crowded",
+        "alone", "secluded", "relax", "relaxing",
+    ],
+}
+
+
+# Phrases containing keywords that do not name their factors, mostly place names.
+WEIGHT_STOP_PHRASES: list[str] = [
+    "品川", "川崎", "川口", "川越", "立川", "神奈川", "石川", "香川", "海外", "海老", "海苔", "海鮮", "上海",
+    "北海道", "池袋", "池尻", "大森", "森下", "青森", "花火", "花粉", "桜木町", "桜新町", "緑茶", "赤坂",
+    "夏祭り", "夏休み", "green tea", "hot spring", "hot springs", "hot dog", "cool down",
+]
+# Pseudo-scores added to the keyword scores, so that a single keyword does not take all the weight and
+# the length of the route always counts.
+WEIGHT_PRIOR: dict[str, float] = {
+    "weight_length": 0.5,
+    "weight_green_index": 0.1,
+    "weight_water_index": 0.1,
+    "weight_shade_index": 0.1,
+    "weight_slope_index": 0.1,
+    "weight_road_safety": 0.1,
+    "weight_isolation": 0.1,
+}
+
+
+@dataclasses.dataclass
+class WeightEstimate:
+    """Weights estimated from the keywords of a preference."""
+
+    weights: dict[str, float]
+    # in [0, 1], see KeywordMatcher.match(): 0 without keywords or with a negation, 0.67 for a single keyword
+    confidence: float
+
+
+def normalize_weights(weights: dict[str, float], tolerance: float | None = None) -> dict[str, float] | None:
+    """Weights of all the factors scaled to sum to 1 - WEIGHT_LANDMARKS.
+
+    With a tolerance, weights whose sum differs more from 1 - WEIGHT_LANDMARKS are rejected with None,
+    such as model replies using another scale. Missing factors are 0, negative weights are rejected.
+    """
+    total: float = 1 - WEIGHT_LANDMARKS
+    values: dict[str, float] = {name: weights.get(name, 0.0) for name in WEIGHT_NAMES}
+    weights_sum: float = sum(values.values())
+    if any(value < 0 or not math.isfinite(value) for value in values.values()) or weights_sum <= 0:
+        return None
+    if tolerance is not None and abs(weights_sum - total) > tolerance:
+        return None
+    return {name: value * total / weights_sum for name, value in values.items()}
+
+
+_matcher: KeywordMatcher = KeywordMatcher(WEIGHT_KEYWORDS, WEIGHT_STOP_PHRASES)
+
+
+def estimate_weights(preference: str) -> WeightEstimate:
+    """Weights proportional to the keywords of each factor in the preference plus WEIGHT_PRIOR, found in
+    microseconds.
+
+    Without any keyword, the weights are the ones of WEIGHT_PRIOR with a confidence of 0.
+    """
+    match: KeywordMatch = _matcher.match(preference)
+    weights: dict[str, float] = normalize_weights(
+        {name: match.scores.get(name, 0.0) + prior for name, prior in WEIGHT_PRIOR.items()}
+    )
+    return WeightEstimate(weights, match.confidence)
+
+
+def weights_distance(a: dict[str, float], b: dict[str, float]) -> float:
+    """L1 distance between two sets of weights, in [0, 2 * (1 - WEIGHT_LANDMARKS)]."""
+    return sum(abs(a.get(name, 0.0) - b.get(name, 0.0)) for name in WEIGHT_NAMES)
+
@@ -0,0 +1,276 @@
+"""Offline benchmarks of the search server, to catch performance regressions before deploying.
+
+The model is replaced by tests/stub_model.py and the graph by the synthetic grid of
+tests/synthetic_graph.py, so neither the network nor the database is used.
+
+Run from route_finder/server:
+    PYTHONPATH=src python -m tests.benchmark --output benchmark.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Callable
+
+# main.py reads these when imported. Nothing connects to the database.
+os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+os.environ.setdefault("DB_USER", "benchmark")
+os.environ.setdefault("DB_PASSWORD", "benchmark")
+os.environ.setdefault("DB_NAME", "benchmark")
+os.environ["DB_POOL_WARM_UP"] = "0"
+os.environ["ROUTE_ENGINE"] = "graph"
+# Every search goes to the stub model, so its latency counts in every run.
+os.environ["LLM_CACHE_MAX_SIZE"] = "0"
+os.environ["LLM_CACHE_PATH"] = ""
+
+import numpy as np
+
+import main
+import models
+from constants import WEIGHT_LANDMARKS
+from request_response_data import Location, Place, Route, RouteEncoding, SearchRequest, SearchResponse
+from server import route_encoding
+from server.get_routes import get_alternative_routes, get_route_cache
+from server.route_encoding import dumps
+from server.route_graph import RouteGraph, set_route_graph
+from server.route_summary import RouteSummary, summarize_geojson
+from tests.stub_model import WEIGHTS_REPLY, StubModel
+from tests.synthetic_graph import grid_graph
+
+
+DEFAULT_REPEAT: int = 20
+DEFAULT_GRID_SIZE: int = 100
+DEFAULT_LLM_LATENCY: float = 0.05
+DEFAULT_NUM_ROUTES: int = 3
+# Points snapped in one call of the snapping benchmark, like a batch of searches.
+SNAP_BATCH_SIZE: int = 1000
+
+
+def _weights() -> dict[str, float]:
+    return {
+        name: float(value)
+        for name, value in (item.strip().split("=") for item in WEIGHTS_REPLY.split(","))
+    }
+
+
+def _corners(graph: RouteGraph) -> tuple[Location, Location]:
+    """Locations near the opposite corners of the graph, for the longest searches."""
+    low: np.ndarray = graph.node_coords.min(axis=0)
+    high: np.ndarray = graph.node_coords.max(axis=0)
+    margin: np.ndarray = (high - low) * 0.05
+    return (
+        Location(float(low[1] + margin[1]), float(low[0] + margin[0])),
+        Location(float(high[1] - margin[1]), float(high[0] - margin[0])),
+    )
+
+
+def _measure(function: Callable[[], Any], repeat: int, warm_up: int = 1) -> dict[str, Any]:
+    """Time `repeat` calls of the function after `warm_up` calls, in milliseconds."""
+    for _ in range(warm_up):
+        function()
+    durations: list[float] = []
+    for _ in range(repeat):
+        started_at: float = time.perf_counter()
+        function()
+        durations.append((time.perf_counter() - started_at) * 1000)
+    return {
+        "runs": repeat,
+        "mean_ms": statistics.fmean(durations),
+        "p50_ms": float(np.percentile(durations, 50)),
+        "p95_ms": float(np.percentile(durations, 95)),
+        "min_ms": min(durations),
+        "max_ms": max(durations),
+    }
+
+
+def benchmark_snapping(graph: RouteGraph, repeat: int) -> dict[str, Any]:
+    rng: np.random.Generator = np.random.default_rng(0)
+    low: np.ndarray = graph.node_coords.min(axis=0)
+    high: np.ndarray = graph.node_coords.max(axis=0)
+    points: np.ndarray = low + rng.random((SNAP_BATCH_SIZE, 2)) * (high - low)
+    result: dict[str, Any] = _measure(lambda: graph.snapper.snap_many(points[:, 1], points[:, 0]), repeat)
+    result["points"] = SNAP_BATCH_SIZE
+    return result
+
+
+def _route(
+    start: Location, end: Location, num_routes: int
+) -> list[tuple[str, str | None, list[float] | None, RouteSummary | None]]:
+    weights: dict[str, float] = _weights()
+    return get_alternative_routes(
+        None,
+        start_lat=start.latitude,
+        start_lon=start.longitude,
+        end_lat=end.latitude,
+        end_lon=end.longitude,
+        weight_landmarks=WEIGHT_LANDMARKS,
+        landmarks=["park", "cafe"],
+        k=num_routes,
+        **weights,
+    )
+
+
+def benchmark_route(start: Location, end: Location, num_routes: int, repeat: int) -> dict[str, Any]:
+    def run() -> None:
+        get_route_cache().clear()
+        _route(start, end, num_routes)
+
+    result: dict[str, Any] = _measure(run, repeat)
+    result["num_routes"] = num_routes
+    return result
+
+
+def benchmark_distance(
+    routes_info: str, edge_lengths: list[float], start: Location, repeat: int
+) -> dict[str, dict[str, Any]]:
+    """Distance and encoding of a route, from the edge lengths of the search and from its geometry."""
+    encoding: RouteEncoding = RouteEncoding()
+    return {
+        "edge_lengths": _measure(lambda: main._measure_route(routes_info, edge_lengths, encoding, start), repeat),
+        "geometry": _measure(lambda: main._measure_route(routes_info, None, encoding, start), repeat),
+    }
+
+
+def benchmark_summary(
+    routes_info: str,
+    landmarks_info: str | None,
+    edge_lengths: list[float],
+    summary: RouteSummary,
+    start: Location,
+    repeat: int,
+) -> dict[str, Any]:
+    """Summary of a route from its GeoJSON, as for the "db" engine, and the size of the inputs of the
+    explanation prompt with the summary instead of the GeoJSON."""
+    result: dict[str, Any] = _measure(
+        lambda: summarize_geojson(routes_info, landmarks_info, edge_lengths, start), repeat
+    )
+    result["geojson_bytes"] = len(routes_info.encode()) + len((landmarks_info or "").encode())
+    result["summary_bytes"] = len(summary.route_json().encode()) + len(summary.landmarks_json().encode())
+    return result
+
+
+def benchmark_serialization(
+    routes_infos: list[tuple[str, str | None, list[float] | None, RouteSummary | None]],
+    start: Location,
+    end: Location,
+    repeat: int,
+) -> dict[str, Any]:
+    encoding: RouteEncoding = RouteEncoding()
+    routes: list[Route] = []
+    for routes_info, _, edge_lengths, _ in routes_infos:
+        encoded, edge_lengths, distance, duration = main._measure_route(routes_info, edge_lengths, encoding, start)
+        routes.append(Route(
+            title="title",
+            description="description",
+            paths=encoded.paths,
+            path_geo_json=encoded.path_geo_json,
+            places=[Place("place", "description", start)],
+            distance_in_meter=distance,
+            walking_duration_in_minutes=duration,
+            path_polyline=encoded.path_polyline,
+            edge_distances_in_meter=edge_lengths,
+            cumulative_distances_in_meter=encoded.cumulative_distances,
+        ))
+    response: SearchResponse = SearchResponse(
+        request=SearchRequest("query", start, end, len(routes), encoding),
+        paragraphs=["description"],
+        routes=routes,
+    )
+    result: dict[str, Any] = _measure(lambda: dumps(response), repeat)
+    result["bytes"] = len(dumps(response))
+    return result
+
+
+def benchmark_search(start: Location, end: Location, num_routes: int, repeat: int) -> dict[str, Any]:
+    """The whole /search request through the Flask test client, with the stub model."""
+    client: Any = main.app.test_client()
+    url: str = (
+        f"/search?q=green&s={start.latitude},{start.longitude}"
+        f"&e={end.latitude},{end.longitude}&k={num_routes}"
+    )
+
+    def run() -> None:
+        get_route_cache().clear()
+        response: Any = client.get(url)
+        if response.status_code != 200:
+            raise RuntimeError(f"search failed. status={response.status_code}, body={response.data[:200]!r}")
+
+    return _measure(run, repeat)
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(repeat: int, grid_size: int, llm_latency: float, num_routes: int) -> dict[str, Any]:
+    graph: RouteGraph = grid_graph(grid_size)
+    set_route_graph(graph)
+    models.set_model(StubModel(llm_latency))
+    start, end = _corners(graph)
+    try:
+        routes_infos: list[tuple[str, str | None, list[float] | None, RouteSummary | None]] = _route(
+            start, end, num_routes
+        )
+        routes_info, landmarks_info, edge_lengths, summary = routes_infos[0]
+        results: dict[str, Any] = {
+            "snapping": benchmark_snapping(graph, repeat),
+            "route": benchmark_route(start, end, num_routes, repeat),
+            "distance": benchmark_distance(routes_info, edge_lengths, start, repeat),
+            "summary": benchmark_summary(routes_info, landmarks_info, edge_lengths, summary, start, repeat),
+            "serialization": benchmark_serialization(routes_infos, start, end, repeat),
+            "search": benchmark_search(start, end, num_routes, repeat),
+        }
+    finally:
+        set_route_graph(None)
+
+    return {
+        "metadata": {
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "git_commit": _git_commit(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "orjson": route_encoding.orjson.__version__,
+            "config": {
+                "repeat": repeat,
+                "grid_size": grid_size,
+                "nodes": graph.num_nodes,
+                "edges": graph.num_edges,
+                "llm_latency": llm_latency,
+                "num_routes": num_routes,
+            },
+        },
+        "results": results,
+    }
+
+
+def main_() -> None:
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", help="JSON file of the results, printed when omitted.")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="Timed runs of each benchmark.")
+    parser.add_argument("--grid-size", type=int, default=DEFAULT_GRID_SIZE, help="Nodes per side of the grid.")
+    parser.add_argument("--llm-latency", type=float, default=DEFAULT_LLM_LATENCY,
+                        help="Seconds of each call of the stub model.")
+    parser.add_argument("--num-routes", type=int, default=DEFAULT_NUM_ROUTES, help="Routes per search.")
+    args: argparse.Namespace = parser.parse_args()
+
+    report: dict[str, Any] = run(args.repeat, args.grid_size, args.llm_latency, args.num_routes)
+    text: str = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,85 @@
+"""Compare the weights of the local estimator with the ones of the model, for a file of preferences.
+
+The model is called like in calc_weights(). To compare without calling Gemini, replay a cassette recorded
+by a server (see tests/load_driver.py):
+    CASSETTE_MODE=replay CASSETTE_PATH=cassette.jsonl PYTHONPATH=src \
+        python -m tests.compare_weights --preferences preferences.txt --output weights.json
+
+Each line of the preferences file is one preference, like the `q` parameter of /search.
+"""
+import argparse
+import json
+import os
+import statistics
+from typing import Any
+
+os.environ.setdefault("GOOGLE_API_KEY", "compare")
+
+from constants import WEIGHT_ESTIMATE_MIN_CONFIDENCE
+from server.calculate_weights import model_weights
+from server.weight_estimator import WeightEstimate, estimate_weights, weights_distance
+
+
+def _top(weights: dict[str, float]) -> str:
+    return max(weights, key=lambda name: weights[name])
+
+
+def compare(preferences: list[str], min_confidence: float) -> dict[str, Any]:
+    rows: list[dict[str, Any]] = []
+    for preference in preferences:
+        estimate: WeightEstimate = estimate_weights(preference)
+        model: dict[str, float] | None = model_weights(preference)
+        rows.append({
+            "preference": preference,
+            "confidence": estimate.confidence,
+            "confident": estimate.confidence >= min_confidence,
+            "estimate": estimate.weights,
+            "model": model,
+            "distance": weights_distance(estimate.weights, model) if model is not None else None,
+            "same_top": _top(estimate.weights) == _top(model) if model is not None else None,
+        })
+
+    def summary(selected: list[dict[str, Any]]) -> dict[str, Any]:
+        compared: list[dict[str, Any]] = [row for row in selected if row["model"] is not None]
+        return {
+            "preferences": len(selected),
+            "compared": len(compared),
+            "mean_distance": statistics.fmean(row["distance"] for row in compared) if compared else None,
+            "same_top_share": (
+                sum(row["same_top"] for row in compared) / len(compared) if compared else None
+            ),
+        }
+
+    confident: list[dict[str, Any]] = [row for row in rows if row["confident"]]
+    return {
+        "min_confidence": min_confidence,
+        "confident_share": len(confident) / len(rows) if rows else 0.0,
+        # The confident estimates replace the model in calc_weights(), the others are only its fallback.
+        "all": summary(rows),
+        "confident": summary(confident),
+        "not_confident": summary([row for row in rows if not row["confident"]]),
+        "rows": rows,
+    }
+
+
+def main() -> None:
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--preferences", required=True, help="File of preferences, one per line.")
+    parser.add_argument("--min-confidence", type=float, default=WEIGHT_ESTIMATE_MIN_CONFIDENCE,
+                        help="Confidence of the estimator above which the model is not asked.")
+    parser.add_argument("--output", help="JSON file of the comparison, printed when omitted.")
+    args: argparse.Namespace = parser.parse_args()
+
+    with open(args.preferences) as f:
+        preferences: list[str] = [line.strip() for line in f if line.strip()]
+
+    text: str = json.dumps(compare(preferences, args.min_confidence), indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,17 @@
+"""Shared setup of the unit tests, run from route_finder/server with `python -m pytest tests`.
+
+Modules are imported from src like in the server. Nothing connects to Gemini or the database.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+os.environ.setdefault("GOOGLE_API_KEY", "test")
+os.environ.setdefault("DB_USER", "test")
+os.environ.setdefault("DB_PASSWORD", "test")
+os.environ.setdefault("DB_NAME", "test")
+os.environ["DB_POOL_WARM_UP"] = "0"
+os.environ["ROUTE_ENGINE"] = "graph"
+os.environ["LLM_CACHE_PATH"] = ""
+os.environ["CASSETTE_MODE"] = ""
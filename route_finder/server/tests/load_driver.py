@@ -0,0 +1,212 @@
+"""Concurrent load test of /search, to size the gunicorn workers and threads and the Cloud Run concurrency.
+
+Record the model and generate_route() calls once, with a server running with CASSETTE_MODE=record:
+    CASSETTE_MODE=record CASSETTE_PATH=cassette.jsonl ROUTE_ENGINE=db poetry run python src/main.py
+    python -m tests.load_driver --url http://localhost:5000 --searches searches.txt --requests 20 --concurrency 1
+
+Then replay them with their recorded latencies, without calling Gemini or the database, for each configuration:
+    python -m tests.load_driver --configs 1x8 2x4 1x16 --cassette cassette.jsonl --searches searches.txt \
+        --requests 500 --concurrency 16 --output load.json
+
+Each line of the searches file is the query string of a search, such as `q=...&s=35.75,139.64&e=35.76,139.65&k=3`.
+With the "graph" engine the graph is still loaded from the database, so replay with ROUTE_ENGINE=db to run offline.
+"""
+import argparse
+import datetime
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+import numpy as np
+
+
+SERVER_DIR: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_PORT: int = 8090
+DEFAULT_REQUESTS: int = 200
+DEFAULT_CONCURRENCY: int = 8
+DEFAULT_WARM_UP: int = 5
+# seconds to wait for a started server to answer
+STARTUP_TIMEOUT: float = 60.0
+REQUEST_TIMEOUT: float = 300.0
+
+
+def read_searches(path: str) -> list[str]:
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+
+def _search(url: str, query: str) -> tuple[float, int]:
+    """(latency [seconds], HTTP status, 0 when the connection failed) of one search."""
+    started_at: float = time.perf_counter()
+    status: int
+    try:
+        with urllib.request.urlopen(f"{url}/search?{query}", timeout=REQUEST_TIMEOUT) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except (urllib.error.URLError, OSError):
+        status = 0
+    return time.perf_counter() - started_at, status
+
+
+def drive(url: str, searches: list[str], num_requests: int, concurrency: int, warm_up: int) -> dict[str, Any]:
+    """Send num_requests searches, cycling through the searches, from `concurrency` threads."""
+    for query in searches[:warm_up]:
+        _search(url, query)
+
+    started_at: float = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results: list[tuple[float, int]] = list(executor.map(
+            lambda i: _search(url, searches[i % len(searches)]), range(num_requests)
+        ))
+    elapsed: float = time.perf_counter() - started_at
+
+    latencies: list[float] = [latency * 1000 for latency, status in results if status == 200]
+    statuses: dict[str, int] = {}
+    for _, status in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    report: dict[str, Any] = {
+        "requests": num_requests,
+        "concurrency": concurrency,
+        "succeeded": len(latencies),
+        "statuses": statuses,
+        "elapsed_seconds": elapsed,
+        "throughput_rps": len(latencies) / elapsed if elapsed > 0 else 0.0,
+    }
+    if latencies:
+        report.update({
+            "mean_ms": statistics.fmean(latencies),
+            "p50_ms": float(np.percentile(latencies, 50)),
+            "p95_ms": float(np.percentile(latencies, 95)),
+            "p99_ms": float(np.percentile(latencies, 99)),
+            "max_ms": max(latencies),
+        })
+    return report
+
+
+def _wait_until_ready(url: str, process: subprocess.Popen) -> None:
+    deadline: float = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"server exited. returncode={process.returncode}")
+        try:
+            with urllib.request.urlopen(f"{url}/stats", timeout=1):
+                return
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.5)
+    raise RuntimeError(f"server did not start in {STARTUP_TIMEOUT}s.")
+
+
+def run_config(workers: int, threads: int, args: argparse.Namespace, searches: list[str]) -> dict[str, Any]:
+    """Start gunicorn like the Dockerfile does with these workers and threads, and drive it."""
+    env: dict[str, str] = dict(os.environ)
+    env.update({
+        "PYTHONPATH": os.path.join(SERVER_DIR, "src"),
+        "CASSETTE_MODE": args.mode,
+        "CASSETTE_PATH": os.path.abspath(args.cassette),
+        "DB_POOL_WARM_UP": "0",
+    })
+    if args.mode == "replay":
+        env.setdefault("ROUTE_ENGINE", "db")
+        for name in ("GOOGLE_API_KEY", "DB_USER", "DB_PASSWORD", "DB_NAME"):
+            env.setdefault(name, "replay")
+    if not args.keep_caches:
+        # Cached results would skip the recorded latencies of repeated searches.
+        env["LLM_CACHE_MAX_SIZE"] = "0"
+        env["LLM_CACHE_PATH"] = ""
+        env["ROUTE_CACHE_MAX_SIZE"] = "0"
+
+    url: str = f"http://127.0.0.1:{args.port}"
+    process: subprocess.Popen = subprocess.Popen(
+        [
+            sys.executable, "-m", "gunicorn",
+            "--bind", f"127.0.0.1:{args.port}",
+            "--workers", str(workers),
+            "--threads", str(threads),
+            "--timeout", "0",
+            "main:app",
+        ],
+        cwd=SERVER_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL if not args.verbose else None,
+    )
+    try:
+        _wait_until_ready(url, process)
+        report: dict[str, Any] = drive(url, searches, args.requests, args.concurrency, args.warm_up)
+    finally:
+        process.terminate()
+        process.wait()
+    return {"workers": workers, "threads": threads, **report}
+
+
+def _parse_config(value: str) -> tuple[int, int]:
+    workers, _, threads = value.partition("x")
+    return int(workers), int(threads)
+
+
+def main() -> None:
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(
+        description=__doc__.splitlines()[0], formatter_class=argparse.RawDescriptionHelpFormatter, epilog=__doc__
+    )
+    parser.add_argument("--searches", required=True, help="File of search query strings, one per line.")
+    parser.add_argument("--url", help="Drive this running server instead of starting gunicorn.")
+    parser.add_argument("--configs", nargs="+", default=["1x8"], help="<workers>x<threads> of gunicorn to compare.")
+    parser.add_argument("--cassette", default="cassette.jsonl", help="Cassette file of the started servers.")
+    parser.add_argument("--mode", choices=["replay", "record"], default="replay",
+                        help="CASSETTE_MODE of the started servers.")
+    parser.add_argument("--requests", type=int, default=DEFAULT_REQUESTS, help="Searches per configuration.")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Searches sent at once.")
+    parser.add_argument("--warm-up", type=int, default=DEFAULT_WARM_UP, help="Untimed searches sent first.")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--keep-caches", action="store_true", help="Keep the LLM and route caches of the server.")
+    parser.add_argument("--output", help="JSON file of the results, printed when omitted.")
+    parser.add_argument("--verbose", action="store_true", help="Show the logs of the started servers.")
+    args: argparse.Namespace = parser.parse_args()
+
+    searches: list[str] = read_searches(args.searches)
+    if not searches:
+        parser.error("no searches in the file.")
+
+    results: list[dict[str, Any]]
+    if args.url:
+        results = [{"url": args.url, **drive(args.url, searches, args.requests, args.concurrency, args.warm_up)}]
+    else:
+        results = []
+        for config in args.configs:
+            workers, threads = _parse_config(config)
+            result: dict[str, Any] = run_config(workers, threads, args, searches)
+            results.append(result)
+            print(
+                f"{workers}x{threads}: {result.get('throughput_rps', 0):.1f} rps, "
+                f"p50={result.get('p50_ms', 0):.0f}ms p95={result.get('p95_ms', 0):.0f}ms "
+                f"p99={result.get('p99_ms', 0):.0f}ms, {result['statuses']}",
+                file=sys.stderr,
+            )
+
+    text: str = json.dumps({
+        "metadata": {
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "searches": len(searches),
+            "mode": args.mode if not args.url else None,
+            "keep_caches": args.keep_caches,
+        },
+        "results": results,
+    }, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""Deterministic stand-in for the Gemini model, without network access.
+
+Answers each prompt of the server with a fixed, valid reply after a configurable latency.
+Install it with `models.set_model(StubModel(latency))`.
+"""
+import dataclasses
+import json
+import threading
+import time
+
+
+# Valid replies to the prompts of server/*.py, recognized by a phrase of the prompt.
+WEIGHTS_REPLY: str = (
+    "weight_length=0.3, weight_green_index=0.2, weight_water_index=0.1, weight_shade_index=0.1, "
+    "weight_slope_index=0.1, weight_road_safety=0.04, weight_isolation=0.0"
+)
+LANDMARKS_REPLY: str = "park, cafe, garden"
+EXPLANATION_REPLY: str = json.dumps({
+    "title": "緑を感じる散歩ルート",
+    "summary": "緑が多く、自然との触れ合いを感じるルートです。",
+    "details": [
+        {"name": "公園", "description": "木々のトンネルをくぐり抜けながら静かな空気を楽しめます。",
+         "latitude": 35.76, "longitude": 139.65},
+    ],
+}, ensure_ascii=False)
+DESCRIPTION_REPLY: str = "緑の多い道を優先し、無理のない距離で歩けるルートを選びました。"
+
+
+@dataclasses.dataclass
+class StubUsage:
+    prompt_token_count: int
+    candidates_token_count: int
+
+
+@dataclasses.dataclass
+class StubResponse:
+    text: str
+    usage_metadata: StubUsage
+
+
+class StubModel:
+    """Replies to generate_content() like the model would, after `latency` seconds."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency: float = latency
+        self.calls: int = 0
+        self._lock: threading.Lock = threading.Lock()
+
+    def generate_content(self, prompt: str) -> StubResponse:
+        with self._lock:
+            self.calls += 1
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+        text: str
+        if '"title"' in prompt:
+            text = EXPLANATION_REPLY
+        elif "ワードリスト" in prompt:
+            text = LANDMARKS_REPLY
+        elif "weight_isolation (DOUBLE PRECISION)" in prompt:
+            text = WEIGHTS_REPLY
+        else:
+            text = DESCRIPTION_REPLY
+        # About 4 characters per token, enough to compare prompt sizes.
+        return StubResponse(text, StubUsage(len(prompt) // 4, len(text) // 4))
@@ -0,0 +1,88 @@
+"""Synthetic walking network shaped like the tables of data/setup_*.sh.
+
+The rows have the columns of the queries of RouteGraph.load(), so the graph is built by the same
+code as the one of the database.
+"""
+import json
+
+import numpy as np
+
+from server.route_graph import FEATURE_COLUMNS, RouteGraph
+
+
+# South-west corner of the grid, in the area of data/setup_db.sh.
+ORIGIN: tuple[float, float] = (139.64131, 35.7517)
+LANDMARK_TYPES: tuple[str, ...] = ("park", "cafe", "garden", "museum", "shrine", "convenience")
+_EARTH_RADIUS: float = 6371008.8
+
+
+def grid_rows(
+    size: int, spacing: float = 0.001, num_landmarks: int = 500, seed: int = 0
+) -> tuple[str, list[tuple], list[tuple], list[tuple], list[tuple]]:
+    """(feature version, ways, vertices, landmarks, way landmark counts) rows of a size x size grid.
+
+    Neighboring vertices, `spacing` degrees apart, are joined by a way with a midpoint, so that
+    geometries have more than two points. Features are random in [0, 1] except norm_length, ways along
+    a row are named "street <row>" and ways along a column "avenue <column>".
+    """
+    rng: np.random.Generator = np.random.default_rng(seed)
+    columns, rows = np.meshgrid(np.arange(size), np.arange(size))
+    lon: np.ndarray = ORIGIN[0] + columns.ravel() * spacing
+    lat: np.ndarray = ORIGIN[1] + rows.ravel() * spacing
+    vertex_rows: list[tuple] = [(i + 1, x, y) for i, (x, y) in enumerate(zip(lon.tolist(), lat.tolist()))]
+
+    index: np.ndarray = np.arange(size * size).reshape(size, size)
+    sources: np.ndarray = np.concatenate([index[:, :-1].ravel(), index[:-1, :].ravel()])
+    targets: np.ndarray = np.concatenate([index[:, 1:].ravel(), index[1:, :].ravel()])
+    lengths: np.ndarray = _haversine(lon[sources], lat[sources], lon[targets], lat[targets])
+    features: np.ndarray = rng.random((len(sources), len(FEATURE_COLUMNS)))
+    features[:, FEATURE_COLUMNS.index("norm_length")] = (lengths - lengths.min()) / max(np.ptp(lengths), 1e-9)
+    slopes: np.ndarray = features[:, FEATURE_COLUMNS.index("norm_slope_index")] * 10
+
+    way_rows: list[tuple] = []
+    for gid, (source, target) in enumerate(zip(sources.tolist(), targets.tolist()), start=1):
+        # A slight bend in the middle, like real ways.
+        middle: list[float] = [
+            (lon[source] + lon[target]) / 2 + rng.normal(0, spacing / 20),
+            (lat[source] + lat[target]) / 2 + rng.normal(0, spacing / 20),
+        ]
+        geometry: str = json.dumps({
+            "type": "LineString",
+            "coordinates": [[lon[source], lat[source]], middle, [lon[target], lat[target]]],
+        })
+        way_rows.append(
+            (
+                gid, source + 1, target + 1, *features[gid - 1].tolist(), float(lengths[gid - 1]),
+                f"street {source // size + 1}" if target == source + 1 else f"avenue {source % size + 1}",
+                float(slopes[gid - 1]), geometry,
+            )
+        )
+
+    extent: float = (size - 1) * spacing
+    landmark_rows: list[tuple] = [
+        (
+            i + 1,
+            f"landmark {i + 1}",
+            LANDMARK_TYPES[i % len(LANDMARK_TYPES)],
+            ORIGIN[0] + rng.random() * extent,
+            ORIGIN[1] + rng.random() * extent,
+        )
+        for i in range(num_landmarks)
+    ]
+    # Each way counts a few landmarks of a few types, like way_landmark_counts.
+    proximity_rows: list[tuple] = [
+        (int(gid), LANDMARK_TYPES[int(rng.integers(len(LANDMARK_TYPES)))], int(rng.integers(1, 4)))
+        for gid in rng.choice(np.arange(1, len(way_rows) + 1), size=len(way_rows) // 5, replace=False)
+    ]
+    return f"synthetic-{size}-{seed}", way_rows, vertex_rows, landmark_rows, proximity_rows
+
+
+def grid_graph(size: int, spacing: float = 0.001, num_landmarks: int = 500, seed: int = 0) -> RouteGraph:
+    """RouteGraph of grid_rows()."""
+    return RouteGraph.from_rows(*grid_rows(size, spacing, num_landmarks, seed))
+
+
+def _haversine(lon1: np.ndarray, lat1: np.ndarray, lon2: np.ndarray, lat2: np.ndarray) -> np.ndarray:
+    lon1, lat1, lon2, lat2 = (np.radians(values) for values in (lon1, lat1, lon2, lat2))
+    a: np.ndarray = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * _EARTH_RADIUS * np.arcsin(np.sqrt(a))
@@ -0,0 +1,48 @@
+import time
+
+import pytest
+
+from server.cache import LlmCache, LruCache
+
+
+def test_lru_cache_evicts_the_least_recently_used():
+    cache: LruCache = LruCache(max_size=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    stats: dict = cache.stats()
+    assert (stats["size"], stats["hits"], stats["misses"], stats["hit_ratio"]) == (2, 3, 1, 0.75)
+
+
+def test_lru_cache_drops_expired_entries():
+    cache: LruCache = LruCache(max_size=10, ttl_seconds=60)
+    cache.put("old", 1, stored_at=time.time() - 61)
+    cache.put("new", 2, stored_at=time.time() - 59)
+    assert cache.get("old") is None
+    assert cache.get("new") == 2
+    assert cache.stats()["size"] == 1
+
+
+def test_llm_cache_keys_by_prompt_version_and_normalized_text():
+    cache: LlmCache = LlmCache(max_size=10, ttl_seconds=60)
+    cache.put("weights", "1", "  Quiet　ＰＡＲＫ ", {"weight_isolation": 0.95})
+    assert cache.get("weights", "1", "quiet park") == {"weight_isolation": 0.95}
+    assert cache.get("weights", "2", "quiet park") is None
+    assert cache.get("landmarks", "1", "quiet park") is None
+
+
+def test_llm_cache_survives_restarts_until_the_ttl(tmp_path, monkeypatch: pytest.MonkeyPatch):
+    path: str = str(tmp_path / "llm_cache.sqlite")
+    LlmCache(max_size=10, ttl_seconds=60, path=path).put("landmarks", "1", "cafe", ["cafe"])
+
+    restarted: LlmCache = LlmCache(max_size=10, ttl_seconds=60, path=path)
+    assert restarted.get("landmarks", "1", "cafe") == ["cafe"]
+    assert restarted.stats()["disk_hits"] == 1 and restarted.stats()["hits"] == 1
+
+    now: float = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 61)
+    assert restarted.get("landmarks", "1", "cafe") is None
+    assert LlmCache(max_size=10, ttl_seconds=60, path=path).get("landmarks", "1", "cafe") is None
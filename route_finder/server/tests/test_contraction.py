@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from server.contraction import ContractionHierarchy, CustomizedMetric
+from server.route_graph import RouteGraph, RoutePath
+from tests.synthetic_graph import grid_graph
+
+
+@pytest.fixture(scope="module")
+def graph() -> RouteGraph:
+    graph: RouteGraph = grid_graph(20)
+    graph.hierarchy = ContractionHierarchy.build(
+        graph.num_nodes, graph.edge_source, graph.edge_target, graph.node_coords
+    )
+    return graph
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_hierarchy_paths_match_dijkstra(graph: RouteGraph, seed: int):
+    rng: np.random.Generator = np.random.default_rng(seed)
+    edge_costs: np.ndarray = graph.edge_costs(rng.random(7), 0.0, None)
+    metric: CustomizedMetric = graph.hierarchy.customize(edge_costs)
+
+    for source, target in rng.integers(0, graph.num_nodes, (30, 2)).tolist():
+        expected: RoutePath | None = graph.shortest_path(source, target, edge_costs)
+        path: RoutePath | None = graph.hierarchy_path(metric, source, target)
+        if expected is None:
+            assert path is None
+            continue
+        assert path.cost == pytest.approx(expected.cost)
+        assert path.nodes[0] == source and path.nodes[-1] == target
+        # The unpacked edges join the nodes of the path and sum up to its cost.
+        for (a, b), edge in zip(zip(path.nodes, path.nodes[1:]), path.edges):
+            assert {a, b} == {int(graph.edge_source[edge]), int(graph.edge_target[edge])}
+        assert edge_costs[path.edges].sum() == pytest.approx(expected.cost)
+
+
+def test_hierarchy_round_trips_through_a_file(graph: RouteGraph, tmp_path):
+    path: str = str(tmp_path / "hierarchy.npz")
+    graph.hierarchy.save(path)
+    loaded: ContractionHierarchy = ContractionHierarchy.load(path)
+
+    assert loaded.topology_key == graph.hierarchy.topology_key
+    edge_costs: np.ndarray = graph.edge_costs(np.full(7, 1 / 7), 0.0, None)
+    expected: tuple = graph.hierarchy.query(graph.hierarchy.customize(edge_costs), 0, graph.num_nodes - 1)
+    assert loaded.query(loaded.customize(edge_costs), 0, graph.num_nodes - 1) == expected
@@ -0,0 +1,90 @@
+"""Concurrent calls of generate_route() in a database set up by data/setup_generate_route.sh.
+
+Skipped unless GENERATE_ROUTE_DB_URL is set, e.g.
+`GENERATE_ROUTE_DB_URL=postgresql://postgres@localhost/tokyo_routing python -m pytest tests/test_generate_route.py`.
+"""
+import concurrent.futures
+import os
+import random
+import threading
+from typing import Iterator
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Engine
+
+DB_URL: str | None = os.getenv("GENERATE_ROUTE_DB_URL")
+# concurrent calls, like the threads of a gunicorn worker
+CLIENTS: int = 8
+
+pytestmark = pytest.mark.skipif(not DB_URL, reason="GENERATE_ROUTE_DB_URL is not set")
+
+_GENERATE_ROUTE = text(
+    "SELECT * FROM generate_route(:w0, :w1, :w2, :w3, :w4, :w5, :w6, :w7, :landmark_types, "
+    ":start_lat, :start_lon, :end_lat, :end_lon)"
+)
+# Sessions of the calls waiting for a lock, instead of running.
+_LOCK_WAITS = text(
+    "SELECT count(*) FROM pg_stat_activity "
+    "WHERE wait_event_type = 'Lock' AND query LIKE '%generate_route(%' AND pid <> pg_backend_pid()"
+)
+
+
+@pytest.fixture(scope="module")
+def engine() -> Iterator[Engine]:
+    engine: Engine = create_engine(DB_URL, pool_size=CLIENTS + 1, max_overflow=0)
+    yield engine
+    engine.dispose()
+
+
+def _calls(count: int) -> list[dict]:
+    """Calls around the examples of README.md, each with its own weights, as in bench_generate_route.sh."""
+    rng: random.Random = random.Random(0)
+    calls: list[dict] = []
+    for _ in range(count):
+        weights: list[float] = [rng.random() for _ in range(7)]
+        total: float = sum(weights) / 0.95
+        calls.append({
+            **{f"w{i}": weight / total for i, weight in enumerate(weights)},
+            "w7": 0.05,
+            "landmark_types": ["cafe", "convenience"],
+            "start_lat": rng.uniform(35.77, 35.82),
+            "start_lon": rng.uniform(139.65, 139.73),
+            "end_lat": rng.uniform(35.77, 35.82),
+            "end_lon": rng.uniform(139.65, 139.73),
+        })
+    return calls
+
+
+def _generate_route(engine: Engine, params: dict) -> tuple:
+    with engine.connect() as connection:
+        return tuple(connection.execute(_GENERATE_ROUTE, params).fetchone())
+
+
+def test_concurrent_calls_neither_block_nor_mix_their_weights(engine: Engine):
+    calls: list[dict] = _calls(CLIENTS * 2)
+    expected: list[tuple] = [_generate_route(engine, params) for params in calls]
+
+    lock_waits: list[int] = []
+    done: threading.Event = threading.Event()
+
+    def watch() -> None:
+        with engine.connect() as connection:
+            while not done.is_set():
+                lock_waits.append(connection.execute(_LOCK_WAITS).scalar())
+                done.wait(0.01)
+
+    watcher: threading.Thread = threading.Thread(target=watch)
+    watcher.start()
+    try:
+        with concurrent.futures.ThreadPoolExecutor(CLIENTS) as executor:
+            results: list[tuple] = list(
+                executor.map(lambda params: _generate_route(engine, params), calls, timeout=300)
+            )
+    finally:
+        done.set()
+        watcher.join()
+
+    # Each call routes on its own weights, as when run alone, and no call waited on another's locks.
+    assert results == expected
+    assert lock_waits and max(lock_waits) == 0
@@ -0,0 +1,58 @@
+import pytest
+
+from constants import LANDMARK_MATCH_MIN_CONFIDENCE
+from server import extract_landmarks as extract_landmarks_module
+from server.extract_landmarks import extract_landmarks
+from server.landmark_matcher import LandmarkMatch, match_landmarks
+from tests.stub_model import StubModel
+
+
+class _FailingModel:
+    def generate_content(self, prompt: str):
+        raise RuntimeError("down")
+
+
+def test_ambiguous_keyword_is_not_confident():
+    # "休憩" names both cafe and bench.
+    matched: LandmarkMatch = match_landmarks("カフェで休憩したい")
+    assert matched.landmarks == ["cafe", "bench"]
+    assert 0.0 < matched.confidence < LANDMARK_MATCH_MIN_CONFIDENCE
+
+
+@pytest.mark.parametrize("text, landmarks", [("カフェに寄りたい", ["cafe"]), ("美術館を見たい", ["museum"])])
+def test_single_type_does_not_ask_the_model(text: str, landmarks: list[str], monkeypatch: pytest.MonkeyPatch):
+    models: list[StubModel] = []
+    monkeypatch.setattr(extract_landmarks_module, "get_model", lambda: models.append(StubModel()) or models[-1])
+    assert match_landmarks(text).confidence >= LANDMARK_MATCH_MIN_CONFIDENCE
+    assert extract_landmarks(text) == landmarks
+    assert models == []
+
+
+def test_several_specific_keywords_are_confident():
+    matched: LandmarkMatch = match_landmarks("カフェと本屋に寄りたい")
+    assert matched.landmarks == ["cafe", "books"]
+    assert matched.confidence >= LANDMARK_MATCH_MIN_CONFIDENCE
+
+
+def test_longest_keyword_and_stop_phrases():
+    assert match_landmarks("調剤薬局").landmarks == ["pharmacy"]
+    assert match_landmarks("お腹一杯になるまで歩きたい").confidence == 0.0
+
+
+def test_partial_matches_are_candidates_for_the_model(monkeypatch: pytest.MonkeyPatch):
+    model: StubModel = StubModel()
+    prompts: list[str] = []
+    generate_content = model.generate_content
+    monkeypatch.setattr(model, "generate_content", lambda prompt: prompts.append(prompt) or generate_content(prompt))
+    monkeypatch.setattr(extract_landmarks_module, "get_model", lambda: model)
+
+    landmarks: list[str] = extract_landmarks("カフェで休憩してから帰りたい")
+    assert len(prompts) == 1 and "cafe, bench" in prompts[0]
+    # The reply of the model ("park, cafe, garden", of which only cafe is a type) decides, bench is not added.
+    assert landmarks == ["cafe"]
+
+
+def test_matches_are_used_when_the_model_fails(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(extract_landmarks_module, "get_model", lambda: _FailingModel())
+    monkeypatch.setattr(extract_landmarks_module, "retry", lambda fn, name, breaker: fn())
+    assert extract_landmarks("カフェで休憩してから寝たい") == ["cafe", "bench"]
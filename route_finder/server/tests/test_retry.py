@@ -0,0 +1,87 @@
+import time
+
+import pytest
+
+from server.retry import CircuitBreaker, CircuitOpenError, NotRetryableError, call_with_breaker, retry
+
+
+def _fail(error: Exception):
+    def fn():
+        raise error
+    return fn
+
+
+def _open(breaker: CircuitBreaker) -> None:
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            call_with_breaker(_fail(RuntimeError("down")), breaker)
+
+
+def test_breaker_opens_after_threshold_and_fails_fast():
+    breaker: CircuitBreaker = CircuitBreaker("test", failure_threshold=2, reset_seconds=60)
+    _open(breaker)
+    assert breaker.is_open
+    with pytest.raises(CircuitOpenError):
+        call_with_breaker(lambda: "ok", breaker)
+
+
+def test_breaker_closes_after_successful_trial():
+    breaker: CircuitBreaker = CircuitBreaker("test", failure_threshold=2, reset_seconds=0.01)
+    _open(breaker)
+    time.sleep(0.02)
+    assert call_with_breaker(lambda: "ok", breaker) == "ok"
+    assert not breaker.is_open
+
+
+def test_breaker_reopens_after_failed_trial():
+    breaker: CircuitBreaker = CircuitBreaker("test", failure_threshold=2, reset_seconds=0.01)
+    _open(breaker)
+    time.sleep(0.02)
+    with pytest.raises(RuntimeError):
+        call_with_breaker(_fail(RuntimeError("still down")), breaker)
+    assert breaker.is_open
+    with pytest.raises(CircuitOpenError):
+        call_with_breaker(lambda: "ok", breaker)
+
+
+def test_not_retryable_trial_releases_the_trial():
+    breaker: CircuitBreaker = CircuitBreaker("test", failure_threshold=2, reset_seconds=0.01)
+    _open(breaker)
+    time.sleep(0.02)
+    with pytest.raises(NotRetryableError):
+        call_with_breaker(_fail(NotRetryableError("miss")), breaker)
+    # The next call is a trial again, and its success closes the circuit.
+    assert call_with_breaker(lambda: "ok", breaker) == "ok"
+    assert not breaker.is_open
+
+
+def test_not_retryable_error_does_not_count_as_failure():
+    breaker: CircuitBreaker = CircuitBreaker("test", failure_threshold=1, reset_seconds=60)
+    with pytest.raises(NotRetryableError):
+        call_with_breaker(_fail(NotRetryableError("miss")), breaker)
+    assert not breaker.is_open
+
+
+def test_retry_until_success():
+    calls: list[int] = []
+
+    def flaky() -> str:
+        calls.append(1)
+        if len(calls) < 3:
+            raise RuntimeError("flaky")
+        return "ok"
+
+    assert retry(flaky, name="test", max_attempts=5, base_delay=0, max_delay=0) == "ok"
+    assert len(calls) == 3
+
+
+def test_retry_raises_not_retryable_at_once():
+    calls: list[int] = []
+
+    def fn() -> None:
+        calls.append(1)
+        raise NotRetryableError("miss")
+
+    with pytest.raises(NotRetryableError):
+        retry(fn, name="test", max_attempts=5, base_delay=0, max_delay=0)
+    assert len(calls) == 1
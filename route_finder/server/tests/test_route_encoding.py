@@ -0,0 +1,99 @@
+import dataclasses
+import json
+
+import numpy as np
+
+from request_response_data import Location, Place, Route, RouteEncoding
+from server.route_encoding import dumps, encode_polyline, encode_route, merge_lines
+from server.route_graph import RouteGraph, RoutePath
+from tests.synthetic_graph import grid_graph
+
+
+def _decode_polyline(polyline: str, precision: int = 5) -> np.ndarray:
+    values: list[int] = []
+    value: int = 0
+    shift: int = 0
+    for char in polyline:
+        chunk: int = ord(char) - 63
+        value |= (chunk & 0x1F) << shift
+        shift += 5
+        if chunk < 0x20:
+            values.append(~(value >> 1) if value & 1 else value >> 1)
+            value, shift = 0, 0
+    # (lat, lon) deltas -> (lon, lat) points
+    return np.cumsum(np.array(values).reshape(-1, 2), axis=0)[:, ::-1] / 10 ** precision
+
+
+def _edge(graph: RouteGraph, u: int, v: int) -> int:
+    return int(np.flatnonzero(
+        ((graph.edge_source == u) & (graph.edge_target == v)) | ((graph.edge_source == v) & (graph.edge_target == u))
+    )[0])
+
+
+def _walk(graph: RouteGraph, nodes: list[int]) -> RoutePath:
+    return RoutePath(nodes=nodes, edges=[_edge(graph, u, v) for u, v in zip(nodes, nodes[1:])], cost=0.0)
+
+
+def test_polyline_round_trip():
+    coords: np.ndarray = np.array([[139.70001, 35.65812], [139.70123, 35.65799], [139.69987, 35.66011]])
+    assert np.allclose(_decode_polyline(encode_polyline(coords)), coords, atol=1e-9)
+    assert np.allclose(_decode_polyline(encode_polyline(coords, 6), 6), coords, atol=1e-9)
+
+
+def test_merge_lines_orients_unordered_segments():
+    lines: list[list[list[float]]] = [[[2.0, 0.0], [1.0, 0.0]], [[0.0, 0.0], [1.0, 0.0]], [[2.0, 0.0], [3.0, 0.0]]]
+    coords, distances = merge_lines(lines, [10.0, 10.0, 10.0], start=(0.0, 0.0))
+    assert coords.tolist() == [[0.0, 0.0], [1.0, 0.0], [2.0, 0.0], [3.0, 0.0]]
+    assert distances.tolist() == [0.0, 10.0, 20.0, 30.0]
+
+
+def test_graph_routes_keep_their_order_through_a_loop():
+    graph: RouteGraph = grid_graph(4, num_landmarks=0)
+    # Around the first square of the grid and back through its first corner, then on along the row.
+    nodes: list[int] = [1, 0, 4, 5, 1, 2, 3]
+    path: RoutePath = _walk(graph, nodes)
+    geometry: dict = json.loads(graph.route_geojson(path))
+
+    for line, (u, v) in zip(geometry["coordinates"], zip(nodes, nodes[1:])):
+        assert np.allclose(line[0], graph.node_coords[u]) and np.allclose(line[-1], graph.node_coords[v])
+
+    # A start nearer the other loose end of the lines must not turn the route around.
+    start: tuple[float, float] = tuple(graph.node_coords[2] * 0.4 + graph.node_coords[3] * 0.6)
+    coords, distances = merge_lines(geometry["coordinates"], graph.edge_lengths(path), start, ordered=True)
+    corners: np.ndarray = graph.node_coords[nodes]
+    # The corners are passed in the order of the path, the first one twice.
+    position: int = 0
+    for corner in corners:
+        matches: np.ndarray = np.flatnonzero(np.all(np.isclose(coords[position:], corner), axis=1))
+        assert len(matches) > 0
+        position += int(matches[0])
+    assert np.allclose(coords[0], corners[0]) and np.allclose(coords[-1], corners[-1])
+    assert np.isclose(distances[-1], sum(graph.edge_lengths(path)))
+    assert np.all(np.diff(distances) >= 0)
+
+    encoded = encode_route(geometry, graph.edge_lengths(path), RouteEncoding(format="linestring"), ordered=True)
+    assert np.allclose(
+        [[location.longitude, location.latitude] for location in encoded.paths][-1], corners[-1]
+    )
+
+
+def test_dumps_writes_numpy_values_and_dataclasses_like_json():
+    coords: np.ndarray = np.array([[139.70001, 35.65812], [139.70123, 35.65799]])
+    route: Route = Route(
+        title="緑の多い道",
+        description="",
+        paths=[Location(lat, lon) for lon, lat in coords],
+        path_geo_json={"type": "LineString", "coordinates": coords},
+        places=[Place("公園", "", Location(np.float64(35.6581), np.float64(139.7)))],
+        distance_in_meter=np.float64(123.4),
+        walking_duration_in_minutes=float("nan"),
+        edge_distances_in_meter=list(np.array([100.0, 23.4])),
+        cumulative_distances_in_meter=np.round(np.array([0.0, 123.4]), 1).tolist(),
+    )
+    expected: dict = json.loads(json.dumps(dataclasses.asdict(route), default=lambda value: value.tolist()))
+    expected["walking_duration_in_minutes"] = None
+
+    text: str = dumps(route)
+    assert json.loads(text) == expected
+    # Compact and UTF-8, like the responses of the server.
+    assert ", " not in text and "緑の多い道" in text
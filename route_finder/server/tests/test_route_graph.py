@@ -0,0 +1,140 @@
+import json
+import threading
+from types import SimpleNamespace
+
+import numpy as np
+
+import main
+from server.calculate_weights import default_weights
+from server.contraction import ContractionHierarchy
+from server.get_routes import get_alternative_routes, get_routes
+from server import route_graph
+from server.route_graph import RouteGraph, RoutePath, _overlap, get_route_graph, set_route_graph
+from server.route_summary import RouteSummary
+from tests.synthetic_graph import grid_graph
+
+
+def _costs(graph: RouteGraph) -> np.ndarray:
+    return graph.edge_costs(np.full(7, 1 / 7), 0.0, None)
+
+
+def _corners(graph: RouteGraph) -> tuple[int, int]:
+    return 0, graph.num_nodes - 1
+
+
+def test_alternative_paths_overlap_by_metric_length():
+    graph: RouteGraph = grid_graph(12)
+    source, target = _corners(graph)
+    paths: list[RoutePath] = graph.alternative_paths(source, target, _costs(graph), 3, penalty=0.5, max_overlap=0.7)
+
+    assert 1 < len(paths) <= 3
+    for index, path in enumerate(paths):
+        assert path.nodes[0] == source and path.nodes[-1] == target
+        for other in paths[:index]:
+            shared: float = graph.edge_length[np.intersect1d(path.edges, other.edges)].sum()
+            assert shared / graph.edge_length[path.edges].sum() <= 0.7
+
+
+def test_overlap_counts_the_shortest_edge():
+    # With min-max normalized lengths the shortest edge would count as 0.
+    lengths: np.ndarray = np.array([10.0, 20.0, 30.0])
+    path: RoutePath = RoutePath(nodes=[0, 1, 2], edges=[0, 1], cost=0.0)
+    other: RoutePath = RoutePath(nodes=[0, 1, 3], edges=[0, 2], cost=0.0)
+    assert _overlap(path, other, lengths) == 10.0 / 30.0
+
+
+def test_get_routes_keeps_the_generate_route_shape():
+    graph: RouteGraph = grid_graph(6)
+    set_route_graph(graph)
+    try:
+        start_lon, start_lat = graph.node_coords[0].tolist()
+        end_lon, end_lat = graph.node_coords[-1].tolist()
+        routes_info, landmarks_info = get_routes(
+            None,
+            start_lat=start_lat,
+            start_lon=start_lon,
+            end_lat=end_lat,
+            end_lon=end_lon,
+            **default_weights(),
+            weight_landmarks=0.16,
+            landmarks=["park"],
+        )
+    finally:
+        set_route_graph(None)
+    assert json.loads(routes_info)["type"] == "MultiLineString"
+    assert json.loads(landmarks_info)["type"] == "FeatureCollection"
+
+
+def test_ends_snapped_to_the_same_node_give_a_route_without_edges():
+    graph: RouteGraph = grid_graph(6)
+    set_route_graph(graph)
+    try:
+        lon, lat = graph.node_coords[7].tolist()
+        routes_infos: list[tuple[str, str | None, list[float] | None, RouteSummary | None]] = get_alternative_routes(
+            None,
+            start_lat=lat,
+            start_lon=lon,
+            end_lat=lat + 1e-6,
+            end_lon=lon,
+            **default_weights(),
+            weight_landmarks=0.16,
+            landmarks=["park"],
+            k=3,
+        )
+    finally:
+        set_route_graph(None)
+    assert len(routes_infos) == 1
+    routes_info, landmarks_info, edge_lengths, summary = routes_infos[0]
+    assert json.loads(routes_info) == {"type": "MultiLineString", "coordinates": []}
+    assert edge_lengths == [] and summary.length_m == 0
+
+    graph.hierarchy = ContractionHierarchy.build(
+        graph.num_nodes, graph.edge_source, graph.edge_target, graph.node_coords
+    )
+    path: RoutePath = graph.hierarchy_path(graph.hierarchy.customize(_costs(graph)), 7, 7)
+    assert path.nodes == [7] and path.edges == [] and path.cost == 0.0
+
+
+class _VersionDb:
+    """The session of flask_sqlalchemy's db, answering only the version of `edge_features`."""
+
+    def __init__(self, version: str):
+        self.session: SimpleNamespace = SimpleNamespace(
+            execute=lambda query: SimpleNamespace(scalar_one=lambda: version), close=lambda: None
+        )
+
+
+def test_changed_features_are_reloaded_without_blocking_requests(monkeypatch):
+    graph: RouteGraph = grid_graph(4, num_landmarks=0)
+    new_graph: RouteGraph = grid_graph(5, num_landmarks=0)
+    loading: threading.Event = threading.Event()
+    loaded: threading.Event = threading.Event()
+    attempts: list[int] = []
+
+    def load(db) -> RouteGraph:
+        attempts.append(len(attempts))
+        if len(attempts) == 1:
+            raise ConnectionError("connection reset")
+        loading.set()
+        loaded.wait(5)
+        return new_graph
+
+    monkeypatch.setattr(RouteGraph, "load", load)
+    monkeypatch.setattr(route_graph, "GRAPH_VERSION_CHECK_SECONDS", 0.0)
+    set_route_graph(graph)
+    monkeypatch.setattr(route_graph, "_version_checked_at", 0.0)
+    db: _VersionDb = _VersionDb(new_graph.feature_version)
+    try:
+        with main.app.app_context():
+            assert get_route_graph(db) is graph
+            assert loading.wait(5)
+            # The graph being loaded does not hold up the requests, nor start another load.
+            assert get_route_graph(db) is graph
+            loaded.set()
+            with route_graph._route_graph_lock:
+                pass
+            assert get_route_graph(db) is new_graph
+    finally:
+        set_route_graph(None)
+    # A failed load is retried like the first one.
+    assert len(attempts) == 2
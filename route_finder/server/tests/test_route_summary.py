@@ -0,0 +1,66 @@
+import json
+
+import numpy as np
+
+from constants import ROUTE_SUMMARY_MAX_LANDMARKS, ROUTE_SUMMARY_MAX_STREETS
+from request_response_data import Location
+from server.route_graph import LANDMARK_RADIUS, RouteGraph, RoutePath
+from server.route_summary import RouteSummary, _top_landmarks, summarize_geojson, summarize_path
+from tests.synthetic_graph import grid_graph
+
+
+def _path(graph: RouteGraph) -> RoutePath:
+    return graph.shortest_path(0, graph.num_nodes - 1, graph.edge_costs(np.full(7, 1 / 7), 0.0, None))
+
+
+def test_summarize_path():
+    graph: RouteGraph = grid_graph(20)
+    path: RoutePath = _path(graph)
+    types: list[str] = ["cafe", "park", "garden"]
+    summary: RouteSummary = summarize_path(graph, path, types)
+
+    assert summary.length_m == round(float(graph.edge_length[path.edges].sum()))
+    assert np.allclose(summary.start[::-1], graph.node_coords[path.nodes[0]], atol=1e-5)
+    assert np.allclose(summary.end[::-1], graph.node_coords[path.nodes[-1]], atol=1e-5)
+    assert all(0 <= share <= 1 for share in summary.shares.values())
+    assert 0 < len(summary.streets) <= ROUTE_SUMMARY_MAX_STREETS
+    assert sum(street["length_m"] for street in summary.streets) <= summary.length_m
+
+    assert 0 < len(summary.landmarks) <= ROUTE_SUMMARY_MAX_LANDMARKS
+    assert {landmark["type"] for landmark in summary.landmarks} <= set(types)
+    distances: list[int] = [landmark["distance_m"] for landmark in summary.landmarks]
+    assert distances == sorted(distances) and distances[-1] <= summary.length_m + LANDMARK_RADIUS
+    names: list[str] = [landmark["name"] for landmark in summary.landmarks]
+    assert len(set(names)) == len(names)
+
+    route: dict = json.loads(summary.route_json())
+    assert "landmarks" not in route and route["length_m"] == summary.length_m
+    assert json.loads(summary.landmarks_json()) == summary.landmarks
+
+
+def test_summarize_geojson_matches_the_graph_summary():
+    graph: RouteGraph = grid_graph(20)
+    path: RoutePath = _path(graph)
+    types: list[str] = ["cafe", "park", "garden"]
+    lon, lat = graph.node_coords[path.nodes[0]].tolist()
+    summary: RouteSummary = summarize_geojson(
+        graph.route_geojson(path), graph.landmarks_geojson(path, types), graph.edge_lengths(path), Location(lat, lon)
+    )
+    expected: RouteSummary = summarize_path(graph, path, types)
+    assert (summary.length_m, summary.start, summary.end) == (expected.length_m, expected.start, expected.end)
+    assert summary.landmarks == expected.landmarks
+    assert summary.shares is None and summary.streets == []
+
+
+def test_summarize_empty_geojson():
+    summary: RouteSummary = summarize_geojson('{"type": "MultiLineString", "coordinates": []}', None, [], None)
+    assert summary.length_m == 0 and summary.landmarks == []
+
+
+def test_unnamed_landmarks_near_the_route_follow_the_far_named_ones():
+    names: list[str | None] = ["far", None, "near", None]
+    nearest: np.ndarray = np.array([LANDMARK_RADIUS + 1, 5.0, 10.0, LANDMARK_RADIUS + 2])
+    landmarks: list[dict] = _top_landmarks(
+        names, ["park"] * 4, np.zeros((4, 2)), nearest, np.array([0.0, 30.0, 20.0, 10.0])
+    )
+    assert [(landmark["name"], landmark["distance_m"]) for landmark in landmarks] == [("near", 20), (None, 30)]
@@ -0,0 +1,46 @@
+import json
+from typing import Any, Iterator
+
+import pytest
+
+import main
+import models
+from server.get_routes import get_route_cache
+from server.route_graph import RouteGraph, set_route_graph
+from tests.stub_model import StubModel
+from tests.synthetic_graph import grid_graph
+
+
+@pytest.fixture
+def graph() -> Iterator[RouteGraph]:
+    graph: RouteGraph = grid_graph(6, num_landmarks=20)
+    set_route_graph(graph)
+    previous_model: Any = models.get_model()
+    models.set_model(StubModel())
+    get_route_cache().clear()
+    yield graph
+    models.set_model(previous_model)
+    set_route_graph(None)
+    get_route_cache().clear()
+
+
+def _search(graph: RouteGraph, start: int, end: int) -> Any:
+    start_lon, start_lat = graph.node_coords[start].tolist()
+    end_lon, end_lat = graph.node_coords[end].tolist()
+    return main.app.test_client().get(
+        "/search", query_string={"q": "緑の多い道", "s": f"{start_lat},{start_lon}", "e": f"{end_lat},{end_lon}"}
+    )
+
+
+def test_search_between_the_same_ends_returns_an_empty_route(graph: RouteGraph):
+    response: Any = _search(graph, 7, 7)
+    assert response.status_code == 200
+    route: dict[str, Any] = json.loads(response.data)["routes"][0]
+    assert route["distance_in_meter"] == 0 and route["edge_distances_in_meter"] == []
+
+
+def test_search_without_a_route_is_not_found(graph: RouteGraph, monkeypatch):
+    monkeypatch.setattr(graph, "shortest_path", lambda source, target, edge_costs: None)
+    response: Any = _search(graph, 0, graph.num_nodes - 1)
+    assert response.status_code == 404
+    assert json.loads(response.data) == {"error": "No route found."}
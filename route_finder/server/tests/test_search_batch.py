@@ -0,0 +1,99 @@
+import copy
+import json
+from typing import Any, Callable, Iterator
+
+import pytest
+
+import main
+from server import get_routes
+from server.calculate_weights import default_weights
+from server.contraction import ContractionHierarchy
+from server.route_graph import RouteGraph, set_route_graph
+from tests.synthetic_graph import grid_graph
+
+
+def _body(**overrides: Any) -> dict[str, Any]:
+    body: dict[str, Any] = {
+        "pairs": [{"s": "35.7517,139.64131", "e": "35.7527,139.64231"}],
+        "weights": default_weights(),
+        "landmarks": ["park"],
+    }
+    body.update(overrides)
+    return body
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        {"weights": default_weights()},
+        _body(pairs=[{"s": "north", "e": "35.7527,139.64231"}]),
+        _body(weights={**default_weights(), "weight_length": "a"}),
+        _body(weights={**default_weights(), "weight_length": float("nan")}),
+        _body(weights={**default_weights(), "weight_length": -1}),
+        _body(weights={**default_weights(), "weight_length": True}),
+        _body(weights={"weight_length": 1.0}),
+        _body(landmarks="park"),
+        _body(landmarks=["park", 1]),
+        _body(weights=None, q=["green"]),
+    ],
+)
+def test_invalid_batch_is_rejected_before_streaming(body: dict[str, Any]):
+    response: Any = main.app.test_client().post("/search/batch", json=body)
+    assert response.status_code == 400
+
+
+def _batch(graph: RouteGraph) -> list[dict[str, Any]]:
+    # From the south-west corner to the diagonal neighbor of the north-east corner.
+    start_lon, start_lat = graph.node_coords[0].tolist()
+    end_lon, end_lat = graph.node_coords[graph.num_nodes - 2].tolist()
+    response: Any = main.app.test_client().post("/search/batch", json=_body(
+        pairs=[{"s": f"{start_lat},{start_lon}", "e": f"{end_lat},{end_lon}"}] * 2,
+    ))
+    assert response.status_code == 200
+    return [json.loads(line) for line in response.data.decode().splitlines()]
+
+
+@pytest.fixture
+def batch_graph() -> Iterator[Callable[[RouteGraph], None]]:
+    yield set_route_graph
+    set_route_graph(None)
+    if get_routes._batch_executor is not None:
+        get_routes._batch_executor.shutdown()
+        get_routes._batch_executor = None
+        get_routes._batch_executor_graph = None
+
+
+def test_batch_routes_follow_a_replaced_graph(batch_graph: Callable[[RouteGraph], None]):
+    for size in (15, 10):
+        graph: RouteGraph = grid_graph(size, num_landmarks=50)
+        batch_graph(graph)
+        events: list[dict[str, Any]] = _batch(graph)
+
+        assert events[0]["event"] == "weights"
+        routes: list[dict[str, Any]] = [event["data"] for event in events[1:]]
+        assert [event["event"] for event in events[1:]] == ["route", "route"]
+        assert sorted(route["index"] for route in routes) == [0, 1]
+        # Both routes cross the whole grid of this size, not of the previous graph.
+        expected: float = (size - 1) * 2 - 1
+        for route in routes:
+            assert len(route["edge_distances_in_meter"]) == expected
+
+
+def test_batch_with_hierarchy_matches_dijkstra(batch_graph: Callable[[RouteGraph], None], monkeypatch):
+    graph: RouteGraph = grid_graph(12, num_landmarks=50)
+    batch_graph(graph)
+    expected: list[dict[str, Any]] = _batch(graph)
+
+    graph.hierarchy = ContractionHierarchy.build(
+        graph.num_nodes, graph.edge_source, graph.edge_target, graph.node_coords
+    )
+    monkeypatch.setattr(get_routes, "HIERARCHY_MIN_BATCH_PAIRS", 1)
+    # A new graph object, so that the workers receive the hierarchy.
+    batch_graph(copy.copy(graph))
+    events: list[dict[str, Any]] = _batch(graph)
+
+    def distances(batch: list[dict[str, Any]]) -> list[float]:
+        return sorted(event["data"]["distance_in_meter"] for event in batch[1:])
+
+    assert [event["event"] for event in events[1:]] == ["route", "route"]
+    assert distances(events) == distances(expected)
@@ -0,0 +1,52 @@
+import pytest
+
+from constants import WEIGHT_ESTIMATE_MIN_CONFIDENCE, WEIGHT_LANDMARKS
+from server import calculate_weights
+from server.weight_estimator import WeightEstimate, estimate_weights
+from tests.stub_model import StubModel
+
+
+@pytest.mark.parametrize("preference", ["品川の街を歩きたい", "海外っぽい雰囲気", "夏祭りの雰囲気", "green tea and a hot dog"])
+def test_place_names_are_not_keywords(preference: str):
+    assert estimate_weights(preference).confidence == 0.0
+
+
+@pytest.mark.parametrize("preference", ["the park was not green, hurry", "緑じゃない道", "no hills please"])
+def test_negations_are_left_to_the_model(preference: str):
+    estimate: WeightEstimate = estimate_weights(preference)
+    assert estimate.confidence == 0.0
+    assert estimate.weights == estimate_weights("").weights
+
+
+@pytest.mark.parametrize("preference", [
+    "緑の多い道", "最短で", "静かな道", "川沿いを歩きたい", "shortest route please",
+    "静かな公園", "a quiet walk by the river", "木陰の多い涼しい道",
+])
+def test_clear_preferences_are_confident(preference: str):
+    assert estimate_weights(preference).confidence >= WEIGHT_ESTIMATE_MIN_CONFIDENCE
+
+
+def test_calc_weights_does_not_ask_the_model_for_a_clear_preference(monkeypatch: pytest.MonkeyPatch):
+    models: list[StubModel] = []
+    monkeypatch.setattr(calculate_weights, "get_model", lambda: models.append(StubModel()) or models[-1])
+    weights: dict[str, float] = calculate_weights.calc_weights("緑の多い道")
+    assert models == []
+    assert max(weights, key=weights.get) == "weight_green_index"
+
+
+def test_ascii_keywords_match_whole_words():
+    # "parking" is not "park", nor "cooler" "cool".
+    assert estimate_weights("parking near the cooler").confidence == 0.0
+
+
+def test_weights_keep_the_length_of_the_route():
+    estimate: WeightEstimate = estimate_weights("木陰の多い涼しい道")
+    assert sum(estimate.weights.values()) == pytest.approx(1 - WEIGHT_LANDMARKS)
+    assert max(estimate.weights, key=estimate.weights.get) == "weight_shade_index"
+    assert estimate.weights["weight_length"] > 0.1 * (1 - WEIGHT_LANDMARKS)
+
+
+def test_weights_without_keywords_favor_the_length():
+    weights: dict[str, float] = estimate_weights("品川の街を歩きたい").weights
+    assert max(weights, key=weights.get) == "weight_length"
+    assert min(weights.values()) > 0